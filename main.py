@@ -3,14 +3,15 @@ import asyncio
 import yaml
 from pathlib import Path
 from src.brain.llm import Brain
-from src.data.vector_store import VectorStore
-from src.web.app import WebUI
+from src.data.warmup import BackgroundVectorStore
 from src.supervisor import Supervisor
+from src import telemetry
+from src.log_config import setup_logging
 from dotenv import load_dotenv
 import warnings
 import logging
 from loguru import logger
-import sys
+from typing import Dict, Any
 
 # 设置 HuggingFace 镜像
 os.environ['HF_ENDPOINT'] = 'https://hf-mirror.com'
@@ -19,20 +20,6 @@ os.environ['HF_ENDPOINT'] = 'https://hf-mirror.com'
 warnings.filterwarnings("ignore", category=FutureWarning)
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
-# 配置日志
-logger.remove()  # 移除默认的处理器
-logger.add(
-    sys.stderr,
-    format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-    level="DEBUG"
-)
-logger.add(
-    "logs/ai_scientist.log",  # 添加文件日志
-    rotation="500 MB",  # 日志文件大小超过500MB时轮转
-    retention="10 days",  # 保留10天的日志
-    level="DEBUG"
-)
-
 def load_config():
     config_path = Path("config/config.yaml")
     with open(config_path) as f:
@@ -66,29 +53,80 @@ def setup_environment():
     
     logger.info("已成功加载 API 配置")
 
+def readiness(memory) -> Dict[str, Any]:
+    """就绪状态：向量库完成预热后才算就绪"""
+    if hasattr(memory, 'readiness'):
+        return memory.readiness()
+    return {"status": "ready", "ready": True}
+
+async def serve(app, memory, app_config: Dict[str, Any], metrics_enabled: bool = True):
+    """在当前事件循环中启动Gradio，并提供存活/就绪探针和指标
+    
+    /healthz 进程存活即返回200；/readyz 在向量库预热完成前返回503；
+    /metrics 以 Prometheus 文本格式导出运行指标。
+    """
+    import gradio as gr
+    import uvicorn
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse, Response
+    from src.telemetry import registry
+    
+    server = FastAPI()
+    
+    if metrics_enabled:
+        @server.get("/metrics")
+        async def metrics():
+            return Response(registry.render(), media_type=registry.CONTENT_TYPE)
+    
+    @server.get("/healthz")
+    async def healthz():
+        return {"status": "ok"}
+    
+    @server.get("/readyz")
+    async def readyz():
+        state = readiness(memory)
+        return JSONResponse(state, status_code=200 if state["ready"] else 503)
+    
+    app.queue()
+    server = gr.mount_gradio_app(server, app, path="/")
+    uvicorn_config = uvicorn.Config(
+        server,
+        host=app_config.get('host', 'localhost'),
+        port=app_config.get('port', 7860),
+        log_level="warning"
+    )
+    await uvicorn.Server(uvicorn_config).serve()
+
 async def main():
     try:
-        # 1. 设置环境
-        setup_environment()
-        
-        # 2. 加载配置
+        # 1. 加载配置并设置日志（后台线程写出，见 config.yaml 的 logging 部分）
         config = load_config()
+        setup_logging(config)
         logger.info("已加载配置文件")
         
-        # 3. 初始化组件
+        # 2. 设置环境
+        setup_environment()
+        telemetry.configure(config)
+        
+        # 3. 初始化组件（向量库在后台线程加载，不阻塞界面启动）
         brain = Brain(config['llm'])
-        memory = VectorStore(config['vector_store'])
+        if config['vector_store'].get('background_loading', True):
+            memory = BackgroundVectorStore(config['vector_store']).start()
+        else:
+            from src.data.vector_store import VectorStore
+            memory = VectorStore(config['vector_store'])
         logger.info("已初始化核心组件")
         
         # 4. 初始化 Supervisor
         supervisor = Supervisor(config, brain, memory)
         logger.info("已初始化 Supervisor")
         
-        # 5. 启动 Web 界面
+        # 5. 启动 Web 界面（gradio只在启动界面时导入，命令行入口见 src/cli.py）
+        from src.web.app import WebUI
         ui = WebUI(supervisor)
         app = ui.build()
         logger.info("正在启动 Web 界面...")
-        app.launch(server_name="localhost", server_port=7860)
+        await serve(app, memory, config.get('app', {}), (config.get('telemetry') or {}).get('metrics', True))
         
     except Exception as e:
         logger.error(f"程序启动失败: {str(e)}")
@@ -0,0 +1,327 @@
+"""智能体调用的运行指标
+
+每次调用记录成功/失败、总耗时、首个片段耗时（TTFT）、token数和排队等待时间，
+按智能体和按任务类型分别累计到滚动窗口的直方图中。直方图采用 HDR 式的对数-线性
+分桶：桶号由数值的二进制位长和高位直接算出，记录一次是 O(1)，相对误差约 3%。
+"""
+from typing import Dict, Any, List, Optional, AsyncGenerator
+import time
+import contextvars
+from .telemetry import tracer, AGENT_CALLS
+
+# 当前任务在任务队列中的等待秒数，由 Supervisor 的 worker 在领取任务后设置，
+# 任务中的第一次智能体调用记录后清零
+queue_wait_scope: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("queue_wait_scope", default=None)
+
+# 每个 2 的幂区间分成 2^(SUB_BITS-1) 个线性子桶
+SUB_BITS = 6
+_SUB_COUNT = 1 << SUB_BITS
+_HALF = _SUB_COUNT >> 1
+
+
+def _bucket(value: int) -> int:
+    """非负整数所在的桶号"""
+    if value < _SUB_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BITS
+    return shift * _HALF + (value >> shift)
+
+
+def _bucket_value(bucket: int) -> float:
+    """桶的代表值（区间中点）"""
+    if bucket < _SUB_COUNT:
+        return float(bucket)
+    shift = bucket // _HALF - 1
+    mantissa = bucket - shift * _HALF
+    return ((mantissa << shift) + (((mantissa + 1) << shift) - 1)) / 2
+
+
+class _Slot:
+    __slots__ = ("epoch", "counts", "count", "total", "max")
+
+    def __init__(self):
+        self.epoch = -1
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+class RollingHistogram:
+    """最近 window 秒内数值的分布
+
+    窗口分成 slots 个时间片，记录时只写当前时间片，过期的时间片在再次被写入时整体重置；
+    查询时合并窗口内的时间片。数值按 unit 换算为整数后分桶（默认毫秒精度的秒数）。
+    """
+
+    def __init__(self, window: float = 300, slots: int = 10, unit: float = 1e-3):
+        self.window = window
+        self.slot_seconds = window / slots
+        self.unit = unit
+        self._slots = [_Slot() for _ in range(slots)]
+
+    def _current(self, now: float) -> _Slot:
+        epoch = int(now // self.slot_seconds)
+        slot = self._slots[epoch % len(self._slots)]
+        if slot.epoch != epoch:
+            slot.epoch = epoch
+            slot.counts = {}
+            slot.count = 0
+            slot.total = 0.0
+            slot.max = 0.0
+        return slot
+
+    def record(self, value: float, now: Optional[float] = None):
+        slot = self._current(time.time() if now is None else now)
+        bucket = _bucket(max(0, int(value / self.unit)))
+        slot.counts[bucket] = slot.counts.get(bucket, 0) + 1
+        slot.count += 1
+        slot.total += value
+        if value > slot.max:
+            slot.max = value
+
+    def _live(self, now: float) -> List[_Slot]:
+        epoch = int(now // self.slot_seconds)
+        return [slot for slot in self._slots if epoch - len(self._slots) < slot.epoch <= epoch]
+
+    def count(self, now: Optional[float] = None) -> int:
+        return sum(slot.count for slot in self._live(time.time() if now is None else now))
+
+    def total(self, now: Optional[float] = None) -> float:
+        return sum(slot.total for slot in self._live(time.time() if now is None else now))
+
+    def percentiles(self, quantiles=(50, 95, 99), now: Optional[float] = None) -> Dict[str, Any]:
+        """窗口内的分位数、均值和最大值；没有数据时为None"""
+        slots = self._live(time.time() if now is None else now)
+        merged: Dict[int, int] = {}
+        for slot in slots:
+            for bucket, count in slot.counts.items():
+                merged[bucket] = merged.get(bucket, 0) + count
+        count = sum(merged.values())
+        if not count:
+            return {**{f"p{q}": None for q in quantiles}, "mean": None, "max": None, "count": 0}
+
+        result: Dict[str, Any] = {}
+        buckets = sorted(merged)
+        for q in quantiles:
+            target = max(1, -(-count * q // 100))
+            seen = 0
+            for bucket in buckets:
+                seen += merged[bucket]
+                if seen >= target:
+                    result[f"p{q}"] = round(_bucket_value(bucket) * self.unit, 4)
+                    break
+        result["mean"] = round(sum(slot.total for slot in slots) / count, 4)
+        result["max"] = round(max(slot.max for slot in slots), 4)
+        result["count"] = count
+        return result
+
+
+class _Series:
+    """一个智能体（或一种任务类型）的指标"""
+
+    def __init__(self, window: float, slots: int):
+        self.window = window
+        self.wall = RollingHistogram(window, slots)
+        self.ttft = RollingHistogram(window, slots)
+        self.queue_wait = RollingHistogram(window, slots)
+        self.failures = RollingHistogram(window, slots)
+        self.tokens = RollingHistogram(window, slots, unit=1)
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.last_finished: Optional[float] = None
+        self.last_success: Optional[bool] = None
+        self.last_error: Optional[str] = None
+
+    def record(self, ok: bool, wall: float, ttft: Optional[float], tokens: int, queue_wait: Optional[float],
+               error: Optional[str], now: float):
+        self.calls += 1
+        self.wall.record(wall, now)
+        if ttft is not None:
+            self.ttft.record(ttft, now)
+        if queue_wait is not None:
+            self.queue_wait.record(queue_wait, now)
+        if tokens:
+            self.tokens.record(tokens, now)
+        if not ok:
+            self.errors += 1
+            self.failures.record(1, now)
+            self.last_error = error
+        self.last_success = ok
+        self.last_finished = now
+
+    def summary(self, started: float, now: float) -> Dict[str, Any]:
+        calls = self.wall.count(now)
+        failures = self.failures.count(now)
+        # 窗口内的忙碌时间占比；并发调用时可能大于1（即平均同时进行的调用数）
+        span = min(self.window, max(now - started, 1e-9))
+        busy = self.wall.total(now)
+        tokens = self.tokens.total(now)
+        return {
+            "calls": calls,
+            "success_rate": round((calls - failures) / calls, 4) if calls else None,
+            "latency_s": self.wall.percentiles(now=now),
+            "ttft_s": self.ttft.percentiles(now=now),
+            "queue_wait_s": self.queue_wait.percentiles(now=now),
+            "tokens": int(tokens),
+            "tokens_per_s": round(tokens / busy, 2) if busy else None,
+            "utilization": round(busy / span, 4),
+            "in_flight": self.in_flight,
+            "total_calls": self.calls,
+            "total_errors": self.errors,
+        }
+
+
+class _ScopedUsage(dict):
+    """一次调用的token用量；累加时同时计入外层用量（如批量运行器按会话设置的）"""
+
+    def __init__(self, parent: Optional[Dict[str, int]]):
+        super().__init__()
+        self.parent = parent
+
+    def __setitem__(self, key: str, value: int):
+        if self.parent is not None:
+            self.parent[key] = self.parent.get(key, 0) + value - self.get(key, 0)
+        super().__setitem__(key, value)
+
+
+class AgentMetrics:
+    """所有智能体调用的指标，按智能体名和任务类型分别统计
+
+    Args:
+        window: 滚动窗口秒数
+        slots: 窗口的时间片数
+    """
+
+    def __init__(self, window: float = 300, slots: int = 10):
+        self.window = window
+        self.slots = slots
+        self.started = time.time()
+        self.agents: Dict[str, _Series] = {}
+        self.task_types: Dict[str, _Series] = {}
+
+    def _series(self, table: Dict[str, _Series], key: str) -> _Series:
+        series = table.get(key)
+        if series is None:
+            series = table[key] = _Series(self.window, self.slots)
+        return series
+
+    def record(self, agent: str, task_type: str, ok: bool, wall: float, ttft: Optional[float] = None,
+               tokens: int = 0, queue_wait: Optional[float] = None, error: Optional[str] = None):
+        """记录一次已完成的调用"""
+        now = time.time()
+        for series in (self._series(self.agents, agent), self._series(self.task_types, task_type)):
+            series.record(ok, wall, ttft, tokens, queue_wait, error, now)
+
+    async def stream(self, agent, input_data: Dict[str, Any], task_type: str,
+                     queue_wait: Optional[float] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """调用智能体并记录指标，原样产出其更新
+
+        流式智能体（process 为异步生成器）逐条产出，普通智能体产出唯一的结果。
+        最后一条更新的 status 为 success 时记为成功。未指定排队时间时取
+        queue_wait_scope（取一次后清零）。token数取调用期间 Brain 记录的
+        completion_tokens，模型未返回用量时按流式片段数近似。
+        """
+        from .brain.llm import usage_scope
+
+        if queue_wait is None:
+            queue_wait = queue_wait_scope.get()
+            if queue_wait is not None:
+                queue_wait_scope.set(None)
+        name = getattr(agent, "name", type(agent).__name__)
+        agents = self._series(self.agents, name)
+        task_types = self._series(self.task_types, task_type)
+        agents.in_flight += 1
+        task_types.in_flight += 1
+
+        usage = _ScopedUsage(usage_scope.get())
+        token = usage_scope.set(usage)
+        span = tracer.start(f"{type(agent).__name__}.process", agent=name, task_type=task_type)
+        start = time.perf_counter()
+        ttft = None
+        chunks = 0
+        last: Dict[str, Any] = {}
+        error = None
+        failure = None
+        try:
+            output = agent.process(input_data)
+            if hasattr(output, "__aiter__"):
+                async for update in output:
+                    if update.get("status") == "generating":
+                        if ttft is None:
+                            ttft = time.perf_counter() - start
+                        chunks += 1
+                    last = update
+                    yield update
+            else:
+                last = await output
+                yield last
+        except GeneratorExit:
+            # 调用方拿到结果后提前结束迭代，按最后一条更新判断成败
+            raise
+        except BaseException as e:
+            error = str(e) or type(e).__name__
+            failure = e if isinstance(e, Exception) else None
+            raise
+        finally:
+            ok = error is None and last.get("status") == "success"
+            if not ok and error is None:
+                error = last.get("message")
+            try:
+                usage_scope.reset(token)
+            except ValueError:
+                # 生成器在其他上下文中被关闭
+                pass
+            agents.in_flight -= 1
+            task_types.in_flight -= 1
+            wall = time.perf_counter() - start
+            tokens = usage.get("completion_tokens") or chunks
+            self.record(name, task_type, ok, wall, ttft, tokens, queue_wait, error)
+            AGENT_CALLS.labels(name, task_type, "success" if ok else "error").observe(wall)
+            span.set(success=ok, tokens=tokens)
+            tracer.finish(span, failure)
+
+    def status(self, agent: str) -> Dict[str, Any]:
+        """智能体的当前状态：busy（有进行中的调用）、failing（最近一次失败）、idle 或 unused"""
+        series = self.agents.get(agent)
+        if series is None or not series.calls and not series.in_flight:
+            return {"state": "unused", "in_flight": 0, "last_task_success": None}
+        if series.in_flight:
+            state = "busy"
+        elif series.last_success is False:
+            state = "failing"
+        else:
+            state = "idle"
+        return {
+            "state": state,
+            "in_flight": series.in_flight,
+            "last_task_success": series.last_success,
+            "last_error": series.last_error,
+            "idle_s": round(time.time() - series.last_finished, 1) if series.last_finished and not series.in_flight else None,
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """滚动窗口内各智能体和各任务类型的指标"""
+        now = time.time()
+        return {
+            "window_s": self.window,
+            "agents": {name: series.summary(self.started, now) for name, series in self.agents.items()},
+            "task_types": {name: series.summary(self.started, now) for name, series in self.task_types.items()},
+        }
+
+    def overall(self) -> Dict[str, Any]:
+        """所有智能体合计的成功率、平均耗时和利用率"""
+        now = time.time()
+        calls = failures = 0
+        busy = 0.0
+        for series in self.agents.values():
+            calls += series.wall.count(now)
+            failures += series.failures.count(now)
+            busy += series.wall.total(now)
+        span = min(self.window, max(now - self.started, 1e-9))
+        return {
+            "task_success_rate": round((calls - failures) / calls, 4) if calls else None,
+            "average_response_time": round(busy / calls, 4) if calls else None,
+            "agent_utilization": round(busy / span / len(self.agents), 4) if self.agents else 0.0,
+        }
@@ -2,9 +2,16 @@ from abc import ABC, abstractmethod
 from typing import Any, Dict
 
 class BaseAgent(ABC):
+    # 智能体能处理的任务类型（TaskType），SupervisorAgent 据此分配子任务
+    task_types = []
+
     def __init__(self, brain, memory):
         self.brain = brain
         self.memory = memory
+
+    def can_handle(self, task_type) -> bool:
+        """是否能处理该类型的任务"""
+        return task_type in self.task_types
         
     @abstractmethod
     async def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
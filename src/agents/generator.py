@@ -1,33 +1,28 @@
-from typing import Dict, Any, List, AsyncGenerator
+from typing import Dict, Any, List, AsyncGenerator, Optional
 from .base import BaseAgent
 from .types import TaskType, Message
 from datetime import datetime
 from loguru import logger
 
 class GeneratorAgent(BaseAgent):
+    # 提示模板版本，修改 _build_hypothesis_prompt 后递增，使阶段缓存失效
+    PROMPT_VERSION = "1"
+
     def __init__(self, brain, memory):
         super().__init__(brain, memory)
         self.name = "generator"
         self.task_types = [TaskType.GENERATE_HYPOTHESIS]
-        self.should_stop = False
-        self.current_text = []
         
     async def process(self, input_data: Dict[str, Any]) -> AsyncGenerator[Dict[str, Any], None]:
-        """生成研究假设，支持流式输出和停止功能"""
+        """生成研究假设，支持流式输出
+        
+        智能体被多个会话并发调用，不保存单次调用的状态；停止生成由调用方取消执行该会话的任务实现
+        """
         max_retries = 3
         retry_count = 0
         
-        # 重置状态
-        self.should_stop = False
-        self.current_text = []
-        
         while retry_count < max_retries:
             try:
-                # 检查是否应该停止
-                if self.should_stop:
-                    yield {"status": "stopped", "message": "生成已停止"}
-                    return
-                    
                 # 验证输入数据
                 if not input_data.get("content", {}).get("question"):
                     raise ValueError("缺少研究问题")
@@ -40,11 +35,6 @@ class GeneratorAgent(BaseAgent):
                 
                 # 调用LLM生成假设
                 async for chunk in self.brain.think(prompt, TaskType.GENERATE_HYPOTHESIS):
-                    # 检查是否应该停止
-                    if self.should_stop:
-                        yield {"status": "stopped", "message": "生成已停止"}
-                        return
-                        
                     # 更新完整响应
                     full_response += chunk
                     
@@ -54,28 +44,12 @@ class GeneratorAgent(BaseAgent):
                         "chunk": chunk
                     }
                 
-                # 检查是否应该停止
-                if self.should_stop:
-                    yield {"status": "stopped", "message": "生成已停止"}
-                    return
-                    
                 # 解析假设
                 try:
-                    # 检查是否应该停止
-                    if self.should_stop:
-                        yield {"status": "stopped", "message": "生成已停止"}
-                        return
-                        
                     hypotheses = self._parse_hypotheses(full_response)
                     
-                    # 检查是否应该停止
-                    if self.should_stop:
-                        yield {"status": "stopped", "message": "生成已停止"}
-                        return
-                        
                     # 存储假设
-                    if not self.should_stop:
-                        await self._store_hypotheses(hypotheses)
+                    await self._store_hypotheses(hypotheses, input_data.get("session_id"))
                     
                     # 返回成功结果 - 移除评估部分
                     yield {
@@ -151,21 +125,11 @@ class GeneratorAgent(BaseAgent):
     
     def _parse_hypotheses(self, response: str) -> List[Dict[str, Any]]:
         """解析生成的假设文本"""
-        # 检查是否应该停止
-        if self.should_stop:
-            logger.info("解析假设被停止")
-            return []
-            
         logger.info("开始解析假设...")
         
         # 提取内容部分
         content = self._extract_content(response)
         
-        # 检查是否应该停止
-        if self.should_stop:
-            logger.info("解析假设被停止")
-            return []
-        
         # 初始化结果列表
         hypotheses = []
         
@@ -176,11 +140,6 @@ class GeneratorAgent(BaseAgent):
             
             # 跳过第一个元素（通常是空的或者是介绍性文本）
             for i, block in enumerate(hypothesis_blocks[1:], 1):
-                # 检查是否应该停止
-                if self.should_stop:
-                    logger.info("解析假设被停止")
-                    return hypotheses
-                    
                 # 清理文本
                 block = block.strip()
                 if not block:
@@ -218,11 +177,6 @@ class GeneratorAgent(BaseAgent):
                     if not part:
                         continue
                         
-                    # 检查是否应该停止
-                    if self.should_stop:
-                        logger.info("解析假设被停止")
-                        return hypotheses
-                        
                     # 检查是否是新的部分
                     if part.startswith("理论依据：") or part.startswith("理论依据:"):
                         current_key = "theoretical_basis"
@@ -240,15 +194,11 @@ class GeneratorAgent(BaseAgent):
                 # 添加到结果列表
                 hypotheses.append(hypothesis)
             
-            logger.info(f"解析完成，共找到 {len(hypotheses)} 个假设")
+            logger.info("解析完成，共找到 {} 个假设", len(hypotheses))
             
-            # 打印假设内容以便调试
+            # 打印假设内容以便调试（参数只在DEBUG级别启用时才格式化）
             for h in hypotheses:
-                logger.debug(f"假设 {h['id']}:")
-                logger.debug(f"  描述: {h['content']['description']}")
-                logger.debug(f"  理论依据: {h['content']['theoretical_basis']}")
-                logger.debug(f"  验证方法: {h['content']['verification_method']}")
-                logger.debug(f"  影响因素: {h['content']['influencing_factors']}")
+                logger.debug("假设 {id}: {content}", id=h["id"], content=h["content"])
             
             return hypotheses
             
@@ -276,13 +226,8 @@ class GeneratorAgent(BaseAgent):
             
         return "\n".join(cleaned_lines)
     
-    async def _store_hypotheses(self, hypotheses: List[Dict[str, Any]]):
-        """存储生成的假设到向量数据库"""
-        # 检查是否应该停止
-        if self.should_stop:
-            logger.info("存储假设被停止")
-            return
-            
+    async def _store_hypotheses(self, hypotheses: List[Dict[str, Any]], session_id: Optional[str] = None):
+        """存储生成的假设到向量数据库（有会话ID时写入该会话的分区）"""
         # 检查假设是否为空
         if not hypotheses:
             logger.warning("没有假设可存储")
@@ -294,11 +239,6 @@ class GeneratorAgent(BaseAgent):
             metadatas = []
             
             for h in hypotheses:
-                # 检查是否应该停止
-                if self.should_stop:
-                    logger.info("存储假设被停止")
-                    return
-                    
                 # 构建文本和元数据
                 text = f"假设: {h['content'].get('description', '')}\n"
                 text += f"理论依据: {h['content'].get('theoretical_basis', '')}\n"
@@ -314,23 +254,21 @@ class GeneratorAgent(BaseAgent):
                 texts.append(text)
                 metadatas.append(metadata)
             
-            # 检查是否应该停止
-            if self.should_stop:
-                logger.info("存储假设被停止")
-                return
-                
             # 存储到向量数据库
-            await self.memory.store_embeddings(texts, metadatas)
+            await self.memory.store_embeddings(texts, metadatas, partition=session_id)
             
         except Exception as e:
             logger.error(f"存储假设时出错: {str(e)}")
             # 不抛出异常，让流程继续
     
-    async def _get_recent_hypotheses(self) -> List[Dict[str, Any]]:
-        """获取最近生成的假设"""
+    async def _get_recent_hypotheses(self, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """获取最近生成的假设（指定会话时只读该会话的分区，否则合并所有分区）"""
         try:
-            # 从向量数据库查询
-            results = await self.memory.search("type:hypothesis", limit=10)
+            # 按元数据索引读取最近的假设，不做语义检索
+            if session_id:
+                results = await self.memory.list_recent(doc_type="hypothesis", limit=10, partition=session_id)
+            else:
+                results = await self.memory.list_recent(doc_type="hypothesis", limit=10, partitions="*")
             
             # 处理结果
             hypotheses = []
@@ -368,30 +306,15 @@ class GeneratorAgent(BaseAgent):
             logger.error(f"获取假设失败: {str(e)}")
             return []  # 返回空列表而不是抛出异常，使流程更健壮
     
-    def stop_generation(self):
-        """停止当前生成过程"""
-        logger.info("Generator: 停止生成过程")
-        self.should_stop = True
-        
-        # 如果brain有stop_generation方法，调用它
-        if hasattr(self.brain, 'stop_generation'):
-            self.brain.stop_generation()
-    
-    def reset_state(self):
-        """重置状态，准备新的生成过程"""
-        logger.info("Generator: 重置状态")
-        self.should_stop = False
-        self.current_text = []
-        
-        # 如果brain有reset_state方法，调用它
-        if hasattr(self.brain, 'reset_state'):
-            self.brain.reset_state()
+    async def reflect(self, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """反思当前状态和生成的假设
 
-    async def reflect(self) -> Dict[str, Any]:
-        """反思当前状态和生成的假设"""
+        Args:
+            session_id: 只看该会话的假设，默认合并所有会话
+        """
         try:
             # 获取最近生成的假设
-            hypotheses = await self._get_recent_hypotheses()
+            hypotheses = await self._get_recent_hypotheses(session_id)
             
             # 如果没有假设，返回空结果
             if not hypotheses:
@@ -1,54 +1,103 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, AsyncGenerator
+import re
+import json
+import time
+import asyncio
+from loguru import logger
 from .base import BaseAgent
+from .types import TaskType
+from ..agent_metrics import AgentMetrics
+
+
+class Subtask:
+    """分解得到的子任务"""
+
+    __slots__ = ("id", "type", "goal", "depends_on")
+
+    def __init__(self, id: str, type: TaskType, goal: str, depends_on: Optional[List[str]] = None):
+        self.id = id
+        self.type = type
+        self.goal = goal
+        self.depends_on = depends_on or []
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "type": self.type.value, "goal": self.goal, "depends_on": self.depends_on}
+
 
 class SupervisorAgent(BaseAgent):
-    def __init__(self, brain, memory, agents: List[BaseAgent] = None):
+    def __init__(self, brain, memory, agents: List[BaseAgent] = None, max_concurrency: int = 3, max_subtasks: int = 6,
+                 metrics: Optional[AgentMetrics] = None):
         """初始化 Supervisor 智能体
-        
+
         Args:
             brain: LLM 接口
             memory: 向量存储接口
-            agents: 其他智能体列表
+            agents: 其他智能体列表，按各自的 task_types 注册能力
+            max_concurrency: 同时执行的子任务数上限
+            max_subtasks: 单个任务最多分解出的子任务数
+            metrics: 智能体调用指标，与其他调用方共享时传入
         """
         super().__init__(brain, memory)
-        self.agents = agents or []
         self.name = "supervisor"
-        
-    async def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
-        """处理输入数据
-        
+        self.task_types: List[TaskType] = []
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_subtasks = max_subtasks
+        self.agents: List[BaseAgent] = []
+        self.capabilities: Dict[TaskType, BaseAgent] = {}
+        self.metrics = metrics or AgentMetrics()
+        for agent in agents or []:
+            self.register(agent)
+
+    def register(self, agent: BaseAgent):
+        """注册智能体，按其 task_types 声明能力；同一任务类型以先注册的为准"""
+        self.agents.append(agent)
+        for task_type in getattr(agent, "task_types", []):
+            self.capabilities.setdefault(task_type, agent)
+        logger.info(f"注册智能体 {agent.name}: {[task_type.value for task_type in getattr(agent, 'task_types', [])]}")
+
+    async def process(self, input_data: Dict[str, Any]) -> AsyncGenerator[Dict[str, Any], None]:
+        """处理输入数据：分解为子任务，按依赖并发执行，最后整合
+
         Args:
             input_data: 输入数据字典
-            
-        Returns:
-            Dict: 处理结果
+
+        Yields:
+            Dict: decomposed（子任务列表）、generating（子任务或整合的流式片段）、
+                  partial（单个子任务完成），最后是 success / error
         """
         try:
             # 1. 任务分解
             subtasks = await self._decompose_task(input_data)
-            
-            # 2. 分配并执行子任务
-            results = {}
-            for subtask in subtasks:
-                agent = self._select_agent(subtask)
-                if agent:
-                    result = await agent.process(subtask)
-                    results[agent.name] = result
-                    
+            yield {"status": "decomposed", "subtasks": [subtask.to_dict() for subtask in subtasks]}
+
+            # 2. 按依赖并发执行子任务
+            results: Dict[str, Any] = {}
+            async for update in self._run_subtasks(subtasks, input_data, results):
+                yield update
+
             # 3. 整合结果
-            final_result = await self._integrate_results(results)
-            
-            return final_result
-            
+            integrated = ""
+            async for chunk in self.brain.think(self._integration_prompt(input_data, subtasks, results)):
+                integrated += chunk
+                yield {"status": "generating", "subtask": "integration", "chunk": chunk}
+
+            yield {
+                "status": "success",
+                "integrated_result": integrated,
+                "subtasks": [subtask.to_dict() for subtask in subtasks],
+                "sub_results": results
+            }
+
         except Exception as e:
-            return {
+            logger.error(f"Supervisor智能体处理失败: {str(e)}")
+            yield {
                 "status": "error",
                 "message": f"处理失败: {str(e)}"
             }
-    
+
     async def reflect(self) -> Dict[str, Any]:
         """反思处理结果
-        
+
         Returns:
             Dict: 反思结果
         """
@@ -56,6 +105,7 @@ class SupervisorAgent(BaseAgent):
             reflection = {
                 "agent_status": self._check_agents_status(),
                 "performance_metrics": self._calculate_performance_metrics(),
+                "metrics": self.metrics.snapshot(),
                 "improvement_suggestions": await self._generate_improvements()
             }
             return reflection
@@ -64,104 +114,169 @@ class SupervisorAgent(BaseAgent):
                 "status": "error",
                 "message": f"反思失败: {str(e)}"
             }
-    
-    async def _decompose_task(self, task: Dict[str, Any]) -> List[Dict[str, Any]]:
+
+    async def _decompose_task(self, task: Dict[str, Any]) -> List[Subtask]:
         """将任务分解为子任务
-        
+
         Args:
             task: 原始任务
-            
+
         Returns:
-            List[Dict]: 子任务列表
+            List[Subtask]: 子任务列表（依赖只指向列表中排在前面的子任务）
         """
+        if not self.capabilities:
+            raise Exception("任务分解失败: 没有注册任何智能体")
         try:
-            # 使用 LLM 分解任务
-            prompt = f"""
-            请将以下研究任务分解为子任务:
-            {task['content']}
-            
-            每个子任务应包含:
-            1. 任务类型
-            2. 具体目标
-            3. 所需资源
-            """
-            
-            response = await self.brain.think(prompt)
-            
+            content = task.get("content", {})
+            task_types = "\n".join(
+                f"- {task_type.value}（{agent.name}）" for task_type, agent in self.capabilities.items()
+            )
+            prompt = f"""请将以下研究任务分解为子任务。
+
+# 研究问题
+{content.get('question', '')}
+
+# 背景信息
+{content.get('background', '')}
+
+# 可用的任务类型
+{task_types}
+
+# 输出格式
+只输出JSON数组，最多 {self.max_subtasks} 个子任务，例如：
+[{{"id": "t1", "type": "<任务类型>", "goal": "具体目标", "depends_on": []}},
+ {{"id": "t2", "type": "<任务类型>", "goal": "具体目标", "depends_on": ["t1"]}}]
+没有依赖关系的子任务会并发执行。
+"""
+            response = ""
+            async for chunk in self.brain.think(prompt):
+                response += chunk
+
             # 解析响应为子任务列表
             subtasks = self._parse_subtasks(response)
-            
+            if not subtasks:
+                # 无法解析时退化为单个子任务：交给第一个注册的能力处理原问题
+                logger.warning("任务分解结果无法解析，按单个子任务执行")
+                subtasks = [Subtask("t1", next(iter(self.capabilities)), content.get("question", ""))]
+
             return subtasks
         except Exception as e:
             raise Exception(f"任务分解失败: {str(e)}")
-    
-    def _select_agent(self, subtask: Dict[str, Any]) -> BaseAgent:
+
+    def _select_agent(self, subtask: Subtask) -> Optional[BaseAgent]:
         """为子任务选择合适的智能体
-        
+
         Args:
             subtask: 子任务信息
-            
+
         Returns:
             BaseAgent: 选中的智能体
         """
-        # 根据任务类型选择智能体
-        task_type = subtask.get('type', '')
-        
+        agent = self.capabilities.get(subtask.type)
+        if agent is not None:
+            return agent
         for agent in self.agents:
-            if agent.can_handle(task_type):
+            if agent.can_handle(subtask.type):
                 return agent
-                
         return None
-    
-    async def _integrate_results(self, results: Dict[str, Any]) -> Dict[str, Any]:
-        """整合所有子任务的结果
-        
-        Args:
-            results: 子任务结果字典
-            
-        Returns:
-            Dict: 整合后的结果
-        """
+
+    def _subtask_input(self, subtask: Subtask, input_data: Dict[str, Any], results: Dict[str, Any]) -> Dict[str, Any]:
+        """构建子任务的输入：目标作为问题，依赖子任务的结果附加到背景中"""
+        content = input_data.get("content", {})
+        background = content.get("background", "")
+        for dependency in subtask.depends_on:
+            summary = json.dumps(results.get(dependency), ensure_ascii=False, default=str)[:2000]
+            background += f"\n\n# 前序子任务 {dependency} 的结果\n{summary}"
+        return {
+            "type": subtask.type.value,
+            "session_id": input_data.get("session_id"),
+            "content": {"question": subtask.goal or content.get("question", ""), "background": background}
+        }
+
+    async def _execute_subtask(self, agent: BaseAgent, subtask: Subtask, input_data: Dict[str, Any],
+                               queue: asyncio.Queue, queue_wait: float):
+        """执行单个子任务并记录指标；流式智能体（异步生成器）的片段转发到队列"""
+        result: Dict[str, Any] = {"status": "error", "message": "没有输出"}
+        async for update in self.metrics.stream(agent, input_data, subtask.type.value, queue_wait):
+            if update.get("status") == "generating":
+                await queue.put({**update, "subtask": subtask.id})
+            else:
+                result = update
+        return result
+
+    async def _run_subtasks(self, subtasks: List[Subtask], input_data: Dict[str, Any], results: Dict[str, Any]):
+        """按依赖并发执行子任务，最多 max_concurrency 个同时进行，边执行边产出更新"""
+        loop = asyncio.get_running_loop()
+        done = {subtask.id: loop.create_future() for subtask in subtasks}
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def run(subtask: Subtask):
+            try:
+                failed = [dependency for dependency in subtask.depends_on if not await done[dependency]]
+                agent = self._select_agent(subtask)
+                if failed:
+                    result = {"status": "skipped", "message": f"依赖的子任务未成功: {failed}"}
+                elif agent is None:
+                    result = {"status": "error", "message": f"没有能处理 {subtask.type.value} 的智能体"}
+                else:
+                    ready = time.perf_counter()
+                    async with semaphore:
+                        result = await self._execute_subtask(
+                            agent, subtask, self._subtask_input(subtask, input_data, results),
+                            queue, time.perf_counter() - ready
+                        )
+            except Exception as e:
+                logger.error(f"子任务 {subtask.id} 失败: {str(e)}")
+                result = {"status": "error", "message": str(e)}
+            results[subtask.id] = result
+            done[subtask.id].set_result(result.get("status") == "success")
+            await queue.put({"status": "partial", "subtask": subtask.id, "result": result})
+
+        runners = [asyncio.create_task(run(subtask)) for subtask in subtasks]
         try:
-            # 使用 LLM 整合结果
-            prompt = f"""
-            请整合以下研究子任务的结果:
-            {results}
-            
-            请提供:
-            1. 总体结论
-            2. 关键发现
-            3. 后续建议
-            """
-            
-            response = await self.brain.think(prompt)
-            
-            return {
-                "status": "success",
-                "integrated_result": response,
-                "sub_results": results
-            }
-        except Exception as e:
-            raise Exception(f"结果整合失败: {str(e)}")
-    
+            for _ in range(len(subtasks)):
+                # 每个子任务恰好产出一条 partial，之前可能有任意条 generating
+                while True:
+                    update = await queue.get()
+                    yield update
+                    if update["status"] == "partial":
+                        break
+        finally:
+            for runner in runners:
+                runner.cancel()
+
+    def _integration_prompt(self, input_data: Dict[str, Any], subtasks: List[Subtask], results: Dict[str, Any]) -> str:
+        """整合所有子任务结果的提示"""
+        sections = []
+        for subtask in subtasks:
+            result = json.dumps(results.get(subtask.id), ensure_ascii=False, default=str)[:3000]
+            sections.append(f"## {subtask.id}（{subtask.type.value}）：{subtask.goal}\n{result}")
+        return f"""请整合以下研究子任务的结果:
+
+# 研究问题
+{input_data.get('content', {}).get('question', '')}
+
+{chr(10).join(sections)}
+
+请提供:
+1. 总体结论
+2. 关键发现
+3. 后续建议
+"""
+
     def _check_agents_status(self) -> Dict[str, Any]:
-        """检查所有智能体的状态"""
+        """检查所有智能体的状态（按调用记录判断是否在处理任务、最近是否失败）"""
         status = {}
         for agent in self.agents:
-            status[agent.name] = {
-                "active": True,
-                "last_task_success": agent.last_task_success if hasattr(agent, 'last_task_success') else None
-            }
+            agent_status = self.metrics.status(agent.name)
+            status[agent.name] = {**agent_status, "active": agent_status["state"] == "busy"}
         return status
-    
+
     def _calculate_performance_metrics(self) -> Dict[str, float]:
-        """计算性能指标"""
-        return {
-            "task_success_rate": 0.0,  # 待实现
-            "average_response_time": 0.0,  # 待实现
-            "agent_utilization": 0.0  # 待实现
-        }
-    
+        """计算滚动窗口内的性能指标"""
+        return self.metrics.overall()
+
     async def _generate_improvements(self) -> List[str]:
         """生成改进建议"""
         return [
@@ -169,15 +284,41 @@ class SupervisorAgent(BaseAgent):
             "优化任务分解策略",
             "改进结果整合方法"
         ]
-    
-    def _parse_subtasks(self, llm_response: str) -> List[Dict[str, Any]]:
-        """解析 LLM 响应为结构化的子任务列表"""
-        # 这里需要根据实际的 LLM 输出格式进行解析
-        # 当前返回一个示例结构
-        return [
-            {
-                "type": "research",
-                "goal": "文献综述",
-                "resources": ["papers", "databases"]
-            }
-        ]
+
+    def _parse_subtasks(self, llm_response: str) -> List[Subtask]:
+        """解析 LLM 响应为结构化的子任务列表
+
+        取回复中的第一个JSON数组；未注册的任务类型被丢弃，依赖只保留指向前面子任务的部分
+        （避免环），超出 max_subtasks 的部分被截断。
+        """
+        match = re.search(r"\[.*\]", llm_response, re.S)
+        if not match:
+            return []
+        try:
+            items = json.loads(match.group(0))
+        except json.JSONDecodeError as e:
+            logger.warning(f"子任务JSON解析失败: {str(e)}")
+            return []
+
+        subtasks: List[Subtask] = []
+        seen = set()
+        for index, item in enumerate(items if isinstance(items, list) else []):
+            if not isinstance(item, dict):
+                continue
+            try:
+                task_type = TaskType(str(item.get("type", "")).strip())
+            except ValueError:
+                logger.warning(f"丢弃未知类型的子任务: {item.get('type')}")
+                continue
+            if task_type not in self.capabilities:
+                logger.warning(f"丢弃没有智能体能处理的子任务: {task_type.value}")
+                continue
+            subtask_id = str(item.get("id") or f"t{index + 1}")
+            if subtask_id in seen:
+                subtask_id = f"{subtask_id}_{index + 1}"
+            depends_on = [str(dependency) for dependency in item.get("depends_on") or [] if str(dependency) in seen]
+            subtasks.append(Subtask(subtask_id, task_type, str(item.get("goal", "")).strip(), depends_on))
+            seen.add(subtask_id)
+            if len(subtasks) >= self.max_subtasks:
+                break
+        return subtasks
@@ -15,13 +15,17 @@ class TaskType(Enum):
     EVALUATE_HYPOTHESIS = "evaluate_hypothesis"
     RANK_HYPOTHESIS = "rank_hypothesis"
     EVOLVE_HYPOTHESIS = "evolve_hypothesis"
+    DESIGN_EXPERIMENT = "design_experiment"
+    REVIEW_LITERATURE = "review_literature"
     META_REVIEW = "meta_review"
 
 class ResearchStage(Enum):
     """研究阶段枚举"""
     INITIAL = "initial"
+    LITERATURE = "literature"
     HYPOTHESIS = "hypothesis"
     EVALUATION = "evaluation"
+    EXPERIMENT = "experiment"
     RANKING = "ranking"
     EVOLUTION = "evolution"
     REVIEW = "review"
@@ -0,0 +1,205 @@
+from typing import List, Dict, Any, Optional, Iterator, Set
+import os
+import csv
+import math
+import json
+import time
+import asyncio
+import hashlib
+from datetime import datetime
+from loguru import logger
+
+# 输入文件中依次尝试的问题/背景字段
+QUESTION_FIELDS = ("question", "research_question", "问题")
+BACKGROUND_FIELDS = ("background", "context", "背景")
+
+
+def row_key(question: str, background: str) -> str:
+    """行的稳定标识，用于断点续跑"""
+    return hashlib.sha1(f"{question}\x00{background}".encode("utf-8")).hexdigest()[:16]
+
+
+def _pick(record: Dict[str, Any], fields) -> str:
+    for field in fields:
+        value = record.get(field)
+        if value:
+            return str(value).strip()
+    return ""
+
+
+def read_questions(path: str) -> Iterator[Dict[str, Any]]:
+    """按行读取 JSONL 或 CSV（带表头）中的 (question, background)
+
+    有 id 字段时用作行标识，否则取问题和背景的哈希。
+    """
+    suffix = os.path.splitext(path)[1].lower()
+    with open(path, encoding="utf-8", newline="") as f:
+        if suffix == ".csv":
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for index, record in enumerate(records):
+            question = _pick(record, QUESTION_FIELDS)
+            if not question:
+                logger.warning(f"第 {index + 1} 行缺少问题字段，跳过")
+                continue
+            background = _pick(record, BACKGROUND_FIELDS)
+            yield {
+                "key": str(record.get("id") or row_key(question, background)),
+                "index": index,
+                "question": question,
+                "background": background,
+            }
+
+
+def completed_keys(output_path: str) -> Set[str]:
+    """已成功完成的行（失败的行在续跑时会重试）"""
+    keys = set()
+    if not os.path.exists(output_path):
+        return keys
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 上次中断时可能留下半行
+                continue
+            if record.get("status") == "success":
+                keys.add(record["key"])
+    return keys
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """最近秩百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = min(len(ordered), max(1, math.ceil(q / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+class BatchRunner:
+    """无界面批量运行研究问题
+
+    所有会话共享同一个 Supervisor（以及其中的 Brain 和 VectorStore）；
+    固定数量的worker从队列中取行，并发度即worker数。每行完成后立即
+    追加写入输出JSONL，中断后重新运行会跳过已成功的行。
+    """
+
+    def __init__(self, supervisor, output_path: str, concurrency: int = 4, timeout: Optional[float] = None):
+        self.supervisor = supervisor
+        self.output_path = output_path
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+
+        self._output = None
+        self.latencies: List[float] = []
+        self.ttfts: List[float] = []
+        self.usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        self.stats = {"total": 0, "skipped": 0, "succeeded": 0, "failed": 0}
+
+    async def _run_row(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """运行一行，返回写入输出的记录"""
+        from .cli import run_question
+
+        start = time.perf_counter()
+        first_chunk = []
+
+        def on_chunk(_):
+            if not first_chunk:
+                first_chunk.append(time.perf_counter() - start)
+
+        try:
+            result = await asyncio.wait_for(
+                run_question(self.supervisor, row["question"], row["background"], on_chunk),
+                timeout=self.timeout
+            )
+        except asyncio.TimeoutError:
+            result = {"status": "error", "message": f"超时 ({self.timeout}s)"}
+        except Exception as e:
+            result = {"status": "error", "message": str(e)}
+
+        return {
+            **row,
+            **result,
+            "latency_s": round(time.perf_counter() - start, 3),
+            "ttft_s": round(first_chunk[0], 3) if first_chunk else None,
+            # 执行任务的worker统计的token用量
+            "usage": result.get("usage") or {},
+            "finished_at": datetime.now().isoformat(),
+        }
+
+    def _record(self, record: Dict[str, Any]):
+        self._output.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self._output.flush()
+
+        if record.get("status") == "success":
+            self.stats["succeeded"] += 1
+        else:
+            self.stats["failed"] += 1
+            logger.warning(f"第 {record['index'] + 1} 行失败: {record.get('message')}")
+        self.latencies.append(record["latency_s"])
+        if record["ttft_s"] is not None:
+            self.ttfts.append(record["ttft_s"])
+        for key, value in record["usage"].items():
+            self.usage[key] = self.usage.get(key, 0) + value
+
+    async def _worker(self, queue: "asyncio.Queue"):
+        while True:
+            row = await queue.get()
+            try:
+                if row is None:
+                    return
+                self._record(await self._run_row(row))
+                done = self.stats["succeeded"] + self.stats["failed"]
+                if done % 10 == 0:
+                    logger.info(f"已完成 {done} 行（成功 {self.stats['succeeded']}，失败 {self.stats['failed']}）")
+            finally:
+                queue.task_done()
+
+    async def run(self, rows: Iterator[Dict[str, Any]], limit: Optional[int] = None) -> Dict[str, Any]:
+        """执行批量任务，返回汇总统计"""
+        done = completed_keys(self.output_path)
+        os.makedirs(os.path.dirname(self.output_path) or ".", exist_ok=True)
+        self._output = open(self.output_path, "a", encoding="utf-8")
+
+        # 队列有界，输入文件再大也只在内存中保留少量待处理行
+        queue: "asyncio.Queue" = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)]
+        start = time.perf_counter()
+        try:
+            queued = 0
+            for row in rows:
+                self.stats["total"] += 1
+                if row["key"] in done:
+                    self.stats["skipped"] += 1
+                    continue
+                if limit is not None and queued >= limit:
+                    break
+                await queue.put(row)
+                queued += 1
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            self._output.close()
+
+        return self.summary(time.perf_counter() - start)
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        processed = self.stats["succeeded"] + self.stats["failed"]
+        return {
+            **self.stats,
+            "concurrency": self.concurrency,
+            "elapsed_s": round(elapsed, 2),
+            "throughput_per_min": round(processed / elapsed * 60, 2) if elapsed > 0 else None,
+            "latency_s": {
+                **{f"p{q}": percentile(self.latencies, q) for q in (50, 90, 95, 99)},
+                "max": max(self.latencies) if self.latencies else None,
+            },
+            "ttft_s": {f"p{q}": percentile(self.ttfts, q) for q in (50, 95)},
+            "tokens": self.usage,
+            "output": self.output_path,
+        }
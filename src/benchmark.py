@@ -0,0 +1,411 @@
+"""端到端基准测试
+
+    python -m src.cli bench --sessions 8 --requests 4
+    python -m src.cli bench --save-baseline
+    python -m src.cli bench --scenarios generator supervisor --error-rate 0.05
+
+在本地启动模拟LLM服务（src.mock_llm），Brain 通过 llm.base_url 指向它，然后以
+N 个并发会话分别驱动以下场景，每个会话依次发出若干请求：
+
+- generator: GeneratorAgent 生成假设（单次流式LLM调用 + 存入向量库）
+- supervisor: 完整研究流程（Supervisor.stream_research，含阶段图、会话事件日志）
+- vector_store: 写入一批文本后检索
+
+每个场景报告吞吐量、首个片段耗时（TTFT）和延迟的 p50/p95/p99、错误率、事件循环延迟、
+峰值RSS和CPU占用。结果可保存为JSON基线，之后的运行与基线比较，指标变差超过阈值
+（相对比例且超过该指标的最小绝对变化，避免噪声）时报告回退。
+
+会话、向量库和数据库都写在临时目录中，不影响已有数据；阶段缓存被关闭，
+否则重复的请求会直接命中缓存。
+"""
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+import os
+import copy
+import json
+import time
+import asyncio
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+from loguru import logger
+from .batch import percentile
+
+SCENARIOS = ["generator", "supervisor", "vector_store"]
+
+DEFAULT_MOCK = {"token_rate": 200, "latency": 0.05, "jitter": 0.1, "error_rate": 0.0, "abort_rate": 0.0, "seed": 0}
+
+# 参与回退判断的指标：(路径, 是否越大越好, 最小绝对变化)
+COMPARED_METRICS = [
+    ("throughput_rps", True, 0.0),
+    ("error_rate", False, 0.01),
+    ("latency_s.p50", False, 0.005),
+    ("latency_s.p95", False, 0.005),
+    ("latency_s.p99", False, 0.005),
+    ("ttft_s.p50", False, 0.005),
+    ("ttft_s.p95", False, 0.005),
+    ("ttft_s.p99", False, 0.005),
+    ("loop_lag_ms.p99", False, 2.0),
+    ("rss_mb.peak", False, 5.0),
+    ("cpu_percent", False, 5.0),
+]
+
+QUESTIONS = [
+    ("睡眠时长如何影响短期记忆的巩固？", "已有研究表明睡眠在记忆巩固中起重要作用。"),
+    ("城市绿地面积与居民心理健康有什么关系？", "多项横断面研究发现绿地暴露与抑郁症状呈负相关。"),
+    ("微塑料是否会影响土壤微生物群落的多样性？", "农田土壤中的微塑料含量逐年上升。"),
+    ("远程办公对团队创新产出有什么影响？", "疫情后混合办公模式成为常态。"),
+]
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    """分位数和均值（保留4位小数）；没有数据时为None"""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    return {
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "mean": round(sum(values) / len(values), 4),
+        "max": round(max(values), 4),
+    }
+
+
+class EventLoopLagMonitor:
+    """测量事件循环延迟：每隔 interval 秒休眠一次，实际唤醒时间比预期晚多少即为延迟"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - start - self.interval))
+
+    def start(self) -> "EventLoopLagMonitor":
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def stop(self) -> Dict[str, Optional[float]]:
+        """停止测量，返回延迟的分位数（毫秒）"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        stats = summarize([lag * 1000 for lag in self.lags])
+        return {"p50": stats["p50"], "p99": stats["p99"], "max": stats["max"]}
+
+
+def current_rss() -> float:
+    """当前进程的常驻内存（MB）；没有 /proc 时取历史峰值"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        import resource
+        import sys
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 上单位是字节，Linux 上是KB
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+class ResourceSampler:
+    """后台线程定期采样RSS；CPU占用取期间进程CPU时间与墙钟时间之比
+
+    在线程中采样，事件循环被阻塞时也能记录到峰值。CPU占用包含模拟服务本身
+    （它运行在同一个进程中），因此只适合和同样设置下的基线比较。
+    """
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bench-sampler", daemon=True)
+        self._wall = 0.0
+        self._cpu = 0.0
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.samples.append(current_rss())
+
+    def start(self) -> "ResourceSampler":
+        self.samples.append(current_rss())
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self._thread.start()
+        return self
+
+    def stop(self) -> Dict[str, Any]:
+        self._stop.set()
+        self._thread.join()
+        self.samples.append(current_rss())
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        return {
+            "rss_mb": {"start": round(self.samples[0], 1), "peak": round(max(self.samples), 1)},
+            "cpu_percent": round(cpu / wall * 100, 1) if wall > 0 else None,
+        }
+
+
+# 单个请求：返回 (是否成功, TTFT秒数或None)
+RequestFn = Callable[[int, int], Awaitable[Tuple[bool, Optional[float]]]]
+
+
+async def run_scenario(name: str, request: RequestFn, sessions: int, requests: int) -> Dict[str, Any]:
+    """以 sessions 个并发会话各依次执行 requests 次请求，返回该场景的指标"""
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    errors = 0
+
+    async def session(index: int):
+        nonlocal errors
+        for number in range(requests):
+            start = time.perf_counter()
+            try:
+                ok, ttft = await request(index, number)
+            except Exception as e:
+                logger.warning(f"{name} 会话 {index} 第 {number + 1} 个请求失败: {str(e)}")
+                ok, ttft = False, None
+            latencies.append(time.perf_counter() - start)
+            if ttft is not None:
+                ttfts.append(ttft)
+            if not ok:
+                errors += 1
+
+    monitor = EventLoopLagMonitor().start()
+    sampler = ResourceSampler().start()
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(session(index) for index in range(sessions)))
+    finally:
+        elapsed = time.perf_counter() - start
+        resources = sampler.stop()
+        loop_lag = await monitor.stop()
+
+    total = sessions * requests
+    result = {
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 3) if elapsed > 0 else None,
+        "latency_s": summarize(latencies),
+        "ttft_s": summarize(ttfts),
+        "loop_lag_ms": loop_lag,
+        **resources,
+    }
+    logger.info(
+        f"场景 {name}: {total} 个请求（失败 {errors}），{result['throughput_rps']} 请求/秒，"
+        f"延迟 p50 {result['latency_s']['p50']}s / p99 {result['latency_s']['p99']}s，"
+        f"事件循环延迟 p99 {loop_lag['p99']}ms"
+    )
+    return result
+
+
+def bench_config(config: Dict[str, Any], base_url: str, workdir: str) -> Dict[str, Any]:
+    """基于正式配置生成基准测试用的配置：LLM指向模拟服务，所有持久化写入 workdir"""
+    from .brain.llm import Brain, ModelProvider
+
+    config = copy.deepcopy(config)
+    llm = config.setdefault("llm", {})
+    provider = Brain.PROVIDER_CONFIGS.get(llm.get("provider", ModelProvider.QWEN)) or {}
+    if provider.get("is_anthropic") or provider.get("is_gemini") or not provider:
+        # 模拟服务只实现了OpenAI兼容接口
+        llm["provider"] = ModelProvider.OPENAI
+    llm["base_url"] = base_url
+
+    vector_store = config.setdefault("vector_store", {})
+    vector_store.update({
+        "persist_directory": os.path.join(workdir, "chroma"),
+        "snapshot_path": None,
+        "background_loading": False,
+    })
+    config["database"] = {"url": f"sqlite:///{os.path.join(workdir, 'bench.db')}"}
+    config.setdefault("sessions", {})["log_dir"] = os.path.join(workdir, "sessions")
+    config.setdefault("pipeline", {}).setdefault("cache", {})["enabled"] = False
+    # 研究请求由本进程的worker从内存任务队列中领取执行（workers 为0时会等待独立worker进程）
+    config["task_backend"] = {**(config.get("task_backend") or {}), "type": "memory"}
+    supervisor = config.setdefault("supervisor", {})
+    supervisor["workers"] = supervisor.get("workers") or 1
+    telemetry = config.setdefault("telemetry", {})
+    telemetry["tracing"] = {**(telemetry.get("tracing") or {}), "enabled": False}
+    return config
+
+
+def _scenario_requests(supervisor) -> Dict[str, RequestFn]:
+    """各场景的单个请求"""
+    from .cli import run_question
+    from .agents.types import AgentType, TaskType
+
+    generator = supervisor.agents[AgentType.GENERATOR]
+    memory = supervisor.memory
+
+    async def generator_request(session: int, number: int):
+        question, background = QUESTIONS[(session + number) % len(QUESTIONS)]
+        input_data = {
+            "type": TaskType.GENERATE_HYPOTHESIS.value,
+            "session_id": f"bench-generator-{session}",
+            "content": {"question": question, "background": background},
+        }
+        start = time.perf_counter()
+        ttft = None
+        last: Dict[str, Any] = {}
+        async for update in supervisor.agent_metrics.stream(generator, input_data, TaskType.GENERATE_HYPOTHESIS.value):
+            if update.get("status") == "generating" and ttft is None:
+                ttft = time.perf_counter() - start
+            last = update
+        return last.get("status") == "success", ttft
+
+    async def supervisor_request(session: int, number: int):
+        question, background = QUESTIONS[(session + number) % len(QUESTIONS)]
+        start = time.perf_counter()
+        first_chunk: List[float] = []
+
+        def on_chunk(_):
+            if not first_chunk:
+                first_chunk.append(time.perf_counter() - start)
+
+        result = await run_question(supervisor, f"{question}（会话{session}-{number}）", background, on_chunk)
+        return result.get("status") == "success", first_chunk[0] if first_chunk else None
+
+    async def vector_store_request(session: int, number: int):
+        question, background = QUESTIONS[(session + number) % len(QUESTIONS)]
+        texts = [f"{question} 假设{index + 1}：会话{session} 请求{number} 的第{index + 1}条记录。{background}" for index in range(8)]
+        partition = f"bench-{session}"
+        await memory.store_embeddings(texts, [{"type": "benchmark"} for _ in texts], partition=partition)
+        results = await memory.search(question, limit=5, partition=partition)
+        return bool(results), None
+
+    return {
+        "generator": generator_request,
+        "supervisor": supervisor_request,
+        "vector_store": vector_store_request,
+    }
+
+
+async def run_benchmark(config: Dict[str, Any], scenarios: Optional[List[str]] = None, sessions: int = 8,
+                        requests: int = 4, mock: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """启动模拟服务，依次运行各场景，返回报告"""
+    from .mock_llm import MockLLMServer
+    from .brain.llm import Brain
+    from .cli import build_runtime
+
+    scenarios = scenarios or SCENARIOS
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise ValueError(f"未知的场景: {unknown}，可选 {SCENARIOS}")
+    mock = {**DEFAULT_MOCK, **(mock or {})}
+
+    server = await MockLLMServer(port=0, **mock).start()
+    workdir = tempfile.mkdtemp(prefix="ai_scientist_bench_")
+    try:
+        config = bench_config(config, server.base_url, workdir)
+        # 模拟服务不校验API Key，未设置时填一个占位值
+        os.environ.setdefault(Brain.PROVIDER_CONFIGS[config["llm"]["provider"]]["api_key_env"], "mock")
+        supervisor = build_runtime(config, background=False)
+        requests_by_scenario = _scenario_requests(supervisor)
+
+        results = {}
+        for name in scenarios:
+            logger.info(f"运行场景 {name}: {sessions} 个并发会话 × {requests} 个请求")
+            results[name] = await run_scenario(name, requests_by_scenario[name], sessions, requests)
+    finally:
+        await server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "created_at": datetime.now().isoformat(),
+        "settings": {"sessions": sessions, "requests": requests, "mock": mock},
+        "mock_server": dict(server.stats),
+        "scenarios": results,
+    }
+
+
+def _lookup(metrics: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = metrics
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value if isinstance(value, (int, float)) else None
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 0.1) -> List[Dict[str, Any]]:
+    """与基线比较，返回回退的指标列表
+
+    指标比基线差超过 threshold（相对比例）且超过该指标的最小绝对变化时记为回退；
+    基线或本次缺少的场景和指标跳过。
+    """
+    regressions = []
+    for scenario, metrics in report.get("scenarios", {}).items():
+        reference = (baseline.get("scenarios") or {}).get(scenario)
+        if not reference:
+            continue
+        for path, higher_is_better, min_delta in COMPARED_METRICS:
+            current = _lookup(metrics, path)
+            previous = _lookup(reference, path)
+            if current is None or previous is None:
+                continue
+            worse_by = previous - current if higher_is_better else current - previous
+            if worse_by <= min_delta or worse_by <= abs(previous) * threshold:
+                continue
+            regressions.append({
+                "scenario": scenario,
+                "metric": path,
+                "baseline": previous,
+                "current": current,
+                "change": round((current - previous) / previous, 4) if previous else None,
+            })
+    return regressions
+
+
+def load_baseline(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(report: Dict[str, Any], path: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logger.info(f"基线已保存到 {path}")
+
+
+def format_report(report: Dict[str, Any], regressions: Optional[List[Dict[str, Any]]] = None) -> str:
+    """报告的文本表格"""
+    header = f"{'场景':<14}{'请求':>6}{'错误':>6}{'请求/秒':>10}{'延迟p50':>10}{'p95':>9}{'p99':>9}" \
+             f"{'TTFT p50':>10}{'p99':>9}{'循环延迟p99':>12}{'峰值RSS':>10}{'CPU%':>8}"
+    lines = [header]
+
+    def cell(value, width, digits=3):
+        return f"{'-' if value is None else round(value, digits):>{width}}"
+
+    for name, metrics in report["scenarios"].items():
+        lines.append(
+            f"{name:<16}{metrics['requests']:>6}{metrics['errors']:>6}"
+            f"{cell(metrics['throughput_rps'], 10, 2)}"
+            f"{cell(metrics['latency_s']['p50'], 10)}{cell(metrics['latency_s']['p95'], 9)}{cell(metrics['latency_s']['p99'], 9)}"
+            f"{cell(metrics['ttft_s']['p50'], 10)}{cell(metrics['ttft_s']['p99'], 9)}"
+            f"{cell(metrics['loop_lag_ms']['p99'], 12, 1)}{cell(metrics['rss_mb']['peak'], 10, 1)}"
+            f"{cell(metrics['cpu_percent'], 8, 1)}"
+        )
+    if regressions:
+        lines.append("")
+        lines.append("与基线相比的回退:")
+        for item in regressions:
+            change = f"{item['change']:+.1%}" if item["change"] is not None else "新增"
+            lines.append(f"  {item['scenario']}.{item['metric']}: {item['baseline']} -> {item['current']} ({change})")
+    elif regressions is not None:
+        lines.append("")
+        lines.append("与基线相比没有回退")
+    return "\n".join(lines)
@@ -1,9 +1,14 @@
 from typing import Dict, Any, Optional, AsyncGenerator
 import os
-from openai import AsyncOpenAI
 from loguru import logger
+import time
 import asyncio
+import contextvars
 from ..agents.types import TaskType
+from ..telemetry import tracer, LLM_REQUESTS, LLM_LATENCY, LLM_TTFT, LLM_TOKENS_PER_SECOND, LLM_TOKENS
+
+# 当前任务的token用量累加目标，由执行任务的worker按任务设置
+usage_scope: contextvars.ContextVar[Optional[Dict[str, int]]] = contextvars.ContextVar("usage_scope", default=None)
 
 class ModelProvider:
     """模型提供商配置"""
@@ -105,10 +110,12 @@ class Brain:
         #     genai.configure(api_key=self.api_key)
         #     self.client = genai
         else:
-            # 使用OpenAI兼容客户端
+            # 使用OpenAI兼容客户端（openai包较重，按需导入）
+            from openai import AsyncOpenAI
+            # base_url 可在配置中覆盖（如指向本地的模拟服务做基准测试）
             self.client = AsyncOpenAI(
                 api_key=self.api_key,
-                base_url=provider_config["base_url"]
+                base_url=self.config.get("base_url") or provider_config["base_url"]
             )
         
         # 设置默认模型（如果配置中未指定）
@@ -131,16 +138,20 @@ class Brain:
         
         self.stream_required = provider_config["stream_required"]
         self.stream_callback = None  # 添加直接回调属性
+        
+        # 累计token用量（流式请求需要服务端支持 include_usage）
+        self.usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
         logger.info(f"初始化完成，使用模型: {self.config['model']}")
             
         # 检测模型能力
         asyncio.create_task(self.detect_model_capabilities())
             
     async def think(self, prompt: str, task_type=None, callback=None) -> AsyncGenerator[str, None]:
-        """思考问题并生成回答，支持流式输出和停止功能"""
-        # 重置停止标志
-        self.should_stop = False
+        """思考问题并生成回答，支持流式输出
         
+        Brain 被多个会话共享，不保存单次调用的状态；停止生成时由调用方取消所在的任务，
+        进行中的请求和流随之取消。
+        """
         # 优化参数
         params = self._optimize_params_for_task(task_type, prompt)
         
@@ -153,39 +164,35 @@ class Brain:
             messages.append({"role": "system", "content": system_prompt})
         messages.append({"role": "user", "content": prompt})
         
+        # 耗时、首个片段耗时和输出速度计入指标
+        model = self.config["model"]
+        task_name = task_type.value if isinstance(task_type, TaskType) else str(task_type or "general")
+        start = time.perf_counter()
+        first_chunk = None
+        chunks = 0
+        status = "error"
+        error = None
+        span = tracer.start("Brain.think", model=model, task_type=task_name, prompt_chars=len(prompt))
         try:
-            # 检查是否应该停止
-            if self.should_stop:
-                logger.info("Brain: 思考被停止")
-                return
+            # 请求在流末尾返回用量
+            if self.config.get("stream_usage", True) and not (
+                self.provider in (ModelProvider.ANTHROPIC, ModelProvider.GEMINI)
+            ):
+                params["stream_options"] = {"include_usage": True}
             
-            # 创建请求任务
-            request_task = asyncio.create_task(
-                self.client.chat.completions.create(
-                    model=self.config["model"],
-                    messages=messages,
-                    stream=True,
-                    **params
-                )
+            # 发起请求
+            response = await self.client.chat.completions.create(
+                model=self.config["model"],
+                messages=messages,
+                stream=True,
+                **params
             )
             
-            # 保存当前请求以便可以在需要时取消它
-            self._current_request = request_task
-            
-            # 等待响应
-            response = await request_task
-            
-            # 检查是否应该停止
-            if self.should_stop:
-                logger.info("Brain: 思考被停止")
-                return
-            
             # 处理流式响应
             async for chunk in self._handle_stream_response(response):
-                # 检查是否应该停止
-                if self.should_stop:
-                    logger.info("Brain: 思考被停止")
-                    return
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - start
+                chunks += 1
                 
                 # 如果有回调函数，调用它
                 if callback:
@@ -194,15 +201,36 @@ class Brain:
                 # 产生块
                 yield chunk
             
+            status = "success"
+            
         except asyncio.CancelledError:
             logger.info("Brain: 思考被取消")
+            status = "cancelled"
+            raise
+        except GeneratorExit:
+            # 调用方提前结束迭代
+            status = "closed"
             raise
         except Exception as e:
             logger.error(f"Brain: 思考时出错: {str(e)}")
+            error = e
             raise
         finally:
-            # 清理
-            self._current_request = None
+            self._record_request(model, task_name, status, time.perf_counter() - start, first_chunk, chunks)
+            span.set(status=status, chunks=chunks)
+            if first_chunk is not None:
+                span.set(ttft_s=round(first_chunk, 4))
+            tracer.finish(span, error)
+
+    def _record_request(self, model: str, task_name: str, status: str, elapsed: float,
+                        first_chunk: Optional[float], chunks: int):
+        """把一次请求的耗时计入导出的指标"""
+        LLM_REQUESTS.labels(model, task_name, status).inc()
+        LLM_LATENCY.labels(model, task_name).observe(elapsed)
+        if first_chunk is not None:
+            LLM_TTFT.labels(model, task_name).observe(first_chunk)
+            if chunks > 1 and elapsed > first_chunk:
+                LLM_TOKENS_PER_SECOND.labels(model).observe((chunks - 1) / (elapsed - first_chunk))
 
     def _optimize_params_for_task(self, task_type, prompt):
         """根据任务类型优化参数"""
@@ -256,18 +284,10 @@ class Brain:
             
     async def _handle_stream_response(self, response) -> AsyncGenerator[str, None]:
         """处理流式响应"""
-        # 保存当前流以便可以在需要时关闭它
-        self._current_stream = response
-        
         accumulated_text = ""
         
         try:
             async for chunk in response:
-                # 检查是否应该停止
-                if self.should_stop:
-                    logger.info("Brain: 流式响应处理被停止")
-                    return
-                    
                 # 根据不同的模型提供商提取内容
                 content = ""
                 
@@ -289,6 +309,10 @@ class Brain:
                         if hasattr(delta, 'content') and delta.content:
                             content = delta.content
                 
+                # 流末尾的用量统计
+                if getattr(chunk, 'usage', None):
+                    self._record_usage(chunk.usage)
+                
                 # 累积文本
                 accumulated_text += content
                 
@@ -298,14 +322,30 @@ class Brain:
                     
         except asyncio.CancelledError:
             logger.info("Brain: 流式响应被取消")
+            # 关闭连接，不再接收剩余的输出
+            if hasattr(response, "close"):
+                await response.close()
             raise
         except Exception as e:
             logger.error(f"Brain: 处理流式响应时出错: {str(e)}")
             raise
-        finally:
-            # 清理
-            self._current_stream = None
             
+    def _record_usage(self, usage):
+        """累加token用量，同时计入当前任务的用量（如果调用方设置了）"""
+        counts = {
+            "requests": 1,
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+            "total_tokens": getattr(usage, "total_tokens", 0) or 0,
+        }
+        scope = usage_scope.get()
+        LLM_TOKENS.labels(self.config["model"], "prompt").inc(counts["prompt_tokens"])
+        LLM_TOKENS.labels(self.config["model"], "completion").inc(counts["completion_tokens"])
+        for key, value in counts.items():
+            self.usage[key] += value
+            if scope is not None:
+                scope[key] = scope.get(key, 0) + value
+    
     async def close(self):
         """关闭客户端连接"""
         # OpenAI 客户端会自动处理连接的关闭
@@ -358,36 +398,3 @@ class Brain:
                 "supports_vision": False,
                 "typical_temperature": 0.7
             }
-
-    def stop_generation(self):
-        """停止当前生成过程"""
-        logger.info("Brain: 停止生成过程")
-        self.should_stop = True
-        
-        # 如果有正在进行的请求，尝试取消它
-        if hasattr(self, '_current_request') and self._current_request is not None:
-            try:
-                if not self._current_request.done():
-                    logger.info("Brain: 取消当前请求")
-                    self._current_request.cancel()
-                self._current_request = None
-            except Exception as e:
-                logger.error(f"Brain: 取消请求时出错: {str(e)}")
-        
-        # 如果有正在进行的流式响应，尝试关闭它
-        if hasattr(self, '_current_stream') and self._current_stream is not None:
-            try:
-                logger.info("Brain: 关闭当前流")
-                # 对于不同的客户端可能需要不同的关闭方法
-                if hasattr(self._current_stream, 'close'):
-                    self._current_stream.close()
-                elif hasattr(self._current_stream, 'aclose'):
-                    asyncio.create_task(self._current_stream.aclose())
-                self._current_stream = None
-            except Exception as e:
-                logger.error(f"Brain: 关闭流时出错: {str(e)}")
-
-    def reset_state(self):
-        """重置状态，准备新的生成过程"""
-        self.should_stop = False
-        self._current_request = None
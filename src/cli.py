@@ -0,0 +1,420 @@
+"""命令行入口（不导入gradio）
+
+    python -m src.cli ask "研究问题" --background "背景"
+    python -m src.cli ask "复杂研究问题" --decompose
+    python -m src.cli batch questions.jsonl --output results.jsonl --concurrency 8
+    python -m src.cli worker --workers 4
+    python -m src.cli session <会话ID> --events
+    python -m src.cli profile-imports --budget-ms 500
+    python -m src.cli bench --sessions 8 --save-baseline
+    python -m src.cli mock-llm --port 8900 --token-rate 50
+
+重量级依赖（chromadb、sentence_transformers、openai、torch）都在首次使用时导入，
+本模块及其导入链只依赖标准库、yaml 和 loguru，进程可以在一秒内就绪。
+"""
+from typing import List, Dict, Any, Optional
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+from loguru import logger
+
+# 入口模块默认的导入耗时预算（毫秒）
+DEFAULT_IMPORT_BUDGET_MS = 500
+
+# 默认参与导入耗时分析的模块
+PROFILE_MODULES = ["src.cli", "src.supervisor", "src.brain.llm", "src.data.vector_store", "src.data.warmup"]
+
+_IMPORTTIME_PATTERN = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def load_config(path: str = "config/config.yaml") -> Dict[str, Any]:
+    import yaml
+
+    with open(path) as f:
+        return yaml.safe_load(f)
+
+
+def load_env(env_path: str = ".env"):
+    """加载 .env（不存在时只使用进程环境变量）"""
+    if os.path.exists(env_path):
+        from dotenv import load_dotenv
+        load_dotenv(env_path)
+
+
+def setup_logging(level: str = "INFO", config: Optional[Dict[str, Any]] = None):
+    """命令行默认只输出INFO及以上到stderr，避免与结果输出混在一起；格式和限流取 logging 配置"""
+    from .log_config import setup_logging as configure_logging
+
+    configure_logging(config, level=level, file=False)
+
+
+def build_runtime(config: Dict[str, Any], background: bool = True):
+    """创建 Brain、VectorStore 和 Supervisor，供命令行任务共享"""
+    from .brain.llm import Brain
+    from .supervisor import Supervisor
+    from . import telemetry
+
+    telemetry.configure(config)
+    brain = Brain(config["llm"])
+    if background and config["vector_store"].get("background_loading", True):
+        from .data.warmup import BackgroundVectorStore
+        memory = BackgroundVectorStore(config["vector_store"]).start()
+    else:
+        from .data.vector_store import VectorStore
+        memory = VectorStore(config["vector_store"])
+    return Supervisor(config, brain, memory)
+
+
+# ---------- 导入耗时分析 ----------
+
+def import_profile(module: str, top: int = 15) -> Dict[str, Any]:
+    """用 python -X importtime 在全新进程中测量导入某个模块的耗时
+
+    Returns:
+        Dict: total_ms 为该模块的累计导入耗时，packages 为按顶层包汇总的自身耗时（降序）
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=os.getcwd()
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败: {result.stderr.strip().splitlines()[-1]}")
+
+    total_us = 0
+    packages: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_PATTERN.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = int(match.group(1)), int(match.group(2)), match.group(3), match.group(4)
+        root = name.split(".")[0]
+        packages[root] = packages.get(root, 0) + self_us
+        if name == module and len(indent) <= 1:
+            total_us = cumulative_us
+
+    ranked = sorted(packages.items(), key=lambda x: x[1], reverse=True)[:top]
+    return {
+        "module": module,
+        "total_ms": round(total_us / 1000, 1),
+        "packages": [{"package": name, "self_ms": round(us / 1000, 1)} for name, us in ranked],
+    }
+
+
+def cmd_profile_imports(args) -> int:
+    modules = args.modules or PROFILE_MODULES
+    reports = [import_profile(module, top=args.top) for module in modules]
+    over_budget = [r["module"] for r in reports if r["total_ms"] > args.budget_ms]
+
+    if args.json:
+        print(json.dumps({"budget_ms": args.budget_ms, "reports": reports, "over_budget": over_budget}, ensure_ascii=False, indent=2))
+    else:
+        for report in reports:
+            flag = "超出预算" if report["module"] in over_budget else "ok"
+            print(f"{report['module']}: {report['total_ms']} ms ({flag})")
+            for item in report["packages"]:
+                print(f"    {item['package']:<28} {item['self_ms']:>8} ms")
+    return 1 if over_budget else 0
+
+
+# ---------- 单个问题 ----------
+
+async def run_question(supervisor, question: str, background: str = "", on_chunk=None,
+                       task_type: str = "research_question", on_update=None) -> Dict[str, Any]:
+    """不经过界面运行一次假设生成，返回最终结果
+
+    task_type 为 complex_research 时先分解为子任务并发执行再整合；
+    其他流式更新（stage / decomposed / partial）交给 on_update。
+    """
+    from .supervisor import STREAMING_STATUSES
+
+    session_id = supervisor.create_session(question, background)
+    input_data = {
+        "type": task_type,
+        "session_id": session_id,
+        "content": {"question": question, "background": background}
+    }
+    result: Dict[str, Any] = {"status": "error", "message": "没有输出"}
+    async for update in supervisor.stream_research(input_data):
+        if update["status"] == "generating":
+            if on_chunk and "chunk" in update:
+                on_chunk(update["chunk"])
+        elif update["status"] in STREAMING_STATUSES:
+            if on_update:
+                on_update(update)
+        else:
+            result = update
+    return {"session_id": session_id, **result}
+
+
+def _print_progress(update: Dict[str, Any]):
+    """把子任务分解和子任务结果输出到stderr，不与生成的文本混在一起"""
+    if update["status"] == "decomposed":
+        for subtask in update["subtasks"]:
+            print(f"\n[子任务 {subtask['id']}] {subtask['type']}: {subtask['goal']}", file=sys.stderr)
+    elif update["status"] == "partial":
+        print(f"\n[子任务 {update['subtask']}] {update['result'].get('status')}", file=sys.stderr)
+
+
+def cmd_ask(args) -> int:
+    import asyncio
+
+    load_env()
+    config = load_config(args.config)
+
+    async def main():
+        supervisor = build_runtime(config)
+        on_chunk = None if args.json else (lambda chunk: print(chunk, end="", flush=True))
+        result = await run_question(
+            supervisor, args.question, args.background, on_chunk,
+            task_type="complex_research" if args.decompose else "research_question",
+            on_update=None if args.json else _print_progress
+        )
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False, default=str))
+        else:
+            print()
+        return 0 if result.get("status") == "success" else 1
+
+    return asyncio.run(main())
+
+
+def cmd_batch(args) -> int:
+    import asyncio
+    from .batch import BatchRunner, read_questions
+
+    load_env()
+    config = load_config(args.config)
+    batch_config = config.get("batch") or {}
+    output = args.output or os.path.splitext(args.input)[0] + ".results.jsonl"
+
+    async def main():
+        runner = BatchRunner(
+            build_runtime(config),
+            output_path=output,
+            concurrency=args.concurrency or batch_config.get("concurrency", 4),
+            timeout=args.timeout or batch_config.get("timeout")
+        )
+        return await runner.run(read_questions(args.input), limit=args.limit)
+
+    summary = asyncio.run(main())
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 0 if summary["failed"] == 0 else 1
+
+
+def cmd_worker(args) -> int:
+    """独立的任务worker进程：从共享的任务后端领取任务，通过事件总线回传结果
+
+    界面进程设置 supervisor.workers: 0 后只负责提交任务，执行能力通过在一台或多台机器上
+    启动更多worker进程横向扩展。进程被终止时未完成的任务在租期过期后由其他worker重试。
+    """
+    import asyncio
+    import signal
+
+    load_env()
+    config = load_config(args.config)
+    supervisor = build_runtime(config)
+    supervisor.worker_count = args.workers or (config.get("supervisor") or {}).get("workers") or 1
+
+    async def main():
+        runner = asyncio.create_task(supervisor.run_workers())
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, runner.cancel)
+        logger.info(f"worker进程 {supervisor.worker_id} 已启动，并发数 {supervisor.worker_count}")
+        try:
+            await runner
+        except asyncio.CancelledError:
+            logger.info("worker进程退出")
+
+    try:
+        asyncio.run(main())
+    except RuntimeError as e:
+        logger.error(str(e))
+        return 2
+    return 0
+
+
+def cmd_session(args) -> int:
+    """查看会话：默认输出快照加回放后的状态，--events 输出带耗时的事件时间线"""
+    from datetime import datetime
+    from .session_store import create_session_store, _encode
+
+    store = create_session_store(load_config(args.config))
+    if not args.events:
+        session = store.load(args.session_id, upto=args.upto)
+        if session is None:
+            print(f"会话不存在: {args.session_id}", file=sys.stderr)
+            return 1
+        print(json.dumps(session.to_dict(), ensure_ascii=False, indent=2, default=_encode))
+        return 0
+
+    previous = None
+    for event in store.events(args.session_id):
+        if args.upto is not None and event["seq"] > args.upto:
+            break
+        ts = datetime.fromisoformat(event["ts"])
+        delta_ms = (ts - previous).total_seconds() * 1000 if previous else 0.0
+        previous = ts
+        size = len(json.dumps(event["data"], ensure_ascii=False, default=str))
+        print(f"{event['seq']:>6}  {event['ts']}  +{delta_ms:>9.1f} ms  {event['type']:<12} {size} B")
+    if previous is None:
+        print(f"会话不存在: {args.session_id}", file=sys.stderr)
+        return 1
+    return 0
+
+
+# ---------- 基准测试 ----------
+
+def _mock_settings(args, mock_config: Dict[str, Any]) -> Dict[str, Any]:
+    """模拟服务参数：命令行优先，其次 benchmark.mock 配置"""
+    settings = dict(mock_config)
+    for key in ("token_rate", "latency", "jitter", "error_rate", "abort_rate", "seed"):
+        value = getattr(args, key, None)
+        if value is not None:
+            settings[key] = value
+    return settings
+
+
+def cmd_bench(args) -> int:
+    """运行基准测试；有基线时比较并在回退时返回非零退出码"""
+    import asyncio
+    from .benchmark import run_benchmark, compare, load_baseline, save_baseline, format_report
+
+    config = load_config(args.config)
+    bench_config = config.get("benchmark") or {}
+    baseline_path = args.baseline or bench_config.get("baseline", "benchmarks/baseline.json")
+    threshold = args.threshold if args.threshold is not None else bench_config.get("threshold", 0.1)
+
+    report = asyncio.run(run_benchmark(
+        config,
+        scenarios=args.scenarios or bench_config.get("scenarios"),
+        sessions=args.sessions or bench_config.get("sessions", 8),
+        requests=args.requests or bench_config.get("requests", 4),
+        mock=_mock_settings(args, bench_config.get("mock") or {})
+    ))
+
+    regressions = None
+    baseline = None if args.save_baseline else load_baseline(baseline_path)
+    if baseline is not None:
+        if baseline.get("settings") != report["settings"]:
+            logger.warning(f"基线 {baseline_path} 的运行参数与本次不同，比较结果仅供参考")
+        regressions = compare(report, baseline, threshold)
+        report["regressions"] = regressions
+    if args.save_baseline:
+        save_baseline(report, baseline_path)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2) if args.json else format_report(report, regressions))
+    return 1 if regressions else 0
+
+
+def cmd_mock_llm(args) -> int:
+    """单独运行模拟LLM服务，供界面或其他进程通过 llm.base_url 使用"""
+    import asyncio
+    from .mock_llm import MockLLMServer
+
+    config = load_config(args.config) if os.path.exists(args.config) else {}
+    settings = _mock_settings(args, (config.get("benchmark") or {}).get("mock") or {})
+
+    async def main():
+        server = await MockLLMServer(host=args.host, port=args.port, **settings).start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _add_mock_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--token-rate", dest="token_rate", type=float, help="每秒输出的token数，0为不限速")
+    parser.add_argument("--latency", type=float, help="首个片段前的延迟秒数")
+    parser.add_argument("--jitter", type=float, help="延迟的随机抖动比例")
+    parser.add_argument("--error-rate", dest="error_rate", type=float, help="返回500错误的请求比例")
+    parser.add_argument("--abort-rate", dest="abort_rate", type=float, help="流式输出中途断开的请求比例")
+    parser.add_argument("--seed", type=int, help="随机种子")
+    parser.add_argument("--config", default="config/config.yaml")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="AI科学家命令行入口（无界面）")
+    parser.add_argument("--log-level", default="INFO")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ask = subparsers.add_parser("ask", help="生成单个研究问题的假设")
+    ask.add_argument("question")
+    ask.add_argument("--background", default="")
+    ask.add_argument("--config", default="config/config.yaml")
+    ask.add_argument("--json", action="store_true", help="只输出最终结果的JSON")
+    ask.add_argument("--decompose", action="store_true", help="分解为子任务交给各智能体并发执行后整合（complex_research）")
+    ask.set_defaults(func=cmd_ask)
+
+    batch = subparsers.add_parser("batch", help="批量运行 JSONL/CSV 中的研究问题")
+    batch.add_argument("input", help="JSONL 或 CSV（字段 question、background，可选 id）")
+    batch.add_argument("--output", help="结果JSONL，默认 <input>.results.jsonl；已成功的行在重跑时跳过")
+    batch.add_argument("--concurrency", type=int, help="同时运行的会话数，默认取配置 batch.concurrency")
+    batch.add_argument("--timeout", type=float, help="单行超时秒数，默认取配置 batch.timeout")
+    batch.add_argument("--limit", type=int, help="本次最多运行的行数")
+    batch.add_argument("--config", default="config/config.yaml")
+    batch.set_defaults(func=cmd_batch)
+
+    worker = subparsers.add_parser("worker", help="启动独立的任务worker进程（需要 sqlite 或 redis 任务后端）")
+    worker.add_argument("--workers", type=int, help="本进程的并发任务数，默认取配置 supervisor.workers")
+    worker.add_argument("--config", default="config/config.yaml")
+    worker.set_defaults(func=cmd_worker)
+
+    session = subparsers.add_parser("session", help="查看会话状态或回放事件历史")
+    session.add_argument("session_id")
+    session.add_argument("--events", action="store_true", help="输出事件时间线（含相邻事件间隔）")
+    session.add_argument("--upto", type=int, help="只回放到该序号的事件为止")
+    session.add_argument("--config", default="config/config.yaml")
+    session.set_defaults(func=cmd_session)
+
+    profile = subparsers.add_parser("profile-imports", help="测量入口模块的导入耗时")
+    profile.add_argument("modules", nargs="*", help=f"默认: {' '.join(PROFILE_MODULES)}")
+    profile.add_argument("--budget-ms", type=float, default=DEFAULT_IMPORT_BUDGET_MS)
+    profile.add_argument("--top", type=int, default=10, help="每个模块列出耗时最多的顶层包数")
+    profile.add_argument("--json", action="store_true")
+    profile.set_defaults(func=cmd_profile_imports)
+
+    bench = subparsers.add_parser("bench", help="在本地模拟LLM服务下运行端到端基准测试")
+    bench.add_argument("--scenarios", nargs="+", help="默认取配置 benchmark.scenarios（generator supervisor vector_store）")
+    bench.add_argument("--sessions", type=int, help="并发会话数，默认取配置 benchmark.sessions")
+    bench.add_argument("--requests", type=int, help="每个会话的请求数，默认取配置 benchmark.requests")
+    bench.add_argument("--baseline", help="基线JSON，默认取配置 benchmark.baseline")
+    bench.add_argument("--threshold", type=float, help="回退阈值（相对比例），默认取配置 benchmark.threshold")
+    bench.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线（不做比较）")
+    bench.add_argument("--output", help="另存本次报告的JSON")
+    bench.add_argument("--json", action="store_true", help="输出完整报告的JSON")
+    _add_mock_arguments(bench)
+    bench.set_defaults(func=cmd_bench)
+
+    mock = subparsers.add_parser("mock-llm", help="运行OpenAI兼容的模拟LLM服务")
+    mock.add_argument("--host", default="127.0.0.1")
+    mock.add_argument("--port", type=int, default=8900)
+    _add_mock_arguments(mock)
+    mock.set_defaults(func=cmd_mock_llm)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    config_path = getattr(args, "config", None)
+    setup_logging(args.log_level, load_config(config_path) if config_path and os.path.exists(config_path) else None)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
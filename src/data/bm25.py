@@ -0,0 +1,241 @@
+from typing import List, Dict, Optional, Tuple
+import os
+import re
+import pickle
+import threading
+from array import array
+from collections import Counter
+from loguru import logger
+
+# 英文/数字标识符，保留连字符和点连接的整体（如 BRCA1、IL-6、CRISPR-Cas9、H2O）
+_LATIN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+_CJK_PATTERN = re.compile(r"[一-鿿]+")
+
+# tf使用uint16存储
+_MAX_TF = 65535
+
+_jieba = None
+
+
+def _load_jieba():
+    """按需加载jieba，未安装时返回None"""
+    global _jieba
+    if _jieba is None:
+        try:
+            import jieba
+            jieba.setLogLevel(60)
+            _jieba = jieba
+        except ImportError:
+            _jieba = False
+    return _jieba or None
+
+
+def tokenize(text: str) -> List[str]:
+    """中英混合分词
+
+    英文按标识符切分，复合标识符同时保留整体和各部分；
+    中文优先使用jieba搜索模式，未安装时退化为单字+二元组。
+    """
+    text = text.lower()
+    tokens = []
+
+    for match in _LATIN_PATTERN.findall(text):
+        tokens.append(match)
+        parts = re.split(r"[-_.]", match)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p)
+
+    jieba = _load_jieba()
+    for segment in _CJK_PATTERN.findall(text):
+        if jieba:
+            tokens.extend(w for w in jieba.lcut_for_search(segment) if w.strip())
+        else:
+            tokens.extend(segment)
+            tokens.extend(a + b for a, b in zip(segment, segment[1:]))
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """倒数排名融合：score(d) = Σ 1 / (k + rank)"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, id in enumerate(ranking, 1):
+            scores[id] = scores.get(id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda x: x[1], reverse=True)
+
+
+class BM25Index:
+    """增量维护的BM25倒排索引
+
+    倒排表用 array 紧凑存储（文档号 uint32 + 词频 uint16），
+    打分时直接转为numpy视图做向量化累加。更新同一ID时旧文档号作废，
+    不在原地修改倒排表；df只统计有效文档，作废文档号超过 compact_ratio 后压缩倒排表。
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75, save_every: int = 1000,
+                 compact_ratio: float = 0.3):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.save_every = save_every
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._doc_lengths = array("I")
+        self._doc_ids: List[str] = []
+        self._docno: Dict[str, int] = {}
+        self._dead = set()
+        self._total_length = 0
+        self._unsaved = 0
+
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._docno)
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            state = pickle.load(f)
+        self.__dict__.update(state)
+        logger.info(f"已加载BM25索引: {len(self)} 篇文档, {len(self._postings)} 个词项")
+
+    def save(self):
+        """把索引写入磁盘"""
+        if not self.path:
+            return
+        with self._lock:
+            state = {
+                "_postings": self._postings,
+                "_doc_lengths": self._doc_lengths,
+                "_doc_ids": self._doc_ids,
+                "_docno": self._docno,
+                "_dead": self._dead,
+                "_total_length": self._total_length,
+            }
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            self._unsaved = 0
+
+    def add(self, ids: List[str], texts: List[str]):
+        """增量加入文档，已存在的ID视为更新"""
+        with self._lock:
+            for id, text in zip(ids, texts):
+                self._remove(id)
+                terms = Counter(tokenize(text or ""))
+                docno = len(self._doc_ids)
+                length = sum(terms.values())
+                self._doc_ids.append(id)
+                self._doc_lengths.append(length)
+                self._docno[id] = docno
+                self._total_length += length
+                for term, tf in terms.items():
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        postings = (array("I"), array("H"))
+                        self._postings[term] = postings
+                    postings[0].append(docno)
+                    postings[1].append(min(tf, _MAX_TF))
+
+            self._maybe_compact()
+            self._unsaved += len(ids)
+            if self._unsaved >= self.save_every:
+                self.save()
+
+    def _remove(self, id: str):
+        docno = self._docno.pop(id, None)
+        if docno is not None:
+            self._dead.add(docno)
+            self._total_length -= self._doc_lengths[docno]
+
+    def delete(self, ids: List[str]):
+        """删除文档"""
+        with self._lock:
+            for id in ids:
+                self._remove(id)
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self._dead and len(self._dead) >= self.compact_ratio * len(self._doc_ids):
+            self._compact()
+
+    def _compact(self):
+        """丢弃作废文档号的倒排项，有效文档重新连续编号"""
+        import numpy as np
+
+        alive = np.ones(len(self._doc_ids), dtype=bool)
+        alive[list(self._dead)] = False
+        remap = (np.cumsum(alive) - 1).astype(np.uint32)
+
+        postings = {}
+        for term, (docs, tfs) in self._postings.items():
+            docs = np.frombuffer(docs, dtype=np.uint32)
+            keep = alive[docs]
+            if keep.any():
+                postings[term] = (
+                    array("I", remap[docs[keep]].tobytes()),
+                    array("H", np.frombuffer(tfs, dtype=np.uint16)[keep].tobytes())
+                )
+        self._postings = postings
+        self._doc_lengths = array("I", np.frombuffer(self._doc_lengths, dtype=np.uint32)[alive].tobytes())
+        self._doc_ids = [id for id, live in zip(self._doc_ids, alive) if live]
+        self._docno = {id: docno for docno, id in enumerate(self._doc_ids)}
+        self._dead = set()
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, float]]:
+        """返回 (ID, BM25分数) 列表，按分数从高到低"""
+        import numpy as np
+
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self._docno)
+            if not n_docs or not terms:
+                return []
+
+            doc_lengths = np.frombuffer(self._doc_lengths, dtype=np.uint32).astype(np.float32)
+            avgdl = self._total_length / n_docs or 1.0
+            norm = self.k1 * (1 - self.b + self.b * doc_lengths / avgdl)
+            scores = np.zeros(len(self._doc_ids), dtype=np.float32)
+            alive = np.ones(len(self._doc_ids), dtype=bool)
+            if self._dead:
+                alive[list(self._dead)] = False
+
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                docs = np.frombuffer(postings[0], dtype=np.uint32)
+                tfs = np.frombuffer(postings[1], dtype=np.uint16).astype(np.float32)
+                # 只统计有效文档，否则更新过的文档会让df超过文档总数、idf变为负数
+                live = alive[docs]
+                docs, tfs = docs[live], tfs[live]
+                df = len(docs)
+                if not df:
+                    continue
+                idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+
+            candidates = np.flatnonzero(scores > 0)
+            if not len(candidates):
+                return []
+            k = min(limit, len(candidates))
+            top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            top = top[np.argsort(-scores[top])]
+            return [(self._doc_ids[i], float(scores[i])) for i in top]
+
+    def rebuild(self, ids: List[str], texts: List[str]):
+        """清空后用全量文档重建索引"""
+        with self._lock:
+            self._postings = {}
+            self._doc_lengths = array("I")
+            self._doc_ids = []
+            self._docno = {}
+            self._dead = set()
+            self._total_length = 0
+            self.add(ids, texts)
+            self.save()
+        logger.info(f"BM25索引重建完成: {len(self)} 篇文档")
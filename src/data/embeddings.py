@@ -0,0 +1,394 @@
+from typing import List, Dict, Any, Optional, Union
+import os
+import argparse
+from loguru import logger
+
+# 支持的embedding后端
+BACKEND_TORCH = "torch"
+BACKEND_ONNX = "onnx"
+BACKEND_ONNX_INT8 = "onnx-int8"
+BACKENDS = (BACKEND_TORCH, BACKEND_ONNX, BACKEND_ONNX_INT8)
+
+# ONNX导出文件相对模型目录的位置
+ONNX_SUBDIR = "onnx"
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+
+# 用于一致性校验的默认样本（中英混合，贴近实际存储的假设文本）
+VERIFY_SAMPLES = [
+    "假设: 睡眠时长与短期记忆巩固呈正相关",
+    "理论依据: 海马体在慢波睡眠期间进行记忆重放",
+    "验证方法: 随机对照实验，比较不同睡眠组的记忆测试成绩",
+    "Hypothesis: CRISPR knockout of BRCA1 increases sensitivity to PARP inhibitors",
+    "The Navier-Stokes equations describe the motion of viscous fluid substances",
+    "影响因素: 年龄、咖啡因摄入、测试时间",
+    "Graphene oxide membranes show selective ion permeability",
+    "深度学习模型在小样本条件下的泛化能力",
+]
+
+
+def _set_torch_threads(num_threads: Optional[int]):
+    """设置torch的CPU线程数"""
+    if not num_threads:
+        return
+    import torch
+    torch.set_num_threads(num_threads)
+
+
+class TorchEmbedder:
+    """基于SentenceTransformer的全精度参考实现"""
+
+    backend = BACKEND_TORCH
+
+    def __init__(self, model, num_threads: Optional[int] = None, batch_size: int = 64):
+        self.model = model
+        self.batch_size = batch_size
+        _set_torch_threads(num_threads)
+
+    @classmethod
+    def from_path(cls, model_path: str, device: str = "cpu", **kwargs) -> "TorchEmbedder":
+        """从本地路径加载模型"""
+        from sentence_transformers import SentenceTransformer
+        return cls(SentenceTransformer(model_path, device=device), **kwargs)
+
+    def encode(self, texts: Union[str, List[str]], batch_size: Optional[int] = None, **kwargs):
+        """编码文本，返回L2归一化的float32向量"""
+        return self.model.encode(
+            texts,
+            batch_size=batch_size or self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        ).astype("float32")
+
+
+class OnnxEmbedder:
+    """基于ONNX Runtime的CPU推理实现，支持int8动态量化模型"""
+
+    def __init__(
+        self,
+        onnx_path: str,
+        tokenizer_path: str,
+        num_threads: Optional[int] = None,
+        max_seq_length: int = 256,
+        batch_size: int = 64
+    ):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.backend = BACKEND_ONNX_INT8 if onnx_path.endswith(ONNX_INT8_FILE) else BACKEND_ONNX
+        self.batch_size = batch_size
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            onnx_path, options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(tokenizer_path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+    def _encode_batch(self, texts: List[str]):
+        """编码一个批次：分词 -> 推理 -> 平均池化 -> L2归一化"""
+        import numpy as np
+
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {
+            "input_ids": input_ids,
+            "attention_mask": attention_mask,
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        feeds = {k: v for k, v in feeds.items() if k in self._input_names}
+
+        hidden = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+    def encode(self, texts: Union[str, List[str]], batch_size: Optional[int] = None, **kwargs):
+        """编码文本，返回L2归一化的float32向量"""
+        import numpy as np
+
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        batch_size = batch_size or self.batch_size
+        # 按长度排序后分批，减少padding带来的无效计算
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        outputs = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            vectors = self._encode_batch([texts[i] for i in idx])
+            for i, vector in zip(idx, vectors):
+                outputs[i] = vector
+
+        result = np.stack(outputs)
+        return result[0] if single else result
+
+
+class HashingEmbedder:
+    """不依赖模型文件的哈希特征embedder
+
+    把英文单词和中文字符二元组哈希到固定维度，向量等长且已归一化，
+    只在本地模型也无法加载时作为最后的兜底。
+    """
+
+    backend = "hashing"
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        import re
+        
+        text = text.lower()
+        features = re.findall(r"[a-z0-9_]+", text)
+        cjk = re.findall(r"[\u4e00-\u9fff]", text)
+        features.extend(cjk)
+        features.extend(a + b for a, b in zip(cjk, cjk[1:]))
+        return features
+
+    def encode(self, texts: Union[str, List[str]], **kwargs):
+        import zlib
+        import numpy as np
+
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                # 用哈希的最高位决定符号，减少碰撞带来的偏差
+                vectors[i, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.clip(norms, 1e-12, None)
+        return vectors[0] if single else vectors
+
+
+class EmbedderFunction:
+    """把embedder适配为Chroma的embedding_function接口"""
+
+    def __init__(self, embedder):
+        self.embedder = embedder
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.embedder.encode(list(input)).tolist()
+
+
+def onnx_model_path(model_path: str, quantized: bool = False) -> str:
+    """返回模型目录下ONNX文件的路径"""
+    filename = ONNX_INT8_FILE if quantized else ONNX_FILE
+    return os.path.join(model_path, ONNX_SUBDIR, filename)
+
+
+def export_onnx(model_path: str, output_path: Optional[str] = None, opset: int = 14) -> str:
+    """将本地的transformer模型导出为ONNX格式
+
+    Args:
+        model_path: 本地SentenceTransformer模型目录
+        output_path: 导出文件路径，默认为 <model_path>/onnx/model.onnx
+        opset: ONNX算子集版本
+
+    Returns:
+        str: 导出文件路径
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    output_path = output_path or onnx_model_path(model_path)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModel.from_pretrained(model_path)
+    model.eval()
+
+    class _HiddenStateOnly(torch.nn.Module):
+        """只输出last_hidden_state，池化在ONNX外部完成"""
+
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.inner(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                token_type_ids=token_type_ids
+            )[0]
+
+    dummy = tokenizer(["onnx export"], return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            _HiddenStateOnly(model),
+            tuple(dummy[name] for name in input_names),
+            output_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True
+        )
+
+    logger.info(f"成功导出ONNX模型: {output_path}")
+    return output_path
+
+
+def quantize_onnx(onnx_path: str, output_path: Optional[str] = None) -> str:
+    """对ONNX模型做int8动态量化"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    output_path = output_path or os.path.join(os.path.dirname(onnx_path), ONNX_INT8_FILE)
+    quantize_dynamic(onnx_path, output_path, weight_type=QuantType.QInt8)
+    logger.info(f"成功生成int8量化模型: {output_path}")
+    return output_path
+
+
+def ensure_onnx_model(model_path: str, quantized: bool = False) -> str:
+    """确保ONNX（及量化）文件存在，缺失时自动导出"""
+    fp32_path = onnx_model_path(model_path)
+    if not os.path.exists(fp32_path):
+        logger.info(f"未找到ONNX模型，开始导出: {model_path}")
+        export_onnx(model_path, fp32_path)
+
+    if not quantized:
+        return fp32_path
+
+    int8_path = onnx_model_path(model_path, quantized=True)
+    if not os.path.exists(int8_path):
+        quantize_onnx(fp32_path, int8_path)
+    return int8_path
+
+
+def create_embedder(
+    backend: str,
+    model_path: str,
+    num_threads: Optional[int] = None,
+    max_seq_length: int = 256,
+    device: str = "cpu"
+):
+    """根据后端名称创建embedder
+
+    Args:
+        backend: torch / onnx / onnx-int8
+        model_path: 本地模型目录
+        num_threads: CPU推理线程数，0或None表示使用运行时默认值
+        max_seq_length: 最大序列长度
+        device: torch后端使用的设备
+
+    Returns:
+        具有 encode(texts) 方法的embedder
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"不支持的embedding后端: {backend}，可选: {', '.join(BACKENDS)}")
+
+    if backend == BACKEND_TORCH:
+        return TorchEmbedder.from_path(model_path, device=device, num_threads=num_threads)
+
+    onnx_path = ensure_onnx_model(model_path, quantized=backend == BACKEND_ONNX_INT8)
+    embedder = OnnxEmbedder(
+        onnx_path,
+        model_path,
+        num_threads=num_threads,
+        max_seq_length=max_seq_length
+    )
+    logger.info(f"已加载ONNX embedding后端: {onnx_path}")
+    return embedder
+
+
+def verify_embedder(
+    candidate,
+    reference,
+    texts: Optional[List[str]] = None,
+    min_cosine: float = 0.99
+) -> Dict[str, Any]:
+    """检查候选后端与参考实现的输出是否足够接近
+
+    除逐条向量的余弦相似度外，还检查两者在样本内最近邻排序是否一致，
+    这直接对应检索质量。
+
+    Returns:
+        Dict: 包含 min_cosine、mean_cosine、neighbor_agreement 和 passed
+    """
+    import numpy as np
+
+    texts = texts or VERIFY_SAMPLES
+    a = np.asarray(candidate.encode(texts), dtype=np.float32)
+    b = np.asarray(reference.encode(texts), dtype=np.float32)
+
+    cosines = (a * b).sum(axis=1) / (
+        np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1) + 1e-12
+    )
+
+    # 样本内最近邻（排除自身）是否一致
+    sim_a = a @ a.T
+    sim_b = b @ b.T
+    np.fill_diagonal(sim_a, -np.inf)
+    np.fill_diagonal(sim_b, -np.inf)
+    agreement = float((sim_a.argmax(axis=1) == sim_b.argmax(axis=1)).mean())
+
+    report = {
+        "samples": len(texts),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "neighbor_agreement": agreement,
+        "passed": bool(cosines.min() >= min_cosine and agreement == 1.0)
+    }
+    return report
+
+
+def benchmark_embedder(embedder, texts: Optional[List[str]] = None, repeat: int = 20) -> Dict[str, float]:
+    """测量embedder的编码吞吐（条/秒）"""
+    import time
+
+    texts = (texts or VERIFY_SAMPLES) * repeat
+    embedder.encode(texts[:8])  # 预热
+    start = time.perf_counter()
+    embedder.encode(texts)
+    elapsed = time.perf_counter() - start
+    return {"texts": len(texts), "seconds": elapsed, "texts_per_second": len(texts) / elapsed}
+
+
+def main(argv: Optional[List[str]] = None):
+    """导出、量化、校验embedding后端的命令行入口"""
+    parser = argparse.ArgumentParser(description="Embedding后端工具")
+    parser.add_argument("command", choices=["export", "verify", "bench"])
+    parser.add_argument("--model-path", default="./models/embeddings/all-MiniLM-L6-v2")
+    parser.add_argument("--backend", default=BACKEND_ONNX_INT8, choices=BACKENDS)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        ensure_onnx_model(args.model_path, quantized=args.backend == BACKEND_ONNX_INT8)
+        return
+
+    candidate = create_embedder(args.backend, args.model_path, num_threads=args.threads)
+    if args.command == "verify":
+        reference = create_embedder(BACKEND_TORCH, args.model_path, num_threads=args.threads)
+        report = verify_embedder(candidate, reference, min_cosine=args.min_cosine)
+        print(report)
+        if not report["passed"]:
+            raise SystemExit(1)
+    else:
+        reference = create_embedder(BACKEND_TORCH, args.model_path, num_threads=args.threads)
+        print({"reference": benchmark_embedder(reference), args.backend: benchmark_embedder(candidate)})
+
+
+if __name__ == "__main__":
+    main()
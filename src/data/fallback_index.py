@@ -0,0 +1,343 @@
+from typing import List, Dict, Any, Optional
+import os
+import json
+import threading
+from loguru import logger
+
+# 初始容量（行），容量不足时按倍数扩容
+INITIAL_CAPACITY = 1024
+
+
+def match_where(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """判断元数据是否满足Chroma风格的where条件
+
+    支持等值、$eq/$ne/$in/$nin/$gt/$gte/$lt/$lte 以及 $and/$or 组合。
+    """
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(match_where(metadata, c) for c in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(match_where(metadata, c) for c in condition):
+                return False
+            continue
+
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        for op, expected in condition.items():
+            if op == "$eq" and value != expected:
+                return False
+            if op == "$ne" and value == expected:
+                return False
+            if op == "$in" and value not in expected:
+                return False
+            if op == "$nin" and value in expected:
+                return False
+            if op in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None:
+                    return False
+                if op == "$gt" and not value > expected:
+                    return False
+                if op == "$gte" and not value >= expected:
+                    return False
+                if op == "$lt" and not value < expected:
+                    return False
+                if op == "$lte" and not value <= expected:
+                    return False
+    return True
+
+
+class IndexMismatchError(ValueError):
+    """已有索引由不同的embedder（或不同维度）生成，向量之间不可比"""
+
+
+class NumpyIndex:
+    """Chroma不可用时的内存向量索引
+
+    向量保存在一块连续的float32矩阵中，查询只需一次矩阵-向量乘法加
+    argpartition取top-k；矩阵落盘为memmap文件，记录以追加方式写入JSONL。
+    接口与Chroma集合的 add/upsert/query/get/count/delete 保持一致。
+    元数据中记录生成向量的embedder标识；传入 embedder_id/dim 时，
+    与已有索引不一致会抛出 IndexMismatchError。
+    """
+
+    def __init__(self, directory: str, embedder, space: str = "l2", read_only: bool = False,
+                 embedder_id: Optional[str] = None, dim: Optional[int] = None):
+        import numpy as np
+
+        self.directory = directory
+        self.embedder = embedder
+        self.space = space
+        self.read_only = read_only
+        self.embedder_id = embedder_id
+        self._lock = threading.RLock()
+
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._records_path = os.path.join(directory, "records.jsonl")
+        self._meta_path = os.path.join(directory, "meta.json")
+
+        self.dim = None
+        self._capacity = 0
+        self._size = 0
+        self._vectors = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        self._expected_dim = dim
+
+        if not read_only:
+            os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    # ---------- 持久化 ----------
+
+    def _load(self):
+        """从磁盘恢复索引"""
+        import numpy as np
+
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        recorded = meta.get("embedder")
+        if self.embedder_id and recorded and recorded != self.embedder_id:
+            raise IndexMismatchError(f"索引由 {recorded} 生成，当前embedder为 {self.embedder_id}")
+        if self._expected_dim and meta["dim"] != self._expected_dim:
+            raise IndexMismatchError(f"向量维度不一致: 索引为 {meta['dim']}, 当前embedder为 {self._expected_dim}")
+        self.embedder_id = self.embedder_id or recorded
+        self.dim = meta["dim"]
+        self._capacity = meta["capacity"]
+        mode = "r" if self.read_only else "r+"
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode=mode, shape=(self._capacity, self.dim))
+        self._alive = np.zeros(self._capacity, dtype=bool)
+
+        # 回放记录：同一ID后写覆盖先写，deleted记录标记为删除
+        if os.path.exists(self._records_path):
+            with open(self._records_path, encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    row = record["row"]
+                    while len(self._ids) <= row:
+                        self._ids.append("")
+                        self._documents.append("")
+                        self._metadatas.append({})
+                    if record.get("deleted"):
+                        self._alive[row] = False
+                        self._rows.pop(record["id"], None)
+                        continue
+                    self._ids[row] = record["id"]
+                    self._documents[row] = record["document"]
+                    self._metadatas[row] = record["metadata"]
+                    self._alive[row] = True
+                    self._rows[record["id"]] = row
+        self._size = len(self._ids)
+        logger.info(f"已加载备用向量索引: {self.count()} 条, 维度 {self.dim}")
+
+    def _write_meta(self):
+        tmp_path = self._meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "capacity": self._capacity, "space": self.space, "embedder": self.embedder_id}, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def _ensure_capacity(self, needed: int, dim: int):
+        """保证矩阵至少能容纳needed行，不足时扩容并迁移数据"""
+        import numpy as np
+
+        if self.dim is None:
+            self.dim = dim
+        elif self.dim != dim:
+            raise ValueError(f"向量维度不一致: 索引为 {self.dim}, 写入为 {dim}")
+
+        if needed <= self._capacity:
+            return
+        capacity = max(INITIAL_CAPACITY, self._capacity)
+        while capacity < needed:
+            capacity *= 2
+
+        tmp_path = self._vectors_path + ".tmp"
+        vectors = np.memmap(tmp_path, dtype=np.float32, mode="w+", shape=(capacity, self.dim))
+        if self._vectors is not None and self._size:
+            vectors[:self._size] = self._vectors[:self._size]
+        vectors.flush()
+        del vectors
+        self._vectors = None
+        os.replace(tmp_path, self._vectors_path)
+
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive[:capacity]
+        self._alive = alive
+        self._capacity = capacity
+        self._write_meta()
+
+    # ---------- 写入 ----------
+
+    def _embed(self, documents: List[str]):
+        import numpy as np
+        return np.asarray(self.embedder.encode(list(documents)), dtype=np.float32)
+
+    def upsert(
+        self,
+        ids: List[str],
+        documents: Optional[List[str]] = None,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        embeddings: Optional[List[List[float]]] = None
+    ):
+        """写入或覆盖条目"""
+        import numpy as np
+
+        if self.read_only:
+            raise PermissionError("只读索引不支持写入")
+        documents = documents or [""] * len(ids)
+        metadatas = metadatas or [{} for _ in ids]
+        vectors = np.asarray(embeddings, dtype=np.float32) if embeddings is not None else self._embed(documents)
+
+        with self._lock:
+            new_rows = sum(1 for id in dict.fromkeys(ids) if id not in self._rows)
+            self._ensure_capacity(self._size + new_rows, vectors.shape[1])
+
+            with open(self._records_path, "a", encoding="utf-8") as f:
+                for id, document, metadata, vector in zip(ids, documents, metadatas, vectors):
+                    row = self._rows.get(id)
+                    if row is None:
+                        row = self._size
+                        self._size += 1
+                        self._ids.append(id)
+                        self._documents.append(document)
+                        self._metadatas.append(metadata or {})
+                        self._rows[id] = row
+                    else:
+                        self._documents[row] = document
+                        self._metadatas[row] = metadata or {}
+                    self._vectors[row] = vector
+                    self._alive[row] = True
+                    f.write(json.dumps(
+                        {"id": id, "row": row, "document": document, "metadata": metadata or {}},
+                        ensure_ascii=False
+                    ) + "\n")
+            self._vectors.flush()
+
+    # 备用索引下add与upsert语义相同
+    add = upsert
+
+    def delete(self, ids: List[str]):
+        """删除条目（行保留，仅标记为无效）"""
+        if self.read_only:
+            raise PermissionError("只读索引不支持删除")
+        with self._lock, open(self._records_path, "a", encoding="utf-8") as f:
+            for id in ids:
+                row = self._rows.pop(id, None)
+                if row is None:
+                    continue
+                self._alive[row] = False
+                f.write(json.dumps({"id": id, "row": row, "deleted": True}) + "\n")
+
+    # ---------- 读取 ----------
+
+    def count(self) -> int:
+        return len(self._rows)
+
+    def _candidate_mask(self, where: Optional[Dict[str, Any]]):
+        """返回满足条件的行掩码"""
+        import numpy as np
+
+        mask = self._alive[:self._size].copy()
+        if where:
+            matches = np.fromiter(
+                (match_where(meta, where) for meta in self._metadatas),
+                dtype=bool,
+                count=self._size
+            )
+            mask &= matches
+        return mask
+
+    def _scores_to_distances(self, scores):
+        """与Chroma的距离定义保持一致（向量均已归一化）"""
+        if self.space in ("cosine", "ip"):
+            return 1.0 - scores
+        return 2.0 - 2.0 * scores
+
+    def query(
+        self,
+        query_texts: Optional[List[str]] = None,
+        query_embeddings: Optional[List[List[float]]] = None,
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """top-k 查询，返回与Chroma相同结构的结果"""
+        import numpy as np
+
+        queries = (
+            np.asarray(query_embeddings, dtype=np.float32)
+            if query_embeddings is not None
+            else self._embed(query_texts or [])
+        )
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+
+        with self._lock:
+            if not self._size or self._vectors is None:
+                for _ in range(len(queries)):
+                    for key in result:
+                        result[key].append([])
+                return result
+
+            mask = self._candidate_mask(where)
+            n_candidates = int(mask.sum())
+            matrix = self._vectors[:self._size]
+
+            for query in queries:
+                if not n_candidates:
+                    for key in result:
+                        result[key].append([])
+                    continue
+                # 一次矩阵-向量乘法 + argpartition 取 top-k；
+                # 不满足条件的行置为 -inf，避免为筛选复制整块矩阵
+                scores = matrix @ query
+                scores[~mask] = -np.inf
+                k = min(n_results, n_candidates)
+                top = np.argpartition(-scores, k - 1)[:k]
+                top = top[np.argsort(-scores[top])]
+
+                result["ids"].append([self._ids[r] for r in top])
+                result["documents"].append([self._documents[r] for r in top])
+                result["metadatas"].append([self._metadatas[r] for r in top])
+                result["distances"].append(self._scores_to_distances(scores[top]).tolist())
+        return result
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """按ID或元数据条件读取条目"""
+        with self._lock:
+            if ids is not None:
+                rows = [self._rows[id] for id in ids if id in self._rows]
+                rows = [r for r in rows if match_where(self._metadatas[r], where)]
+            else:
+                import numpy as np
+                rows = np.flatnonzero(self._candidate_mask(where)).tolist()
+            if offset:
+                rows = rows[offset:]
+            if limit is not None:
+                rows = rows[:limit]
+            result = {
+                "ids": [self._ids[r] for r in rows],
+                "documents": [self._documents[r] for r in rows],
+                "metadatas": [self._metadatas[r] for r in rows],
+            }
+            if include and "embeddings" in include:
+                result["embeddings"] = [self._vectors[r].tolist() for r in rows]
+            return result
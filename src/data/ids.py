@@ -0,0 +1,19 @@
+import hashlib
+
+# 默认命名空间
+DEFAULT_NAMESPACE = "default"
+
+
+def content_hash(text: str) -> str:
+    """文本内容哈希，空白字符归一化后计算，用于去重"""
+    normalized = " ".join(text.split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def make_content_id(text: str, namespace: str = DEFAULT_NAMESPACE) -> str:
+    """由命名空间和内容哈希生成稳定ID
+
+    相同内容在同一命名空间内总是得到相同ID，重试或重复写入会覆盖而不是追加。
+    """
+    digest = hashlib.sha256(f"{namespace}\x00{content_hash(text)}".encode("utf-8")).hexdigest()
+    return digest[:32]
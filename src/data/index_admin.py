@@ -0,0 +1,313 @@
+from typing import List, Dict, Any, Optional
+import os
+import re
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+from loguru import logger
+
+# Chroma段目录以UUID命名
+_SEGMENT_DIR_PATTERN = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+# 早期版本遗留的独立存储目录
+LEGACY_STORES = ["./chroma_db"]
+
+
+def _dir_size(path: str) -> int:
+    """目录占用的字节数"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _referenced_segments(persist_directory: str) -> set:
+    """读取chroma.sqlite3中登记的段ID
+
+    目录（chroma.sqlite3 或其中的 segments 表）不存在或无法读取时抛出异常：
+    没有目录不等于没有被引用的段，否则所有段目录都会被当作孤立目录删除。
+    """
+    db_path = os.path.join(persist_directory, "chroma.sqlite3")
+    if not os.path.exists(db_path):
+        raise RuntimeError(f"找不到 {db_path}，无法判断哪些段目录仍被引用")
+    try:
+        with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) as conn:
+            return {row[0] for row in conn.execute("SELECT id FROM segments")}
+    except sqlite3.Error as e:
+        raise RuntimeError(f"读取 {db_path} 的段目录失败: {str(e)}") from e
+
+
+def find_orphan_segments(persist_directory: str) -> List[str]:
+    """找出磁盘上存在但未被任何集合引用的段目录（目录无法读取时抛出 RuntimeError）"""
+    referenced = _referenced_segments(persist_directory)
+    orphans = []
+    for name in os.listdir(persist_directory):
+        path = os.path.join(persist_directory, name)
+        if os.path.isdir(path) and _SEGMENT_DIR_PATTERN.match(name) and name not in referenced:
+            orphans.append(path)
+    return sorted(orphans)
+
+
+def gc_orphans(persist_directory: str, dry_run: bool = True, remove_legacy: bool = False) -> Dict[str, Any]:
+    """清理孤立的段目录（以及可选的遗留存储目录）"""
+    orphans = find_orphan_segments(persist_directory)
+    legacy = [
+        path for path in LEGACY_STORES
+        if os.path.isdir(path) and os.path.abspath(path) != os.path.abspath(persist_directory)
+    ] if remove_legacy else []
+
+    targets = orphans + legacy
+    freed = sum(_dir_size(path) for path in targets)
+    if not dry_run:
+        for path in targets:
+            shutil.rmtree(path)
+            logger.info(f"已删除: {path}")
+    return {"orphan_segments": orphans, "legacy_stores": legacy, "bytes": freed, "dry_run": dry_run}
+
+
+def _iter_embeddings(collection, batch_size: int, include: List[str]):
+    """分批读取集合全部数据"""
+    offset = 0
+    while True:
+        batch = collection.get(include=include, limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            return
+        yield batch
+        offset += len(batch["ids"])
+
+
+def _exact_topk(collection, queries, k: int, space: str, batch_size: int) -> List[List[str]]:
+    """暴力计算精确的top-k，作为召回率的参照"""
+    import numpy as np
+
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    best_ids = np.empty((len(queries), 0), dtype=object)
+    query_norms = (queries ** 2).sum(axis=1, keepdims=True)
+
+    for batch in _iter_embeddings(collection, batch_size, ["embeddings"]):
+        vectors = np.asarray(batch["embeddings"], dtype=np.float32)
+        if space == "l2":
+            # 分数取负的平方L2距离，越大越近
+            scores = 2 * queries @ vectors.T - (vectors ** 2).sum(axis=1) - query_norms
+        else:
+            scores = queries @ vectors.T
+        ids = np.array(batch["ids"], dtype=object)
+
+        all_scores = np.concatenate([best_scores, scores], axis=1)
+        all_ids = np.concatenate([best_ids, np.broadcast_to(ids, scores.shape)], axis=1)
+        keep = min(k, all_scores.shape[1])
+        top = np.argpartition(-all_scores, keep - 1, axis=1)[:, :keep]
+        best_scores = np.take_along_axis(all_scores, top, axis=1)
+        best_ids = np.take_along_axis(all_ids, top, axis=1)
+
+    return [list(row) for row in best_ids]
+
+
+def _partitions(store) -> List[Any]:
+    """需要维护的分区：metadata 模式下所有分区共用公共集合，只返回公共分区"""
+    seen = set()
+    partitions = []
+    for key in store.list_partitions():
+        part = store._partition(key, create=False)
+        if part is None or part.name in seen:
+            continue
+        seen.add(part.name)
+        partitions.append(part)
+    return partitions
+
+
+def _collection_report(collection, space: str, k: int, samples: int, batch_size: int) -> Dict[str, Any]:
+    """单个集合的规模、recall@k 和查询延迟"""
+    import numpy as np
+
+    count = collection.count()
+    report: Dict[str, Any] = {"count": count}
+    if count == 0:
+        return report
+
+    # 随机抽取已存储的向量作为查询
+    rng = np.random.default_rng(0)
+    offsets = rng.choice(count, size=min(samples, count), replace=False)
+    queries = np.asarray(
+        [collection.get(include=["embeddings"], limit=1, offset=int(o))["embeddings"][0] for o in offsets],
+        dtype=np.float32
+    )
+
+    k = min(k, count)
+    latencies = []
+    approx = []
+    for query in queries:
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])
+        latencies.append((time.perf_counter() - start) * 1000)
+        approx.append(result["ids"][0])
+
+    exact = _exact_topk(collection, queries, k, space, batch_size)
+    recall = float(np.mean([len(set(a) & set(e)) / k for a, e in zip(approx, exact)]))
+
+    report.update({
+        f"recall@{k}": round(recall, 4),
+        "query_ms_p50": round(float(np.percentile(latencies, 50)), 2),
+        "query_ms_p95": round(float(np.percentile(latencies, 95)), 2),
+        "samples": len(queries),
+    })
+    return report
+
+
+def index_report(store, k: int = 10, samples: int = 100, batch_size: int = 5000) -> Dict[str, Any]:
+    """统计索引规模，并按分区测量 recall@k 和查询延迟"""
+    try:
+        orphans = find_orphan_segments(store.persist_directory)
+    except RuntimeError as e:
+        orphans = {"error": str(e)}
+    report = {
+        **store.get_collection_stats(),
+        "persist_directory": store.persist_directory,
+        "disk_bytes": _dir_size(store.persist_directory),
+        "orphan_segments": orphans,
+        "legacy_stores": [path for path in LEGACY_STORES if os.path.isdir(path)],
+        "partitions": {},
+    }
+    for part in _partitions(store):
+        report["partitions"][part.key] = {
+            "collection": part.name,
+            **_collection_report(part.collection, store.space, k, samples, batch_size),
+        }
+    return report
+
+
+def rebuild_collection(store, params: Optional[Dict[str, Any]] = None, batch_size: Optional[int] = None,
+                       partition: Optional[str] = None) -> Dict[str, Any]:
+    """按配置（或指定参数）重建一个分区集合的HNSW索引
+
+    先把数据复制到临时集合，再交换名称，最后删除旧集合；
+    复制过程中旧集合始终可用。重建同时起到压缩作用，删除留下的空洞会被清除。
+    """
+    from .vector_store import DEFAULT_PARTITION
+
+    part = store._partition(partition)
+    old = part.collection
+    name = part.name
+    tmp_name = f"{name}__rebuild"
+    old_name = f"{name}__old"
+    metadata = {**store.hnsw_metadata(), **(params or {})}
+    if part.key != DEFAULT_PARTITION:
+        metadata["partition"] = part.key
+    batch_size = batch_size or store.max_batch_size()
+
+    for stale in (tmp_name, old_name):
+        try:
+            store.db.delete_collection(stale)
+        except Exception:
+            pass
+
+    new = store.db.create_collection(
+        name=tmp_name,
+        embedding_function=store._embedding_function,
+        metadata=metadata
+    )
+    copied = 0
+    start = time.perf_counter()
+    for batch in _iter_embeddings(old, batch_size, ["embeddings", "documents", "metadatas"]):
+        new.add(
+            ids=batch["ids"],
+            embeddings=batch["embeddings"],
+            documents=batch["documents"],
+            metadatas=batch["metadatas"]
+        )
+        copied += len(batch["ids"])
+        logger.info(f"{name}: 已复制 {copied} 条")
+
+    old.modify(name=old_name)
+    new.modify(name=name)
+    store.db.delete_collection(old_name)
+    part.collection = new
+    if part.key == DEFAULT_PARTITION:
+        store.collection = new
+        store._check_hnsw_params()
+
+    return {"collection": name, "partition": part.key, "copied": copied, "hnsw": metadata,
+            "seconds": round(time.perf_counter() - start, 2)}
+
+
+def rebuild_all(store, params: Optional[Dict[str, Any]] = None, batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+    """依次重建所有分区的集合"""
+    return [rebuild_collection(store, params, batch_size, part.key) for part in _partitions(store)]
+
+
+def vacuum(persist_directory: str) -> Dict[str, Any]:
+    """回收chroma.sqlite3中已删除数据占用的空间"""
+    db_path = os.path.join(persist_directory, "chroma.sqlite3")
+    before = os.path.getsize(db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("VACUUM")
+    return {"sqlite_bytes_before": before, "sqlite_bytes_after": os.path.getsize(db_path)}
+
+
+def main(argv: Optional[List[str]] = None):
+    """索引维护命令行入口"""
+    import yaml
+    from .vector_store import VectorStore
+
+    parser = argparse.ArgumentParser(description="向量索引维护：报告、重建、压缩、清理")
+    parser.add_argument("command", choices=["report", "rebuild", "compact", "gc"])
+    parser.add_argument("--config", default="config/config.yaml")
+    parser.add_argument("--k", type=int, default=10, help="recall@k 中的k")
+    parser.add_argument("--samples", type=int, default=100, help="测量召回率的查询数")
+    parser.add_argument("--space", choices=["l2", "cosine", "ip"])
+    parser.add_argument("--m", type=int)
+    parser.add_argument("--construction-ef", type=int)
+    parser.add_argument("--search-ef", type=int)
+    parser.add_argument("--apply", action="store_true", help="gc时实际删除（默认只列出）")
+    parser.add_argument("--remove-legacy", action="store_true", help="gc时同时删除遗留的 ./chroma_db")
+    args = parser.parse_args(argv)
+
+    with open(args.config) as f:
+        config = yaml.safe_load(f)["vector_store"]
+
+    if args.command == "gc":
+        try:
+            result = gc_orphans(
+                config.get("persist_directory", "./data/chroma"),
+                dry_run=not args.apply,
+                remove_legacy=args.remove_legacy
+            )
+        except RuntimeError as e:
+            raise SystemExit(f"拒绝清理: {str(e)}")
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+
+    store = VectorStore(config)
+    if store.db is None:
+        raise SystemExit("Chroma不可用，无法维护索引")
+
+    if args.command == "report":
+        result = index_report(store, k=args.k, samples=args.samples)
+    else:
+        params = {
+            key: value for key, value in (
+                ("hnsw:space", args.space),
+                ("hnsw:M", args.m),
+                ("hnsw:construction_ef", args.construction_ef),
+                ("hnsw:search_ef", args.search_ef),
+            ) if value is not None
+        }
+        result = {"collections": rebuild_all(store, params)}
+        if args.command == "compact":
+            result.update(vacuum(store.persist_directory))
+            try:
+                result["gc"] = gc_orphans(store.persist_directory, dry_run=False)
+            except RuntimeError as e:
+                logger.error(f"跳过孤立段清理: {str(e)}")
+                result["gc"] = {"error": str(e)}
+    print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
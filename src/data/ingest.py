@@ -0,0 +1,425 @@
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+import os
+import json
+import time
+import argparse
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from loguru import logger
+from .ids import make_content_id
+
+# 支持导入的文件类型
+TEXT_SUFFIXES = {".txt", ".text"}
+MARKDOWN_SUFFIXES = {".md", ".markdown"}
+JSONL_SUFFIXES = {".jsonl"}
+PDF_SUFFIXES = {".pdf"}
+SUPPORTED_SUFFIXES = TEXT_SUFFIXES | MARKDOWN_SUFFIXES | JSONL_SUFFIXES | PDF_SUFFIXES
+
+# JSONL中依次尝试的正文字段
+JSONL_TEXT_FIELDS = ("text", "content", "abstract", "body")
+
+# 分块时优先断开的位置
+BREAK_CHARS = ("\n\n", "\n", "。", "！", "？", ". ", "! ", "? ", "；", "; ")
+
+# 子进程内的embedder，由 _init_worker 初始化
+_WORKER_EMBEDDER = None
+
+
+def _init_worker(backend: str, model_path: str, num_threads: Optional[int]):
+    """子进程初始化：每个进程只加载一次模型"""
+    global _WORKER_EMBEDDER
+    from .embeddings import create_embedder
+    _WORKER_EMBEDDER = create_embedder(backend, model_path, num_threads=num_threads)
+
+
+def _embed_batch(texts: List[str]):
+    """在子进程中编码一个批次"""
+    return _WORKER_EMBEDDER.encode(texts)
+
+
+def chunk_text(text: str, chunk_size: int = 800, overlap: int = 100) -> List[str]:
+    """按字符长度切分文本，块之间保留重叠
+
+    切分点优先落在段落、换行或句末标点上，找不到时才硬切。
+    """
+    text = text.strip()
+    if not text:
+        return []
+    if len(text) <= chunk_size:
+        return [text]
+
+    overlap = min(overlap, chunk_size // 2)
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # 在块的后 1/4 范围内寻找自然断点
+            window_start = start + chunk_size * 3 // 4
+            for sep in BREAK_CHARS:
+                pos = text.rfind(sep, window_start, end)
+                if pos != -1:
+                    end = pos + len(sep)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def _scalar_metadata(record: Dict[str, Any]) -> Dict[str, Any]:
+    """只保留Chroma支持的标量元数据"""
+    return {
+        k: v for k, v in record.items()
+        if k not in JSONL_TEXT_FIELDS and isinstance(v, (str, int, float, bool))
+    }
+
+
+def read_documents(path: str, skip: int = 0) -> Iterator[Tuple[int, str, Dict[str, Any]]]:
+    """逐个读取文件中的文档
+
+    Args:
+        path: 文件路径
+        skip: 跳过前若干个文档（断点续传用）
+
+    Yields:
+        (文档序号, 文本, 元数据)
+    """
+    suffix = os.path.splitext(path)[1].lower()
+    title = os.path.splitext(os.path.basename(path))[0]
+
+    if suffix in JSONL_SUFFIXES:
+        with open(path, encoding="utf-8") as f:
+            for doc_index, line in enumerate(f):
+                if doc_index < skip:
+                    continue
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"跳过无法解析的JSONL行: {path}:{doc_index + 1}")
+                    continue
+                text = next((record[k] for k in JSONL_TEXT_FIELDS if isinstance(record.get(k), str)), "")
+                if text:
+                    yield doc_index, text, _scalar_metadata(record)
+        return
+
+    if skip > 0:
+        return
+
+    if suffix in PDF_SUFFIXES:
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            logger.warning(f"未安装pypdf，跳过PDF文件: {path}")
+            return
+        reader = PdfReader(path)
+        text = "\n\n".join(page.extract_text() or "" for page in reader.pages)
+        yield 0, text, {"title": title}
+        return
+
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        yield 0, f.read(), {"title": title}
+
+
+def discover_files(paths: List[str]) -> List[str]:
+    """展开目录，返回排好序的待导入文件列表"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in names:
+                    if os.path.splitext(name)[1].lower() in SUPPORTED_SUFFIXES:
+                        files.append(os.path.join(root, name))
+        elif os.path.splitext(path)[1].lower() in SUPPORTED_SUFFIXES:
+            files.append(path)
+        else:
+            logger.warning(f"跳过不支持的文件: {path}")
+    return sorted(set(files))
+
+
+class IngestCheckpoint:
+    """导入进度检查点，记录每个文件已提交的文档数"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.files: Dict[str, Dict[str, Any]] = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+
+    @staticmethod
+    def _fingerprint(path: str) -> Dict[str, Any]:
+        stat = os.stat(path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def resume_from(self, path: str) -> Optional[int]:
+        """返回该文件应跳过的文档数；文件已完成时返回None"""
+        entry = self.files.get(path)
+        if not entry or {k: entry.get(k) for k in ("size", "mtime")} != self._fingerprint(path):
+            return 0
+        if entry.get("complete"):
+            return None
+        return entry.get("committed_docs", 0)
+
+    def commit(self, path: str, committed_docs: int, complete: bool = False):
+        entry = self.files.setdefault(path, self._fingerprint(path))
+        entry["committed_docs"] = max(entry.get("committed_docs", 0), committed_docs)
+        entry["complete"] = complete
+
+    def save(self):
+        """原子写入检查点文件"""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files, "updated_at": datetime.now().isoformat()}, f)
+        os.replace(tmp_path, self.path)
+
+
+class BulkIngestor:
+    """文献语料批量导入管道
+
+    读取 -> 分块 -> 去重 -> 多进程批量embedding -> 分批写入Chroma，
+    每次写入成功后更新检查点，中断后可以从检查点继续。
+    """
+
+    def __init__(
+        self,
+        store,
+        chunk_size: int = 800,
+        overlap: int = 100,
+        embed_batch_size: int = 256,
+        write_batch_size: int = 2000,
+        workers: int = 0,
+        checkpoint_path: Optional[str] = None,
+        doc_type: str = "literature",
+        partition: Optional[str] = None
+    ):
+        self.store = store
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.embed_batch_size = embed_batch_size
+        self.write_batch_size = write_batch_size
+        self.workers = workers
+        self.checkpoint = IngestCheckpoint(checkpoint_path)
+        self.doc_type = doc_type
+        self.partition = partition
+
+        self._seen = set()
+        self._total_docs: Dict[str, int] = {}
+        self.stats = {"files": 0, "documents": 0, "chunks": 0, "duplicates": 0, "existing": 0, "written": 0}
+
+    def _iter_chunks(self, files: List[str]) -> Iterator[Dict[str, Any]]:
+        """按顺序产出待embedding的块"""
+        created_at = datetime.now().isoformat()
+        for path in files:
+            skip = self.checkpoint.resume_from(path)
+            if skip is None:
+                logger.info(f"跳过已完成的文件: {path}")
+                continue
+
+            self.stats["files"] += 1
+            last_doc = skip - 1
+            for doc_index, text, meta in read_documents(path, skip=skip):
+                self.stats["documents"] += 1
+                last_doc = doc_index
+                chunks = chunk_text(text, self.chunk_size, self.overlap)
+                for chunk_index, chunk in enumerate(chunks):
+                    chunk_id = make_content_id(chunk, namespace=self.doc_type)
+                    is_last = chunk_index == len(chunks) - 1
+                    if chunk_id in self._seen:
+                        self.stats["duplicates"] += 1
+                        chunk = None
+                    else:
+                        self._seen.add(chunk_id)
+                    yield {
+                        "id": chunk_id,
+                        "text": chunk,
+                        "source": path,
+                        "doc_index": doc_index,
+                        "last_in_doc": is_last,
+                        "metadata": {
+                            **meta,
+                            "type": self.doc_type,
+                            "source": path,
+                            "doc_index": doc_index,
+                            "chunk_index": chunk_index,
+                            "created_at": created_at,
+                            **({"session_id": self.partition} if self.partition else {})
+                        }
+                    }
+            # 文件读完后才能确定总文档数
+            self._total_docs[path] = last_doc + 1
+            yield {"id": None, "text": None, "source": path, "doc_index": last_doc, "last_in_doc": True, "eof": True}
+
+    def _batches(self, files: List[str]) -> Iterator[List[Dict[str, Any]]]:
+        """按embedding批大小聚合块"""
+        batch = []
+        for item in self._iter_chunks(files):
+            batch.append(item)
+            if sum(1 for x in batch if x["text"]) >= self.embed_batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _filter_existing(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """去掉集合中已存在的块（重复运行或断点续传时避免重复embedding）"""
+        ids = [x["id"] for x in batch if x["text"]]
+        if not ids:
+            return batch
+        existing = self.store.existing_ids(ids, partition=self.partition)
+        if existing:
+            self.stats["existing"] += len(existing)
+            for x in batch:
+                if x["id"] in existing:
+                    x["text"] = None
+        return batch
+
+    def _mark_committed(self, items: List[Dict[str, Any]]):
+        """根据已写入的块推进检查点"""
+        for x in items:
+            if not x["last_in_doc"]:
+                continue
+            path = x["source"]
+            committed = x["doc_index"] + 1
+            complete = x.get("eof", False) or self._total_docs.get(path) == committed
+            self.checkpoint.commit(path, committed, complete=complete)
+        self.checkpoint.save()
+
+    def _flush(self, pending: List[Tuple[Dict[str, Any], Any]], markers: List[Dict[str, Any]]):
+        """把已完成embedding的块分批写入向量库"""
+        max_batch = min(self.write_batch_size, self.store.max_batch_size())
+        for start in range(0, len(pending), max_batch):
+            part = pending[start:start + max_batch]
+            self.store.upsert_embeddings(
+                ids=[x["id"] for x, _ in part],
+                texts=[x["text"] for x, _ in part],
+                embeddings=[v.tolist() for _, v in part],
+                metadatas=[x["metadata"] for x, _ in part],
+                partition=self.partition
+            )
+            self.stats["written"] += len(part)
+        self._mark_committed(markers)
+
+    def run(self, paths: List[str]) -> Dict[str, Any]:
+        """执行导入，返回统计信息"""
+        files = discover_files(paths)
+        logger.info(f"待导入文件 {len(files)} 个")
+        start = time.perf_counter()
+
+        executor = None
+        if self.workers > 0:
+            # 每个进程分到的线程数，避免多个进程争抢同一批核心
+            config = self.store.embedding_config()
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(config["backend"], config["model_path"], threads)
+            )
+
+        def submit(texts):
+            if not texts:
+                # 没有待编码的块（都已存在，或只有文件结束标记）：仍然排队，以保持检查点顺序
+                if executor:
+                    done = Future()
+                    done.set_result([])
+                    return done
+                return []
+            if executor:
+                return executor.submit(_embed_batch, texts)
+            return self.store.embedding_model.encode(texts)
+
+        in_flight = deque()
+        pending: List[Tuple[Dict[str, Any], Any]] = []
+        markers: List[Dict[str, Any]] = []
+        max_in_flight = max(1, self.workers * 2)
+
+        def drain(block_all: bool):
+            # 按提交顺序取回结果，保证检查点只会单调前进
+            while in_flight and (block_all or len(in_flight) >= max_in_flight):
+                batch, future = in_flight.popleft()
+                vectors = future.result() if executor else future
+                live = [x for x in batch if x["text"]]
+                pending.extend(zip(live, vectors))
+                markers.extend(batch)
+                if len(pending) >= self.write_batch_size:
+                    self._flush(pending, markers)
+                    pending.clear()
+                    markers.clear()
+                    self._log_progress(start)
+
+        try:
+            for batch in self._batches(files):
+                batch = self._filter_existing(batch)
+                texts = [x["text"] for x in batch if x["text"]]
+                self.stats["chunks"] += len(texts)
+                in_flight.append((batch, submit(texts)))
+                drain(block_all=False)
+            drain(block_all=True)
+            if pending or markers:
+                self._flush(pending, markers)
+        finally:
+            if executor:
+                executor.shutdown()
+
+        self.stats["seconds"] = round(time.perf_counter() - start, 2)
+        logger.info(f"导入完成: {self.stats}")
+        return self.stats
+
+    def _log_progress(self, start: float):
+        elapsed = time.perf_counter() - start
+        rate = self.stats["written"] / elapsed if elapsed else 0
+        logger.info(
+            f"已写入 {self.stats['written']} 块 / {self.stats['documents']} 篇文档，"
+            f"{rate:.0f} 块/秒"
+        )
+
+
+def main(argv: Optional[List[str]] = None):
+    """批量导入命令行入口"""
+    import yaml
+    from .vector_store import VectorStore
+
+    parser = argparse.ArgumentParser(description="批量导入文献语料到向量库")
+    parser.add_argument("paths", nargs="+", help="文件或目录（支持 pdf/md/txt/jsonl）")
+    parser.add_argument("--config", default="config/config.yaml")
+    parser.add_argument("--checkpoint", default="data/ingest_checkpoint.json")
+    parser.add_argument("--chunk-size", type=int, default=800)
+    parser.add_argument("--overlap", type=int, default=100)
+    parser.add_argument("--embed-batch-size", type=int, default=256)
+    parser.add_argument("--write-batch-size", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--type", default="literature", help="写入元数据的 type 字段")
+    parser.add_argument("--partition", help="写入的分区（会话/租户），默认公共分区")
+    args = parser.parse_args(argv)
+
+    with open(args.config) as f:
+        config = yaml.safe_load(f)
+
+    store = VectorStore(config["vector_store"])
+    ingestor = BulkIngestor(
+        store,
+        chunk_size=args.chunk_size,
+        overlap=args.overlap,
+        embed_batch_size=args.embed_batch_size,
+        write_batch_size=args.write_batch_size,
+        workers=args.workers,
+        checkpoint_path=args.checkpoint,
+        doc_type=args.type,
+        partition=args.partition
+    )
+    print(json.dumps(ingestor.run(args.paths), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+from typing import List, Dict, Any, Optional, Tuple
+import os
+import sqlite3
+import threading
+from loguru import logger
+
+
+class MetadataIndex:
+    """向量库旁路的元数据索引
+
+    Chroma 的 where 过滤不支持排序，按时间取最近N条只能全量读出后再排。
+    这里用 SQLite 维护 (collection, type, session_id, created_at) 复合索引，
+    “最近N条”查询只走索引，不需要做任何embedding。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                id TEXT NOT NULL,
+                collection TEXT NOT NULL,
+                type TEXT,
+                session_id TEXT,
+                created_at TEXT,
+                PRIMARY KEY (collection, id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_type_session_created
+                ON entries (collection, type, session_id, created_at DESC);
+            CREATE INDEX IF NOT EXISTS idx_entries_type_created
+                ON entries (collection, type, created_at DESC);
+            CREATE TABLE IF NOT EXISTS partitions (
+                key TEXT PRIMARY KEY,
+                collection TEXT NOT NULL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        self._conn.commit()
+
+    def add(self, collection: str, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """写入或覆盖索引条目"""
+        rows = [
+            (
+                id,
+                collection,
+                (meta or {}).get("type"),
+                (meta or {}).get("session_id"),
+                (meta or {}).get("created_at")
+            )
+            for id, meta in zip(ids, metadatas)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (id, collection, type, session_id, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def delete(self, collection: str, ids: List[str]):
+        """删除索引条目"""
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM entries WHERE collection = ? AND id = ?",
+                [(collection, id) for id in ids]
+            )
+            self._conn.commit()
+
+    def latest(
+        self,
+        collection: str,
+        doc_type: Optional[str] = None,
+        session_id: Optional[str] = None,
+        limit: int = 10
+    ) -> List[str]:
+        """按 created_at 倒序返回最近的ID列表"""
+        return [id for _, id in self.latest_across([collection], doc_type, session_id, limit)]
+
+    def latest_across(
+        self,
+        collections: List[str],
+        doc_type: Optional[str] = None,
+        session_id: Optional[str] = None,
+        limit: int = 10
+    ) -> List[Tuple[str, str]]:
+        """在多个集合中按 created_at 倒序返回最近的 (集合名, ID) 列表，只做一次查询"""
+        if not collections:
+            return []
+        sql = f"SELECT collection, id FROM entries WHERE collection IN ({', '.join('?' * len(collections))})"
+        params: List[Any] = list(collections)
+        if doc_type is not None:
+            sql += " AND type = ?"
+            params.append(doc_type)
+        if session_id is not None:
+            sql += " AND session_id = ?"
+            params.append(session_id)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            return [(row[0], row[1]) for row in self._conn.execute(sql, params)]
+
+    def count(self, collection: str) -> int:
+        """返回某个集合的索引条目数"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM entries WHERE collection = ?", (collection,)
+            ).fetchone()
+        return row[0]
+
+    def rebuild(self, collection: str, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """用集合中的全量元数据重建索引"""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE collection = ?", (collection,))
+            self._conn.commit()
+        self.add(collection, ids, metadatas)
+        logger.info(f"元数据索引重建完成: {collection}, 共 {len(ids)} 条")
+
+    def register_partition(self, key: str, collection: str):
+        """登记分区键与集合名的对应关系"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO partitions (key, collection) VALUES (?, ?)",
+                (key, collection)
+            )
+            self._conn.commit()
+
+    def partitions(self) -> List[str]:
+        """返回已登记的分区键"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT key FROM partitions ORDER BY key")]
+
+    def partition_collections(self) -> Dict[str, str]:
+        """返回已登记的 分区键 -> 集合名"""
+        with self._lock:
+            return dict(self._conn.execute("SELECT key, collection FROM partitions"))
+
+    def close(self):
+        """关闭连接"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,165 @@
+from typing import List, Dict, Any, Optional
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from loguru import logger
+
+
+class CrossEncoderReranker:
+    """基于本地cross-encoder的二阶段重排
+
+    对候选集的所有 (query, 文档) 对一次性批量推理；打分按
+    (查询哈希, 文档ID) 缓存。根据历史单对耗时预估本次开销，
+    超出延迟预算时直接返回一阶段顺序，保证尾延迟可控。
+    跳过期间每隔 probe_interval_s 秒放行一次重排，重新测量耗时，
+    避免一次偶发的慢调用让重排永久关闭。
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        local_model_path: Optional[str] = None,
+        device: str = "cpu",
+        max_length: int = 512,
+        cache_size: int = 10000,
+        latency_budget_ms: Optional[float] = None,
+        probe_interval_s: float = 30.0
+    ):
+        self.model_name = model_name
+        self.local_model_path = local_model_path
+        self.device = device
+        self.max_length = max_length
+        self.cache_size = cache_size
+        self.latency_budget_ms = latency_budget_ms
+        self.probe_interval_s = probe_interval_s
+
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        self._cache: "OrderedDict[tuple, float]" = OrderedDict()
+        # 单个(query, 文档)对的平均推理耗时（毫秒），指数滑动平均
+        self._ms_per_pair: Optional[float] = None
+        self._last_scored = 0.0
+        self.stats = {"reranked": 0, "skipped": 0, "probes": 0, "cache_hits": 0, "pairs_scored": 0}
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], device: str = "cpu") -> "CrossEncoderReranker":
+        """从 vector_store.reranker 配置创建"""
+        model_name = config.get("model_name", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+        local_root = config.get("local_model_path", "./models/rerankers")
+        return cls(
+            model_name=model_name,
+            local_model_path=os.path.join(local_root, model_name.split("/")[-1]),
+            device=device,
+            max_length=config.get("max_length", 512),
+            cache_size=config.get("cache_size", 10000),
+            latency_budget_ms=config.get("latency_budget_ms"),
+            probe_interval_s=config.get("probe_interval_s", 30.0)
+        )
+
+    def _load_model(self):
+        """首次使用时加载模型，优先使用本地目录"""
+        if self._model is not None:
+            return self._model
+        with self._load_lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+
+                path = self.local_model_path if self.local_model_path and os.path.exists(self.local_model_path) else self.model_name
+                self._model = CrossEncoder(path, device=self.device, max_length=self.max_length)
+                logger.info(f"已加载重排模型: {path}")
+        return self._model
+
+    def warm_up(self):
+        """加载模型并跑一次推理，同时得到初始的单对耗时估计"""
+        self._score("warm up", [("warm-up", "warm up document")])
+
+    def _score(self, query: str, pairs: List[tuple], probe: bool = False) -> List[float]:
+        """对 (文档ID, 文本) 列表打分，所有对放在一个批次中推理
+
+        probe 为True时用本次测量直接替换耗时估计（旧估计已过时）。
+        """
+        model = self._load_model()
+        start = time.perf_counter()
+        scores = model.predict(
+            [(query, text) for _, text in pairs],
+            batch_size=len(pairs),
+            show_progress_bar=False
+        )
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        per_pair = elapsed_ms / len(pairs)
+        if probe or self._ms_per_pair is None:
+            self._ms_per_pair = per_pair
+        else:
+            self._ms_per_pair = 0.8 * self._ms_per_pair + 0.2 * per_pair
+        self._last_scored = time.monotonic()
+        self.stats["pairs_scored"] += len(pairs)
+        return [float(s) for s in scores]
+
+    def _cache_get(self, key: tuple) -> Optional[float]:
+        with self._cache_lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _cache_put(self, key: tuple, score: float):
+        with self._cache_lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def rerank(self, query: str, candidates: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+        """重排候选结果
+
+        Args:
+            query: 查询文本
+            candidates: 一阶段检索结果（需包含 id 和 text）
+            limit: 返回数量
+
+        Returns:
+            List[Dict]: 重排后的结果，带 rerank_score；跳过重排时保持原顺序
+        """
+        if not candidates:
+            return []
+
+        query_hash = hashlib.sha1(query.encode("utf-8")).hexdigest()
+        scores: Dict[str, float] = {}
+        pending = []
+        for item in candidates:
+            cached = self._cache_get((query_hash, item["id"]))
+            if cached is None:
+                pending.append((item["id"], item.get("text") or ""))
+            else:
+                scores[item["id"]] = cached
+        self.stats["cache_hits"] += len(candidates) - len(pending)
+
+        if pending:
+            probe = False
+            # 预估耗时超出预算时跳过重排
+            if (
+                self.latency_budget_ms is not None
+                and self._ms_per_pair is not None
+                and self._ms_per_pair * len(pending) > self.latency_budget_ms
+            ):
+                if time.monotonic() - self._last_scored < self.probe_interval_s:
+                    self.stats["skipped"] += 1
+                    logger.debug(
+                        f"预计重排耗时 {self._ms_per_pair * len(pending):.0f}ms 超出预算 "
+                        f"{self.latency_budget_ms}ms，跳过重排"
+                    )
+                    return candidates[:limit]
+                # 距上次实际打分已超过探测间隔，放行这一次以更新耗时估计
+                self.stats["probes"] += 1
+                probe = True
+
+            for (id, _), score in zip(pending, self._score(query, pending, probe)):
+                scores[id] = score
+                self._cache_put((query_hash, id), score)
+
+        self.stats["reranked"] += 1
+        ranked = sorted(candidates, key=lambda x: scores[x["id"]], reverse=True)
+        return [{**item, "rerank_score": scores[item["id"]]} for item in ranked[:limit]]
@@ -0,0 +1,388 @@
+from typing import List, Dict, Any, Optional
+import os
+import json
+import time
+import shutil
+import argparse
+from array import array
+from datetime import datetime
+from loguru import logger
+from .fallback_index import match_where
+
+# 快照格式版本，格式不兼容时递增
+FORMAT_VERSION = 1
+
+# 列式字符串：<name>.bin 存放UTF-8拼接内容，<name>.off 存放 N+1 个 uint64 偏移
+_STRING_COLUMNS = ("ids", "documents", "metadatas")
+
+
+class _StringColumnWriter:
+    """流式写入一个字符串列"""
+
+    def __init__(self, directory: str, name: str):
+        self._data = open(os.path.join(directory, f"{name}.bin"), "wb")
+        self._offsets_path = os.path.join(directory, f"{name}.off")
+        self._offsets = array("Q", [0])
+
+    def append(self, value: str):
+        encoded = value.encode("utf-8")
+        self._data.write(encoded)
+        self._offsets.append(self._offsets[-1] + len(encoded))
+
+    def close(self):
+        self._data.close()
+        with open(self._offsets_path, "wb") as f:
+            self._offsets.tofile(f)
+
+
+def export_snapshot(
+    collection,
+    directory: str,
+    space: str = "l2",
+    hnsw: Optional[Dict[str, Any]] = None,
+    batch_size: int = 5000,
+    build_bm25: bool = False,
+    build_hnsw: bool = False,
+    embedder: Optional[str] = None
+) -> Dict[str, Any]:
+    """把集合导出为只读快照目录
+
+    先写入临时目录，全部完成后再替换目标目录，读取方不会看到写了一半的快照。
+
+    Args:
+        collection: Chroma集合（或接口相同的索引）
+        directory: 快照目录
+        space: 距离类型，与集合的 hnsw:space 一致
+        hnsw: 集合的HNSW参数，记录到清单中
+        batch_size: 每次从集合读取的条数
+        build_bm25: 是否同时生成BM25索引（hybrid检索用）
+        build_hnsw: 是否同时序列化一份HNSW图（需要hnswlib）
+        embedder: 生成向量所用的embedding后端，打开快照时据此选择查询端embedder
+    """
+    import numpy as np
+    from .index_admin import _iter_embeddings
+
+    start = time.perf_counter()
+    tmp_directory = directory.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+
+    writers = {name: _StringColumnWriter(tmp_directory, name) for name in _STRING_COLUMNS}
+    all_ids: List[str] = []
+    documents: List[str] = [] if build_bm25 else None
+    dim = None
+    with open(os.path.join(tmp_directory, "vectors.f32"), "wb") as vectors_file:
+        for batch in _iter_embeddings(collection, batch_size, ["embeddings", "documents", "metadatas"]):
+            vectors = np.asarray(batch["embeddings"], dtype=np.float32)
+            dim = dim or vectors.shape[1]
+            vectors.tofile(vectors_file)
+            for id, document, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+                writers["ids"].append(id)
+                writers["documents"].append(document or "")
+                writers["metadatas"].append(json.dumps(metadata or {}, ensure_ascii=False))
+                all_ids.append(id)
+                if documents is not None:
+                    documents.append(document or "")
+            logger.info(f"已导出 {len(all_ids)} 条")
+    for writer in writers.values():
+        writer.close()
+
+    # 按ID排序的行号，按ID查找时二分
+    order = np.array(sorted(range(len(all_ids)), key=all_ids.__getitem__), dtype=np.int64)
+    order.tofile(os.path.join(tmp_directory, "id_order.i64"))
+
+    if build_bm25:
+        from .bm25 import BM25Index
+        BM25Index(os.path.join(tmp_directory, "bm25.pkl")).rebuild(all_ids, documents)
+
+    has_hnsw = False
+    if build_hnsw and all_ids:
+        has_hnsw = _build_hnsw(tmp_directory, len(all_ids), dim, space, hnsw or {})
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "count": len(all_ids),
+        "dim": dim or 0,
+        "space": space,
+        "hnsw": hnsw or {},
+        "has_hnsw": has_hnsw,
+        "embedder": embedder,
+        "created_at": datetime.now().isoformat(),
+    }
+    with open(os.path.join(tmp_directory, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_directory, directory)
+    return {**manifest, "directory": directory, "seconds": round(time.perf_counter() - start, 2)}
+
+
+def _build_hnsw(directory: str, count: int, dim: int, space: str, hnsw: Dict[str, Any]) -> bool:
+    """用hnswlib为快照向量构建并保存HNSW图，未安装hnswlib时跳过"""
+    try:
+        import hnswlib
+    except ImportError:
+        logger.warning("未安装hnswlib，快照不包含HNSW图，查询使用精确扫描")
+        return False
+    import numpy as np
+
+    vectors = np.memmap(os.path.join(directory, "vectors.f32"), dtype=np.float32, mode="r", shape=(count, dim))
+    index = hnswlib.Index(space=space, dim=dim)
+    index.init_index(
+        max_elements=count,
+        M=hnsw.get("hnsw:M", 16),
+        ef_construction=hnsw.get("hnsw:construction_ef", 100)
+    )
+    index.add_items(vectors, np.arange(count))
+    index.save_index(os.path.join(directory, "index.hnsw"))
+    return True
+
+
+class SnapshotIndex:
+    """以mmap方式打开的只读快照
+
+    向量为定长矩阵，ID、正文和元数据为带偏移表的列式文件，打开时只做mmap，
+    不读入内容；多个进程打开同一快照时共享页缓存中的同一份物理内存。
+    接口与Chroma集合的 query/get/count 一致，写操作会抛出 PermissionError。
+
+    快照包含HNSW图时，无过滤条件的查询走HNSW（图本身由hnswlib读入进程内存）；
+    其余情况对mmap矩阵做一次矩阵-向量乘法的精确扫描。
+    """
+
+    read_only = True
+
+    def __init__(self, directory: str, embedder=None, use_hnsw: bool = True):
+        import numpy as np
+
+        self.directory = directory
+        self.embedder = embedder
+        with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"不支持的快照格式版本: {self.manifest.get('format_version')}")
+
+        self.space = self.manifest["space"]
+        self.dim = self.manifest["dim"]
+        self._count = self.manifest["count"]
+        self.metadata = {"hnsw:space": self.space, **self.manifest.get("hnsw", {})}
+
+        self._vectors = (
+            np.memmap(os.path.join(directory, "vectors.f32"), dtype=np.float32, mode="r", shape=(self._count, self.dim))
+            if self._count else np.zeros((0, self.dim), dtype=np.float32)
+        )
+        self._columns = {name: self._open_column(name) for name in _STRING_COLUMNS}
+        self._id_order = self._open_array("id_order.i64", np.int64)
+        self._parsed_metadatas: Optional[List[Dict[str, Any]]] = None
+
+        self._hnsw = None
+        hnsw_path = os.path.join(directory, "index.hnsw")
+        if use_hnsw and self.manifest.get("has_hnsw") and os.path.exists(hnsw_path):
+            try:
+                import hnswlib
+                self._hnsw = hnswlib.Index(space=self.space, dim=self.dim)
+                self._hnsw.load_index(hnsw_path, max_elements=self._count)
+                self._hnsw.set_ef(self.manifest.get("hnsw", {}).get("hnsw:search_ef", 10))
+            except ImportError:
+                logger.warning("未安装hnswlib，快照查询使用精确扫描")
+                self._hnsw = None
+
+        logger.info(f"已打开只读快照: {directory}, {self._count} 条, 维度 {self.dim}")
+
+    def _open_array(self, filename: str, dtype):
+        import numpy as np
+
+        path = os.path.join(self.directory, filename)
+        if os.path.getsize(path) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r")
+
+    def _open_column(self, name: str):
+        import numpy as np
+
+        return self._open_array(f"{name}.bin", np.uint8), self._open_array(f"{name}.off", np.uint64)
+
+    def _string(self, name: str, row: int) -> str:
+        data, offsets = self._columns[name]
+        return bytes(data[int(offsets[row]):int(offsets[row + 1])]).decode("utf-8")
+
+    def _metadata(self, row: int) -> Dict[str, Any]:
+        if self._parsed_metadatas is not None:
+            return self._parsed_metadatas[row]
+        return json.loads(self._string("metadatas", row))
+
+    def _all_metadatas(self) -> List[Dict[str, Any]]:
+        """带过滤条件查询时才解析全部元数据，解析结果缓存在进程内"""
+        if self._parsed_metadatas is None:
+            self._parsed_metadatas = [json.loads(self._string("metadatas", r)) for r in range(self._count)]
+        return self._parsed_metadatas
+
+    def _row_of(self, id: str) -> Optional[int]:
+        """在按ID排序的行号上二分查找"""
+        lo, hi = 0, len(self._id_order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = self._string("ids", int(self._id_order[mid]))
+            if value < id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self._id_order):
+            row = int(self._id_order[lo])
+            if self._string("ids", row) == id:
+                return row
+        return None
+
+    # ---------- 写入（不支持） ----------
+
+    def upsert(self, *args, **kwargs):
+        raise PermissionError("只读快照不支持写入")
+
+    add = upsert
+    delete = upsert
+    modify = upsert
+
+    # ---------- 读取 ----------
+
+    def count(self) -> int:
+        return self._count
+
+    def _candidate_mask(self, where: Optional[Dict[str, Any]]):
+        import numpy as np
+
+        if not where:
+            return None
+        return np.fromiter(
+            (match_where(meta, where) for meta in self._all_metadatas()),
+            dtype=bool,
+            count=self._count
+        )
+
+    def _scores_to_distances(self, scores):
+        """与Chroma的距离定义保持一致（向量均已归一化）"""
+        if self.space in ("cosine", "ip"):
+            return 1.0 - scores
+        return 2.0 - 2.0 * scores
+
+    def _rows_result(self, rows: List[int], include_embeddings: bool = False) -> Dict[str, Any]:
+        result = {
+            "ids": [self._string("ids", r) for r in rows],
+            "documents": [self._string("documents", r) for r in rows],
+            "metadatas": [self._metadata(r) for r in rows],
+        }
+        if include_embeddings:
+            result["embeddings"] = [self._vectors[r].tolist() for r in rows]
+        return result
+
+    def query(
+        self,
+        query_texts: Optional[List[str]] = None,
+        query_embeddings: Optional[List[List[float]]] = None,
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """top-k 查询，返回与Chroma相同结构的结果"""
+        import numpy as np
+
+        if query_embeddings is not None:
+            queries = np.asarray(query_embeddings, dtype=np.float32)
+        else:
+            if self.embedder is None:
+                raise ValueError("快照未配置embedder，只能用向量查询")
+            queries = np.asarray(self.embedder.encode(list(query_texts or [])), dtype=np.float32)
+
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        mask = self._candidate_mask(where)
+        n_candidates = self._count if mask is None else int(mask.sum())
+
+        for query in queries:
+            k = min(n_results, n_candidates)
+            if not k:
+                for key in result:
+                    result[key].append([])
+                continue
+
+            if self._hnsw is not None and mask is None:
+                labels, distances = self._hnsw.knn_query(query, k=k)
+                rows = labels[0].tolist()
+                distances = distances[0].tolist()
+            else:
+                scores = self._vectors @ query
+                if mask is not None:
+                    scores[~mask] = -np.inf
+                top = np.argpartition(-scores, k - 1)[:k]
+                top = top[np.argsort(-scores[top])]
+                rows = top.tolist()
+                distances = self._scores_to_distances(scores[top]).tolist()
+
+            rows_result = self._rows_result(rows)
+            for key in ("ids", "documents", "metadatas"):
+                result[key].append(rows_result[key])
+            result["distances"].append(distances)
+        return result
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """按ID或元数据条件读取条目"""
+        import numpy as np
+
+        if ids is not None:
+            rows = [row for row in (self._row_of(id) for id in ids) if row is not None]
+            if where:
+                rows = [r for r in rows if match_where(self._metadata(r), where)]
+        else:
+            mask = self._candidate_mask(where)
+            rows = list(range(self._count)) if mask is None else np.flatnonzero(mask).tolist()
+        if offset:
+            rows = rows[offset:]
+        if limit is not None:
+            rows = rows[:limit]
+        return self._rows_result(rows, include_embeddings=bool(include and "embeddings" in include))
+
+
+def main(argv: Optional[List[str]] = None):
+    """快照命令行入口"""
+    import yaml
+    from .vector_store import VectorStore
+
+    parser = argparse.ArgumentParser(description="向量库只读快照：导出与检查")
+    parser.add_argument("command", choices=["export", "info"])
+    parser.add_argument("--config", default="config/config.yaml")
+    parser.add_argument("--out", help="快照目录，默认取配置 snapshot_path")
+    parser.add_argument("--partition", help="导出的分区，默认公共分区")
+    parser.add_argument("--hnsw", action="store_true", help="同时序列化HNSW图（需要hnswlib）")
+    args = parser.parse_args(argv)
+
+    with open(args.config) as f:
+        config = yaml.safe_load(f)["vector_store"]
+    directory = args.out or config.get("snapshot_path") or os.path.join("data", "snapshots", config.get("collection_name", "research_data"))
+
+    if args.command == "info":
+        index = SnapshotIndex(directory, use_hnsw=False)
+        print(json.dumps(index.manifest, ensure_ascii=False, indent=2))
+        return
+
+    # 导出时必须打开可写的原始库，而不是快照本身
+    store = VectorStore({**config, "snapshot_path": None})
+    part = store._partition(args.partition)
+    result = export_snapshot(
+        part.collection,
+        directory,
+        space=store.space,
+        hnsw=store.hnsw_metadata(),
+        batch_size=store.max_batch_size(),
+        build_bm25=config.get("search_mode", "dense") == "hybrid",
+        build_hnsw=args.hnsw,
+        embedder=getattr(store.embedding_model, "backend", None)
+    )
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
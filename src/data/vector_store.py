@@ -1,13 +1,60 @@
-from typing import List, Dict, Any
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.embeddings import FastEmbedEmbeddings
+from typing import List, Dict, Any, Optional, Union
 import os
 import ssl
-import urllib3
 from loguru import logger
-import requests
 import time
+import atexit
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from .embeddings import (
+    BACKEND_TORCH,
+    TorchEmbedder,
+    HashingEmbedder,
+    EmbedderFunction,
+    create_embedder,
+    verify_embedder
+)
+from .metadata_index import MetadataIndex
+from .fallback_index import IndexMismatchError, NumpyIndex, match_where
+from .snapshot import SnapshotIndex
+from ..telemetry import traced, EMBEDDING_BATCH_SIZE, VECTOR_OPERATION
+from .bm25 import BM25Index, reciprocal_rank_fusion
+from .reranker import CrossEncoderReranker
+from .ids import DEFAULT_NAMESPACE, make_content_id
+
+# 公共分区名，以及写入元数据的分区键
+DEFAULT_PARTITION = "default"
+PARTITION_KEY = "session_id"
+
+# Chroma创建集合时使用的HNSW默认参数
+HNSW_DEFAULTS = {
+    "hnsw:space": "l2",
+    "hnsw:M": 16,
+    "hnsw:construction_ef": 100,
+    "hnsw:search_ef": 10,
+}
+
+class Partition:
+    """一个分区（会话/租户）对应的集合及其旁路索引"""
+    
+    __slots__ = ("key", "name", "collection", "lexical_index", "where")
+    
+    def __init__(self, key: str, name: str, collection, lexical_index=None, where: Optional[Dict[str, Any]] = None):
+        self.key = key
+        self.name = name
+        self.collection = collection
+        self.lexical_index = lexical_index
+        self.where = where
+    
+    def scope(self, where: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """把分区过滤条件合并进查询条件"""
+        if not self.where:
+            return where
+        if not where:
+            return self.where
+        return {"$and": [self.where, where]}
 
 class VectorStore:
     def __init__(self, config: Dict[str, Any] = None):
@@ -16,47 +63,87 @@ class VectorStore:
         self.device = self.config.get("device", "cpu")
         self.embedding_model = None
         self.db = None
+        self.collection = None
+        self.metadata_index = None
+        self.lexical_index = None
+        self.reranker = None
+        # 打开的分区按最近使用排序，collection模式下最多保留 partition_cache_size 个会话分区
+        self._partitions: "OrderedDict[str, Partition]" = OrderedDict()
+        self._partition_lock = threading.Lock()
+        self.partition_cache_size = self.config.get("partition_cache_size", 64)
+        self.collection_name = self.config.get("collection_name", "research_data")
+        self.persist_directory = self.config.get("persist_directory", "./data/chroma")
+        self.local_model_path = None
+        self.space = self.config.get("hnsw_space", "l2")
+        self._embedding_function = None
+        self._embedding_dim = None
+        self.read_only = False
         
         # 设置重试次数
-        max_retries = 3
+        max_retries = self.config.get("max_retries", 3)
+        retry_delay = self.config.get("retry_delay", 2)
         retry_count = 0
         
+        # 配置了快照时以只读方式打开快照，不连接Chroma
+        snapshot_path = self.config.get("snapshot_path")
+        if snapshot_path:
+            self._initialize_snapshot(snapshot_path)
+            max_retries = 0
+        
         while retry_count < max_retries:
             try:
                 # 初始化embedding模型
-                model_name = self.config.get("embedding_model", "sentence-transformers/all-MiniLM-L6-v2")
+                model_name = self.config.get(
+                    "embedding_model",
+                    self.config.get("model_name", "sentence-transformers/all-MiniLM-L6-v2")
+                )
                 
                 # 计算本地模型路径
-                local_model_path = os.path.join("./models/embeddings", model_name.split("/")[-1])
+                local_model_root = self.config.get("local_model_path", "./models/embeddings")
+                local_model_path = os.path.join(local_model_root, model_name.split("/")[-1])
+                self.local_model_path = local_model_path
                 
-                # 初始化embedding模型
-                self._initialize_embedding_model(model_name, local_model_path)
+                # 初始化embedding模型（按配置选择torch/onnx/onnx-int8后端）
+                self._initialize_embedding_backend(model_name, local_model_path)
                 
                 # 初始化Chroma数据库 - 使用新的配置方式
                 import chromadb
                 
                 # 确保数据目录存在
-                persist_directory = "./data/chroma"
+                persist_directory = self.persist_directory
                 os.makedirs(persist_directory, exist_ok=True)
                 
-                # 使用新的客户端初始化方式
+                # 使用新的客户端初始化方式；会话分区较多时按LRU卸载已加载的HNSW段
+                settings = {}
+                memory_limit_mb = self.config.get("chroma_memory_limit_mb")
+                if memory_limit_mb:
+                    from chromadb.config import Settings
+                    settings["settings"] = Settings(
+                        chroma_segment_cache_policy="LRU",
+                        chroma_memory_limit_bytes=int(memory_limit_mb * 2 ** 20)
+                    )
                 self.db = chromadb.PersistentClient(
-                    path=persist_directory
+                    path=persist_directory,
+                    **settings
                 )
                 
-                # 创建或获取集合
-                from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
-                
-                # 使用SentenceTransformerEmbeddingFunction
-                embedding_function = SentenceTransformerEmbeddingFunction(
-                    model_name=local_model_path if os.path.exists(local_model_path) else model_name,
-                    device=self.device
-                )
+                # 创建或获取集合，复用已加载的embedder，避免Chroma再加载一份模型
+                self._embedding_function = EmbedderFunction(self.embedding_model)
                 
-                self.collection = self.db.get_or_create_collection(
-                    name="research_data",
-                    embedding_function=embedding_function
-                )
+                # HNSW参数只在创建集合时生效，已有集合需要通过重建命令修改
+                try:
+                    self.collection = self.db.get_collection(
+                        name=self.collection_name,
+                        embedding_function=self._embedding_function
+                    )
+                    self._check_hnsw_params()
+                except ValueError:
+                    self.collection = self.db.create_collection(
+                        name=self.collection_name,
+                        embedding_function=self._embedding_function,
+                        metadata=self.hnsw_metadata()
+                    )
+                    self.space = self.hnsw_metadata()["hnsw:space"]
                 
                 logger.info(f"向量存储初始化完成，使用模型: {model_name}")
                 break
@@ -67,17 +154,118 @@ class VectorStore:
                 
                 if retry_count < max_retries:
                     # 等待一段时间后重试
-                    wait_time = 2 * retry_count
+                    wait_time = retry_delay * retry_count
                     logger.info(f"等待 {wait_time} 秒后重试...")
                     time.sleep(wait_time)
                 else:
                     # 尝试使用备用方案
                     logger.warning("所有尝试都失败，使用备用方案...")
                     self._initialize_fallback()
+        
+        # 初始化元数据索引和BM25词法索引
+        self._initialize_metadata_index()
+        self._initialize_lexical_index()
+        self._initialize_reranker()
+        
+        # 公共分区即配置中的集合本身
+        self._partitions[DEFAULT_PARTITION] = Partition(
+            DEFAULT_PARTITION,
+            self.collection_name,
+            self.collection,
+            self.lexical_index
+        )
+    
+    def hnsw_metadata(self) -> Dict[str, Any]:
+        """根据配置生成Chroma集合的HNSW参数"""
+        metadata = {"hnsw:space": self.config.get("hnsw_space", "l2")}
+        for key, chroma_key in (
+            ("hnsw_m", "hnsw:M"),
+            ("hnsw_construction_ef", "hnsw:construction_ef"),
+            ("hnsw_search_ef", "hnsw:search_ef"),
+        ):
+            if self.config.get(key) is not None:
+                metadata[chroma_key] = self.config[key]
+        return metadata
+    
+    def _check_hnsw_params(self):
+        """检查已有集合的HNSW参数是否与配置一致"""
+        actual = {**HNSW_DEFAULTS, **(self.collection.metadata or {})}
+        self.space = actual["hnsw:space"]
+        mismatched = {
+            key: (actual.get(key), value)
+            for key, value in self.hnsw_metadata().items()
+            if actual.get(key) != value
+        }
+        if mismatched:
+            logger.warning(
+                f"集合 {self.collection_name} 的HNSW参数与配置不一致 (当前, 配置): {mismatched}，"
+                "运行 python -m src.data.index_admin rebuild 以应用新参数"
+            )
+    
+    def _initialize_metadata_index(self):
+        """初始化元数据索引，首次使用时从集合回填"""
+        if self.read_only:
+            return
+        try:
+            index_path = os.path.join(self.persist_directory, "metadata_index.sqlite3")
+            self.metadata_index = MetadataIndex(index_path)
+            
+            # 已有数据但索引为空（如升级前写入的数据），从集合回填
+            if self.metadata_index.count(self.collection_name) == 0 and hasattr(self.collection, "get"):
+                existing = self.collection.get(include=["metadatas"])
+                if existing and existing.get("ids"):
+                    self.metadata_index.rebuild(
+                        self.collection_name,
+                        existing["ids"],
+                        existing["metadatas"]
+                    )
+        except Exception as e:
+            logger.warning(f"初始化元数据索引失败: {str(e)}")
+            self.metadata_index = None
+    
+    def _initialize_lexical_index(self):
+        """初始化公共分区的BM25索引（search_mode 为 hybrid 时启用）"""
+        self.lexical_index = self._open_lexical_index(
+            os.path.join(self.persist_directory, "bm25.pkl"),
+            self.collection
+        )
+    
+    def _open_lexical_index(self, path: str, collection) -> Optional[BM25Index]:
+        """打开某个集合的BM25索引，与集合不一致时重建；非hybrid模式返回None"""
+        if self.config.get("search_mode", "dense") != "hybrid":
+            return None
+        try:
+            lexical_index = BM25Index(path)
+            
+            count = collection.count()
+            if len(lexical_index) != count and not self.read_only:
+                logger.info(f"BM25索引与集合不一致 ({len(lexical_index)} / {count})，开始重建")
+                existing = collection.get(include=["documents"])
+                lexical_index.rebuild(existing["ids"], existing["documents"])
+            
+            if not self.read_only:
+                atexit.register(lexical_index.save)
+            return lexical_index
+        except Exception as e:
+            logger.warning(f"初始化BM25索引失败，混合检索不可用: {str(e)}")
+            return None
+    
+    def _initialize_reranker(self):
+        """按配置创建cross-encoder重排器（模型在首次使用时加载）"""
+        reranker_config = self.config.get("reranker") or {}
+        if not reranker_config.get("enabled", False):
+            return
+        try:
+            self.reranker = CrossEncoderReranker.from_config(reranker_config, device=self.device)
+        except Exception as e:
+            logger.warning(f"初始化重排器失败: {str(e)}")
+            self.reranker = None
     
     def _disable_ssl_verification(self):
         """禁用SSL验证"""
         logger.warning("禁用SSL验证 - 仅用于开发环境")
+        import urllib3
+        import requests
         
         # 禁用SSL验证警告
         urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -96,6 +284,38 @@ class VectorStore:
         os.environ['REQUESTS_CA_BUNDLE'] = ''
         os.environ['SSL_CERT_FILE'] = ''
     
+    def _initialize_embedding_backend(self, model_name: str, local_model_path: str):
+        """按配置初始化embedding后端"""
+        backend = self.config.get("embedding_backend", BACKEND_TORCH)
+        num_threads = self.config.get("num_threads") or None
+        
+        if backend == BACKEND_TORCH:
+            self._initialize_embedding_model(model_name, local_model_path)
+            self.embedding_model = TorchEmbedder(self.embedding_model, num_threads=num_threads)
+            return
+        
+        try:
+            # ONNX后端只从本地目录加载，缺少ONNX文件时会先导出
+            embedder = create_embedder(backend, local_model_path, num_threads=num_threads)
+            
+            if self.config.get("verify_backend", False):
+                reference = TorchEmbedder.from_path(local_model_path, device=self.device)
+                report = verify_embedder(
+                    embedder,
+                    reference,
+                    min_cosine=self.config.get("verify_min_cosine", 0.99)
+                )
+                logger.info(f"embedding后端一致性校验结果: {report}")
+                if not report["passed"]:
+                    raise ValueError(f"{backend} 后端与参考实现偏差过大")
+            
+            self.embedding_model = embedder
+            logger.info(f"使用embedding后端: {backend}")
+        except Exception as e:
+            logger.warning(f"初始化 {backend} 后端失败，回退到torch: {str(e)}")
+            self._initialize_embedding_model(model_name, local_model_path)
+            self.embedding_model = TorchEmbedder(self.embedding_model, num_threads=num_threads)
+    
     def _initialize_embedding_model(self, model_name: str, local_model_path: str):
         """初始化embedding模型"""
         try:
@@ -162,95 +382,105 @@ class VectorStore:
             logger.error(f"初始化embedding模型失败: {str(e)}")
             raise
     
+    def _initialize_snapshot(self, snapshot_path: str):
+        """以只读方式打开mmap快照
+        
+        快照模式下不写元数据索引，list_recent 退化为where过滤后排序；
+        BM25索引使用快照目录中导出时生成的版本。
+        """
+        model_name = self.config.get(
+            "embedding_model",
+            self.config.get("model_name", "sentence-transformers/all-MiniLM-L6-v2")
+        )
+        local_model_root = self.config.get("local_model_path", "./models/embeddings")
+        self.local_model_path = os.path.join(local_model_root, model_name.split("/")[-1])
+        
+        self.collection = SnapshotIndex(snapshot_path)
+        # 查询端必须使用与导出时相同的embedder
+        if self.collection.manifest.get("embedder") == HashingEmbedder.backend:
+            self.embedding_model = HashingEmbedder(dim=self.collection.dim)
+        else:
+            self._initialize_embedding_backend(model_name, self.local_model_path)
+        self.collection.embedder = self.embedding_model
+        self.space = self.collection.space
+        self.persist_directory = snapshot_path
+        self.read_only = True
+    
     def _initialize_fallback(self):
-        """初始化备用方案，当所有尝试都失败时使用"""
+        """初始化备用方案，当所有尝试都失败时使用
+        
+        使用同一个本地模型生成定长向量，存入可落盘的NumPy矩阵索引；
+        本地模型也不可用时退化为哈希特征embedding。
+        """
         try:
-            # 使用简单的余弦相似度作为备用
             logger.info("初始化备用向量存储...")
             
-            # 定义简单的embedding函数
-            def simple_embedding(text):
-                """简单的词袋模型embedding"""
-                from collections import Counter
-                import numpy as np
-                import re
-                
-                # 简单的分词
-                words = re.findall(r'\w+', text.lower())
-                # 创建词袋
-                bag = Counter(words)
-                # 转换为向量
-                return np.array(list(bag.values()), dtype=float)
-            
-            # 设置embedding模型
-            class SimpleEmbedder:
-                def encode(self, texts):
-                    if isinstance(texts, str):
-                        return simple_embedding(texts)
-                    return [simple_embedding(text) for text in texts]
-            
-            self.embedding_model = SimpleEmbedder()
-            
-            # 初始化简单的内存数据库
-            class SimpleDB:
-                def __init__(self):
-                    self.data = []
-                    
-                def add(self, texts, metadatas=None, ids=None):
-                    if metadatas is None:
-                        metadatas = [{} for _ in texts]
-                    if ids is None:
-                        ids = [str(i) for i in range(len(texts))]
-                    
-                    for text, metadata, id in zip(texts, metadatas, ids):
-                        self.data.append({
-                            "id": id,
-                            "text": text,
-                            "metadata": metadata,
-                            "embedding": simple_embedding(text)
-                        })
-                        
-                def search(self, query, limit=5):
-                    import numpy as np
-                    from scipy.spatial.distance import cosine
-                    
-                    query_embedding = simple_embedding(query)
-                    
-                    # 计算相似度
-                    results = []
-                    for item in self.data:
-                        try:
-                            similarity = 1 - cosine(query_embedding, item["embedding"])
-                            results.append((item, similarity))
-                        except:
-                            continue
-                    
-                    # 排序并返回结果
-                    results.sort(key=lambda x: x[1], reverse=True)
-                    return [
-                        {
-                            "id": item["id"],
-                            "text": item["text"],
-                            "metadata": item["metadata"],
-                            "distance": 1 - similarity
-                        }
-                        for item, similarity in results[:limit]
-                    ]
-            
-            # 设置集合
-            self.collection = SimpleDB()
+            if self.embedding_model is None:
+                try:
+                    self.embedding_model = TorchEmbedder.from_path(self.local_model_path, device=self.device)
+                except Exception as e:
+                    logger.warning(f"备用方案无法加载本地模型，使用哈希特征embedding: {str(e)}")
+                    self.embedding_model = HashingEmbedder()
+            
+            self.collection = self._open_fallback_index(os.path.join(self.persist_directory, "fallback"))
             logger.info("备用向量存储初始化完成")
             
         except Exception as e:
             logger.error(f"初始化备用方案失败: {str(e)}")
             raise
     
-    async def store_embeddings(self, texts: List[str], metadatas: List[Dict[str, Any]] = None):
-        """存储文本及其embedding到向量数据库"""
+    def _fallback_embedder_id(self) -> str:
+        """备用索引中记录的embedder标识：同一模型的torch/onnx后端向量可比，哈希embedder单独标识"""
+        if isinstance(self.embedding_model, HashingEmbedder):
+            return f"hashing-{self.embedding_model.dim}"
+        return os.path.basename(os.path.normpath(self.local_model_path or "")) or type(self.embedding_model).__name__
+    
+    def _open_fallback_index(self, directory: str) -> NumpyIndex:
+        """打开备用索引
+        
+        只有明确检测到embedder或维度不一致时才从空索引开始，旧目录改名保留；
+        其他加载错误（文件损坏、权限等）直接抛出，不清除已有数据。
+        """
+        embedder_id = self._fallback_embedder_id()
+        if self._embedding_dim is None:
+            self._embedding_dim = len(self.embedding_model.encode(["维度探测"])[0])
+        dim = self._embedding_dim
+        try:
+            return NumpyIndex(directory, embedder=self.embedding_model, space=self.space,
+                              embedder_id=embedder_id, dim=dim)
+        except IndexMismatchError as e:
+            backup = f"{directory}.{time.strftime('%Y%m%d%H%M%S')}.bak"
+            os.replace(directory, backup)
+            logger.warning(f"备用索引与当前embedder不一致（{str(e)}），旧索引已移至 {backup}，重新创建")
+            return NumpyIndex(directory, embedder=self.embedding_model, space=self.space,
+                              embedder_id=embedder_id, dim=dim)
+    
+    @traced("VectorStore.store_embeddings", VECTOR_OPERATION, ["store_embeddings"])
+    async def store_embeddings(
+        self,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]] = None,
+        namespace: Optional[str] = None,
+        partition: Optional[str] = None
+    ) -> List[str]:
+        """存储文本及其embedding到向量数据库
+        
+        ID由命名空间和内容哈希生成，重复写入同一内容会覆盖已有条目。
+        配置了 dedupe_threshold 时，与已有条目相似度超过阈值的文本会被跳过。
+        
+        Args:
+            texts: 文本列表
+            metadatas: 元数据列表
+            namespace: ID命名空间，默认取分区名或配置中的 namespace
+            partition: 分区（会话/租户），默认写入公共分区
+            
+        Returns:
+            List[str]: 实际写入的ID列表
+        """
         try:
             if not texts:
                 logger.warning("没有文本需要存储")
-                return
+                return []
             
             # 确保metadatas与texts长度一致
             if metadatas is None:
@@ -259,69 +489,512 @@ class VectorStore:
                 logger.warning(f"metadatas长度 ({len(metadatas)}) 与texts长度 ({len(texts)}) 不一致，将使用空元数据")
                 metadatas = [{} for _ in texts]
             
-            # 生成唯一ID
-            import uuid
-            ids = [str(uuid.uuid4()) for _ in texts]
+            # 记录分区键，metadata模式下按它过滤
+            if partition:
+                metadatas = [{**metadata, PARTITION_KEY: partition} for metadata in metadatas]
+            
+            # 生成稳定ID，同一批次内的重复内容只保留一条
+            namespace = namespace or partition or self.config.get("namespace", DEFAULT_NAMESPACE)
+            unique = {}
+            for text, metadata in zip(texts, metadatas):
+                unique.setdefault(make_content_id(text, namespace), (text, metadata))
+            ids = list(unique)
+            texts = [unique[id][0] for id in ids]
+            metadatas = [unique[id][1] for id in ids]
+            
+            EMBEDDING_BATCH_SIZE.observe(len(texts))
+            embeddings = self.embedding_model.encode(texts)
+            
+            # 近重复过滤
+            threshold = self.config.get("dedupe_threshold")
+            if threshold:
+                keep = self._filter_near_duplicates(ids, embeddings, threshold, partition)
+                if len(keep) < len(ids):
+                    logger.info(f"跳过 {len(ids) - len(keep)} 条近重复文本")
+                ids = [ids[i] for i in keep]
+                texts = [texts[i] for i in keep]
+                metadatas = [metadatas[i] for i in keep]
+                embeddings = embeddings[keep]
+                if not ids:
+                    return []
             
             # 存储到向量数据库
-            self.collection.add(
-                documents=texts,
-                metadatas=metadatas,
-                ids=ids
-            )
+            self.upsert_embeddings(ids, texts, embeddings.tolist(), metadatas, partition=partition)
             
             logger.info(f"成功存储 {len(texts)} 条文本")
+            return ids
             
         except Exception as e:
             logger.error(f"存储embedding失败: {str(e)}")
             raise
     
-    async def search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
-        """搜索与查询最相似的文本"""
+    def _distance_to_similarity(self, distance: float) -> float:
+        """把Chroma返回的距离换算为余弦相似度（向量均已归一化）"""
+        if self.space in ("cosine", "ip"):
+            return 1.0 - distance
+        # l2 返回的是平方距离：|a-b|^2 = 2 - 2cos
+        return 1.0 - distance / 2.0
+    
+    def _filter_near_duplicates(
+        self,
+        ids: List[str],
+        embeddings,
+        threshold: float,
+        partition: Optional[str] = None
+    ) -> List[int]:
+        """返回需要保留的下标：与库中已有条目或本批次前面条目过于相似的会被剔除
+        
+        与库中同ID的条目不算重复（那是覆盖写入）。
+        """
+        import numpy as np
+        
+        part = self._partition(partition)
+        keep = []
+        nearest = {"ids": [[] for _ in ids], "distances": [[] for _ in ids]}
         try:
-            # 执行搜索
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=limit
+            if part.collection.count() > 0:
+                query_kwargs = {"where": part.where} if part.where else {}
+                nearest = part.collection.query(
+                    query_embeddings=embeddings.tolist(),
+                    n_results=2,
+                    include=["distances"],
+                    **query_kwargs
+                )
+        except Exception as e:
+            logger.warning(f"近重复检查失败，跳过检查: {str(e)}")
+        
+        for i, id in enumerate(ids):
+            is_duplicate = any(
+                other_id != id and self._distance_to_similarity(dist) >= threshold
+                for other_id, dist in zip(nearest["ids"][i], nearest["distances"][i])
+            )
+            if not is_duplicate and keep:
+                # 与本批次已保留条目比较
+                similarities = embeddings[keep] @ embeddings[i]
+                is_duplicate = bool(np.max(similarities) >= threshold)
+            if not is_duplicate:
+                keep.append(i)
+        return keep
+    
+    def upsert_embeddings(
+        self,
+        ids: List[str],
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict[str, Any]],
+        partition: Optional[str] = None
+    ):
+        """写入预先计算好的embedding（批量导入用，同步调用）"""
+        part = self._partition(partition)
+        part.collection.upsert(
+            ids=ids,
+            embeddings=embeddings,
+            documents=texts,
+            metadatas=metadatas
+        )
+        if self.metadata_index:
+            self.metadata_index.add(part.name, ids, metadatas)
+        if part.lexical_index:
+            part.lexical_index.add(ids, texts)
+    
+    def existing_ids(self, ids: List[str], partition: Optional[str] = None) -> set:
+        """返回集合中已存在的ID"""
+        try:
+            part = self._partition(partition, create=False)
+            if part is None:
+                return set()
+            return set(part.collection.get(ids=ids, include=[])["ids"])
+        except Exception as e:
+            logger.warning(f"查询已存在ID失败: {str(e)}")
+            return set()
+    
+    def max_batch_size(self) -> int:
+        """单次写入允许的最大条数"""
+        return getattr(self.db, "max_batch_size", None) or 5000
+    
+    def embedding_config(self) -> Dict[str, Any]:
+        """返回当前embedding后端配置，供子进程重建同样的embedder"""
+        return {
+            "backend": self.config.get("embedding_backend", BACKEND_TORCH),
+            "model_path": self.local_model_path
+        }
+    
+    # ---------- 分区 ----------
+    
+    def _partition_collection_name(self, key: str) -> str:
+        """分区对应的集合名（分区键可能含任意字符，统一取哈希）"""
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        return f"{self.collection_name}__{digest}"
+    
+    def _partition(self, key: Optional[str] = None, create: bool = True) -> Optional["Partition"]:
+        """返回分区，首次访问时打开或创建对应的集合
+        
+        读路径传 create=False：只打开已存在的集合，分区不存在时返回None，
+        不会顺带创建空集合，也不会挤占分区缓存。
+        """
+        if not key or key == DEFAULT_PARTITION:
+            return self._partitions[DEFAULT_PARTITION]
+        
+        if self.config.get("partition_mode", "collection") == "metadata":
+            # 共用一个集合，查询时按分区键过滤
+            default = self._partitions[DEFAULT_PARTITION]
+            return Partition(key, default.name, default.collection, default.lexical_index, where={PARTITION_KEY: key})
+        
+        with self._partition_lock:
+            part = self._partitions.get(key)
+            if part is not None:
+                self._partitions.move_to_end(key)
+                return part
+            
+            if self.read_only:
+                if not create:
+                    return None
+                raise ValueError("只读快照只包含一个分区")
+            
+            name = self._partition_collection_name(key)
+            if self.db is not None:
+                if create:
+                    collection = self.db.get_or_create_collection(
+                        name=name,
+                        embedding_function=self._embedding_function,
+                        metadata={**self.hnsw_metadata(), "partition": key}
+                    )
+                else:
+                    try:
+                        collection = self.db.get_collection(
+                            name=name,
+                            embedding_function=self._embedding_function
+                        )
+                    except Exception:
+                        # 集合不存在（不同Chroma版本抛出的异常类型不同）
+                        return None
+            else:
+                directory = os.path.join(self.persist_directory, "fallback", name)
+                if not create and not os.path.exists(directory):
+                    return None
+                collection = self._open_fallback_index(directory)
+            lexical_index = self._open_lexical_index(
+                os.path.join(self.persist_directory, "bm25", f"{name}.pkl"),
+                collection
             )
+            part = Partition(key, name, collection, lexical_index)
+            self._partitions[key] = part
+            if self.metadata_index:
+                self.metadata_index.register_partition(key, name)
+            self._evict_partitions()
+        return part
+    
+    def _evict_partitions(self):
+        """关闭超出 partition_cache_size 的最久未用的会话分区（调用方持有 _partition_lock）
+        
+        公共分区常驻；被关闭的分区在下次访问时重新打开。
+        """
+        if not self.partition_cache_size:
+            return
+        while len(self._partitions) - 1 > self.partition_cache_size:
+            key = next(key for key in self._partitions if key != DEFAULT_PARTITION)
+            part = self._partitions.pop(key)
+            if part.lexical_index is not None and not self.read_only:
+                part.lexical_index.save()
+                atexit.unregister(part.lexical_index.save)
+            logger.debug("关闭分区 {key}", key=key)
+    
+    def list_partitions(self) -> List[str]:
+        """列出所有分区键（包含公共分区）"""
+        keys = set(self._partitions)
+        if self.metadata_index:
+            keys.update(self.metadata_index.partitions())
+        keys.discard(DEFAULT_PARTITION)
+        return [DEFAULT_PARTITION] + sorted(keys)
+    
+    # ---------- 检索 ----------
+    
+    @traced("VectorStore.search", VECTOR_OPERATION, ["search"])
+    async def search(
+        self,
+        query: str,
+        limit: int = 5,
+        where: Optional[Dict[str, Any]] = None,
+        mode: Optional[str] = None,
+        rerank: Optional[bool] = None,
+        partition: Optional[str] = None,
+        partitions: Optional[Union[List[str], str]] = None
+    ) -> List[Dict[str, Any]]:
+        """搜索与查询最相似的文本
+        
+        Args:
+            query: 查询文本
+            limit: 返回数量
+            where: 可选的元数据过滤条件（Chroma where语法）
+            mode: dense（仅向量检索）或 hybrid（向量 + BM25），默认取配置 search_mode
+            rerank: 是否用cross-encoder重排，默认在配置启用重排时开启
+            partition: 查询的分区，默认公共分区
+            partitions: 跨分区查询的分区列表，"*" 表示全部分区，各分区并行检索后合并
+        """
+        mode = mode or self.config.get("search_mode", "dense")
+        rerank = self.reranker is not None if rerank is None else (rerank and self.reranker is not None)
+        try:
+            # 重排时一阶段多取一些候选
+            first_stage_limit = max(limit, (self.config.get("reranker") or {}).get("top_n", 30)) if rerank else limit
             
-            # 处理结果
-            processed_results = []
+            if partitions is not None:
+                keys = self.list_partitions() if partitions == "*" else list(partitions)
+                parts = [part for part in (self._partition(key, create=False) for key in keys) if part is not None]
+                groups = await asyncio.gather(*(
+                    self._first_stage(query, first_stage_limit, where, mode, part)
+                    for part in parts
+                ))
+                results = self._merge_partition_results(groups, first_stage_limit)
+            else:
+                part = self._partition(partition, create=False)
+                if part is None:
+                    return []
+                results = await self._first_stage(query, first_stage_limit, where, mode, part)
             
-            if results and 'documents' in results and results['documents']:
-                documents = results['documents'][0]  # 第一个查询的结果
-                metadatas = results['metadatas'][0] if 'metadatas' in results and results['metadatas'] else [{}] * len(documents)
-                distances = results['distances'][0] if 'distances' in results and results['distances'] else [0] * len(documents)
-                ids = results['ids'][0] if 'ids' in results and results['ids'] else [""] * len(documents)
-                
-                for doc, meta, dist, id in zip(documents, metadatas, distances, ids):
-                    processed_results.append({
-                        "text": doc,
-                        "metadata": meta,
-                        "distance": dist,
-                        "id": id
-                    })
-                
-            return processed_results
+            if rerank:
+                results = await asyncio.to_thread(self.reranker.rerank, query, results, limit)
+            return results[:limit]
             
         except Exception as e:
             logger.error(f"搜索失败: {str(e)}")
             return []
     
+    async def _first_stage(
+        self,
+        query: str,
+        limit: int,
+        where: Optional[Dict[str, Any]],
+        mode: str,
+        part: "Partition"
+    ) -> List[Dict[str, Any]]:
+        """单个分区内的一阶段检索"""
+        where = part.scope(where)
+        if mode == "hybrid" and part.lexical_index is not None:
+            return await self._hybrid_search(query, limit, where, part)
+        return await asyncio.to_thread(self._dense_search, query, limit, where, part)
+    
+    @staticmethod
+    def _merge_partition_results(groups: List[List[Dict[str, Any]]], limit: int) -> List[Dict[str, Any]]:
+        """合并各分区的结果
+        
+        各分区的融合分数只反映分区内排名，不能直接比较；优先按向量距离合并，
+        仅当存在只被BM25召回（没有距离）的条目时退回按融合分数合并。
+        """
+        items = [item for group in groups for item in group]
+        if all(item.get("distance") is not None for item in items):
+            items.sort(key=lambda x: x["distance"])
+        else:
+            items.sort(key=lambda x: x.get("score", 0.0), reverse=True)
+        return items[:limit]
+    
+    def _dense_search(
+        self,
+        query: str,
+        limit: int,
+        where: Optional[Dict[str, Any]] = None,
+        part: Optional["Partition"] = None
+    ) -> List[Dict[str, Any]]:
+        """向量检索"""
+        collection = (part or self._partition()).collection
+        
+        # 执行搜索
+        query_kwargs = {"where": where} if where else {}
+        results = collection.query(
+            query_texts=[query],
+            n_results=limit,
+            **query_kwargs
+        )
+        
+        # 处理结果
+        processed_results = []
+        
+        if results and 'documents' in results and results['documents']:
+            documents = results['documents'][0]  # 第一个查询的结果
+            metadatas = results['metadatas'][0] if 'metadatas' in results and results['metadatas'] else [{}] * len(documents)
+            distances = results['distances'][0] if 'distances' in results and results['distances'] else [0] * len(documents)
+            ids = results['ids'][0] if 'ids' in results and results['ids'] else [""] * len(documents)
+            
+            for doc, meta, dist, id in zip(documents, metadatas, distances, ids):
+                processed_results.append({
+                    "text": doc,
+                    "metadata": meta,
+                    "distance": dist,
+                    "id": id
+                })
+            
+        return processed_results
+    
+    async def _hybrid_search(
+        self,
+        query: str,
+        limit: int,
+        where: Optional[Dict[str, Any]],
+        part: "Partition"
+    ) -> List[Dict[str, Any]]:
+        """向量检索与BM25并行执行，结果用倒数排名融合"""
+        candidates = max(limit, self.config.get("hybrid_candidates", 50))
+        
+        # BM25不支持元数据过滤，过滤时多取一些候选
+        dense, lexical = await asyncio.gather(
+            asyncio.to_thread(self._dense_search, query, candidates, where, part),
+            asyncio.to_thread(part.lexical_index.search, query, candidates * (3 if where else 1))
+        )
+        
+        dense_by_id = {item["id"]: item for item in dense}
+        fused = reciprocal_rank_fusion(
+            [list(dense_by_id), [id for id, _ in lexical]],
+            k=self.config.get("rrf_k", 60)
+        )
+        
+        # 只出现在BM25结果中的条目需要补取正文和元数据
+        missing = [id for id, _ in fused if id not in dense_by_id]
+        fetched = {item["id"]: item for item in self._get(ids=missing, part=part)} if missing else {}
+        
+        results = []
+        for id, score in fused:
+            item = dense_by_id.get(id) or fetched.get(id)
+            if item is None:
+                continue
+            if where and not match_where(item["metadata"], where):
+                continue
+            results.append({**item, "score": score})
+            if len(results) >= limit:
+                break
+        return results
+    
+    async def get(
+        self,
+        where: Optional[Dict[str, Any]] = None,
+        ids: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        partition: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """按元数据条件或ID读取文本，不做任何embedding"""
+        try:
+            part = self._partition(partition, create=False)
+            if part is None:
+                return []
+            return self._get(where=part.scope(where), ids=ids, limit=limit, part=part)
+        except Exception as e:
+            logger.error(f"读取数据失败: {str(e)}")
+            return []
+    
+    def _get(
+        self,
+        where: Optional[Dict[str, Any]] = None,
+        ids: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        part: Optional["Partition"] = None
+    ) -> List[Dict[str, Any]]:
+        results = (part or self._partition()).collection.get(
+            ids=ids,
+            where=where,
+            limit=limit,
+            include=["documents", "metadatas"]
+        )
+        return [
+            {"text": doc, "metadata": meta or {}, "distance": None, "id": id}
+            for id, doc, meta in zip(results["ids"], results["documents"], results["metadatas"])
+        ]
+    
+    async def list_recent(
+        self,
+        doc_type: Optional[str] = None,
+        session_id: Optional[str] = None,
+        limit: int = 10,
+        partition: Optional[str] = None,
+        partitions: Optional[Union[List[str], str]] = None
+    ) -> List[Dict[str, Any]]:
+        """按 created_at 倒序列出最近的条目
+        
+        通过元数据索引拿到ID后按ID读取，结果按时间从新到旧排列。
+        partitions 为分区列表（"*" 表示全部分区）时合并各分区的结果；
+        有元数据索引时跨分区只查一次索引，只打开命中条目所在的分区。
+        """
+        if partitions is not None and self.metadata_index and self.config.get("partition_mode", "collection") != "metadata":
+            return self._list_recent_across(doc_type, session_id, limit, partitions)
+        
+        if partitions is not None:
+            keys = self.list_partitions() if partitions == "*" else list(partitions)
+            merged: Dict[str, Dict[str, Any]] = {}
+            for key in keys:
+                for item in await self.list_recent(doc_type, session_id, limit, partition=key):
+                    merged.setdefault(item["id"], item)
+            items = sorted(merged.values(), key=lambda x: x["metadata"].get("created_at", ""), reverse=True)
+            return items[:limit]
+        
+        part = self._partition(partition, create=False)
+        if part is None:
+            return []
+        if part.where:
+            # metadata分区模式下分区键与会话ID一致
+            session_id = session_id or part.key
+        
+        if not self.metadata_index:
+            # 没有索引时退化为where过滤后在内存中排序
+            where = {}
+            if doc_type is not None:
+                where["type"] = doc_type
+            if session_id is not None:
+                where["session_id"] = session_id
+            items = await self.get(where=where or None, partition=partition)
+            items.sort(key=lambda x: x["metadata"].get("created_at", ""), reverse=True)
+            return items[:limit]
+        
+        ids = self.metadata_index.latest(
+            part.name,
+            doc_type=doc_type,
+            session_id=session_id,
+            limit=limit
+        )
+        if not ids:
+            return []
+        
+        items = {item["id"]: item for item in await self.get(ids=ids, partition=partition)}
+        return [items[id] for id in ids if id in items]
+    
+    def _list_recent_across(
+        self,
+        doc_type: Optional[str],
+        session_id: Optional[str],
+        limit: int,
+        partitions: Union[List[str], str]
+    ) -> List[Dict[str, Any]]:
+        """跨分区的最近N条：一次索引查询拿到 (集合名, ID)，再按分区分组读取"""
+        if partitions == "*":
+            names = self.metadata_index.partition_collections()
+        else:
+            names = {key: self._partition_collection_name(key) for key in partitions if key != DEFAULT_PARTITION}
+        if partitions == "*" or DEFAULT_PARTITION in partitions:
+            names[DEFAULT_PARTITION] = self.collection_name
+        keys = {name: key for key, name in names.items()}
+        
+        rows = self.metadata_index.latest_across(list(keys), doc_type=doc_type, session_id=session_id, limit=limit)
+        ids_by_key: Dict[str, List[str]] = {}
+        for name, id in rows:
+            ids_by_key.setdefault(keys[name], []).append(id)
+        
+        items: Dict[tuple, Dict[str, Any]] = {}
+        for key, ids in ids_by_key.items():
+            part = self._partition(key, create=False)
+            if part is None:
+                continue
+            for item in self._get(ids=ids, part=part):
+                items[(part.name, item["id"])] = item
+        return [items[row] for row in rows if row in items]
+    
     def get_collection_stats(self) -> Dict[str, Any]:
         """获取集合统计信息"""
+        stats = {
+            "collection": self.collection_name,
+            "model": self.config.get("embedding_model", self.config.get("model_name")),
+            "backend": getattr(self.embedding_model, "backend", None),
+            "space": self.space,
+        }
         try:
-            count = self.db._collection.count()
-            return {
-                "count": count,
-                "model": self.model_name,
-                "collection": self.config['collection_name']
-            }
+            stats["count"] = self.collection.count()
+            stats["hnsw"] = {**HNSW_DEFAULTS, **(getattr(self.collection, "metadata", None) or {})}
         except Exception as e:
             logger.error(f"获取集合统计信息失败: {str(e)}")
-            return {
-                "count": 0,
-                "model": self.model_name,
-                "collection": self.config['collection_name'],
-                "error": str(e)
-            }
+            stats.update({"count": 0, "error": str(e)})
+        return stats
@@ -0,0 +1,141 @@
+from typing import List, Dict, Any, Optional
+import time
+import asyncio
+import threading
+from loguru import logger
+
+# 预热状态
+STATUS_WARMING_UP = "warming_up"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+
+# 预热批次使用的文本（中英混合，覆盖分词和推理路径）
+WARMUP_TEXTS = [
+    "假设: 睡眠时长与短期记忆巩固呈正相关",
+    "Hypothesis: CRISPR knockout of BRCA1 increases sensitivity to PARP inhibitors",
+]
+
+
+class WarmingUpError(RuntimeError):
+    """向量库仍在后台加载"""
+
+
+class BackgroundVectorStore:
+    """在后台线程中加载VectorStore，不阻塞UI和Brain的启动
+
+    加载完成后先跑一批embedding（以及启用时的重排模型）完成预热，之后才标记为就绪。
+    就绪前：检索类调用返回空结果，写入最多等待 warmup_wait_timeout 秒，
+    其余属性访问抛出 WarmingUpError。就绪后所有调用直接转发给内部的VectorStore。
+    """
+
+    def __init__(self, config: Dict[str, Any] = None):
+        self.config = config or {}
+        self.wait_timeout = self.config.get("warmup_wait_timeout", 60)
+        self._store = None
+        self._error: Optional[BaseException] = None
+        self._ready = threading.Event()
+        self._done = threading.Event()
+        self._started_at: Optional[float] = None
+        self._ready_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "BackgroundVectorStore":
+        """启动后台加载线程"""
+        if self._thread is None:
+            self._started_at = time.perf_counter()
+            self._thread = threading.Thread(target=self._load, name="vector-store-warmup", daemon=True)
+            self._thread.start()
+        return self
+
+    def _load(self):
+        try:
+            from .vector_store import VectorStore
+
+            store = VectorStore(self.config)
+            self._warm_up(store)
+            self._store = store
+            self._ready_at = time.perf_counter()
+            self._ready.set()
+            logger.info(f"向量库预热完成，耗时 {self._ready_at - self._started_at:.1f} 秒")
+        except Exception as e:
+            self._error = e
+            logger.error(f"向量库后台加载失败: {str(e)}")
+        finally:
+            self._done.set()
+
+    def _warm_up(self, store):
+        """跑一批embedding，触发模型权重加载和推理图初始化"""
+        store.embedding_model.encode(WARMUP_TEXTS)
+        if store.reranker is not None:
+            try:
+                store.reranker.warm_up()
+            except Exception as e:
+                logger.warning(f"重排模型预热失败: {str(e)}")
+
+    # ---------- 状态 ----------
+
+    @property
+    def status(self) -> str:
+        if self._ready.is_set():
+            return STATUS_READY
+        if self._error is not None:
+            return STATUS_FAILED
+        return STATUS_WARMING_UP
+
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def readiness(self) -> Dict[str, Any]:
+        """就绪探针的返回内容"""
+        now = self._ready_at or time.perf_counter()
+        return {
+            "status": self.status,
+            "ready": self.is_ready(),
+            "elapsed_seconds": round(now - self._started_at, 2) if self._started_at else None,
+            "error": str(self._error) if self._error else None,
+        }
+
+    async def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """等待加载完成（成功或失败），返回是否就绪"""
+        if not self._done.is_set():
+            await asyncio.to_thread(self._done.wait, timeout)
+        return self.is_ready()
+
+    # ---------- 转发 ----------
+
+    @property
+    def store(self):
+        """就绪后的VectorStore，未就绪时抛出 WarmingUpError"""
+        if not self._ready.is_set():
+            raise WarmingUpError(f"向量库尚未就绪 ({self.status})")
+        return self._store
+
+    def __getattr__(self, name: str):
+        # 只有自身没有的属性才会走到这里
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.store, name)
+
+    async def store_embeddings(self, texts: List[str], metadatas: List[Dict[str, Any]] = None, **kwargs) -> List[str]:
+        """写入前等待预热完成，避免丢失生成结果"""
+        if not await self.wait_ready(self.wait_timeout):
+            raise WarmingUpError(f"向量库尚未就绪 ({self.status})，写入被放弃")
+        return await self._store.store_embeddings(texts, metadatas, **kwargs)
+
+    async def search(self, query: str, *args, **kwargs) -> List[Dict[str, Any]]:
+        if not self.is_ready():
+            logger.info("向量库预热中，检索返回空结果")
+            return []
+        return await self._store.search(query, *args, **kwargs)
+
+    async def get(self, *args, **kwargs) -> List[Dict[str, Any]]:
+        if not self.is_ready():
+            logger.info("向量库预热中，读取返回空结果")
+            return []
+        return await self._store.get(*args, **kwargs)
+
+    async def list_recent(self, *args, **kwargs) -> List[Dict[str, Any]]:
+        if not self.is_ready():
+            logger.info("向量库预热中，读取返回空结果")
+            return []
+        return await self._store.list_recent(*args, **kwargs)
@@ -0,0 +1,211 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List, Optional, Set
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import deque
+from loguru import logger
+from .task_store import redis_client, sqlite_path
+
+
+def session_channel(session_id: str) -> str:
+    """会话的事件频道：同一会话的流式片段和结果都发布到这里，界面按会话ID订阅"""
+    return f"session:{session_id}"
+
+
+def control_channel(session_id: str) -> str:
+    """会话的控制频道：界面进程发出停止请求，执行该会话任务的worker据此取消执行"""
+    return f"control:{session_id}"
+
+
+class Subscription(ABC):
+    """单个频道的订阅"""
+
+    @abstractmethod
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """等待下一条消息，超时返回None"""
+
+    def close(self):
+        pass
+
+
+class EventBus(ABC):
+    """worker向界面进程回传流式片段和结果的发布/订阅通道
+
+    必须先订阅再提交任务，否则可能错过最早的消息；消息丢失时调用方应回退到查询任务结果。
+    """
+
+    @abstractmethod
+    def publish(self, channel: str, message: Dict[str, Any]):
+        """发布消息（不保证送达）"""
+
+    @abstractmethod
+    def subscribe(self, channel: str) -> Subscription:
+        """订阅频道"""
+
+    def close(self):
+        pass
+
+
+class _MemorySubscription(Subscription):
+    def __init__(self, bus: "MemoryEventBus", channel: str):
+        self.bus = bus
+        self.channel = channel
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.bus._unsubscribe(self)
+
+
+class MemoryEventBus(EventBus):
+    """进程内事件总线，与内存任务后端配套"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[_MemorySubscription]] = {}
+
+    def publish(self, channel: str, message: Dict[str, Any]):
+        for subscription in self._subscribers.get(channel, ()):
+            subscription.queue.put_nowait(message)
+
+    def subscribe(self, channel: str) -> Subscription:
+        subscription = _MemorySubscription(self, channel)
+        self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: _MemorySubscription):
+        subscribers = self._subscribers.get(subscription.channel)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.channel]
+
+
+class _SQLiteSubscription(Subscription):
+    def __init__(self, bus: "SQLiteEventBus", channel: str):
+        self.bus = bus
+        self.channel = channel
+        self.last_seq = bus._last_seq()
+        self._buffer: deque = deque()
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout
+        while not self._buffer:
+            rows = await asyncio.to_thread(self.bus._read, self.channel, self.last_seq)
+            if rows:
+                self.last_seq = rows[-1][0]
+                self._buffer.extend(json.loads(payload) for _, payload in rows)
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            await asyncio.sleep(min(self.bus.poll_interval, remaining))
+        return self._buffer.popleft()
+
+
+class SQLiteEventBus(EventBus):
+    """单机多进程的事件总线：消息写入SQLite表，订阅方按序号轮询
+
+    消息只保留 ttl 秒，写入时顺带清理过期消息，表的大小保持稳定。
+    """
+
+    def __init__(self, path: str, ttl: float = 600, poll_interval: float = 0.05):
+        self.path = path
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._published = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_events_channel ON events (channel, seq);
+        """)
+
+    def publish(self, channel: str, message: Dict[str, Any]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO events (channel, payload, created_at) VALUES (?, ?, ?)",
+                (channel, json.dumps(message, ensure_ascii=False, default=str), time.time())
+            )
+            self._published += 1
+            if self._published % 1000 == 0:
+                self._conn.execute("DELETE FROM events WHERE created_at < ?", (time.time() - self.ttl,))
+
+    def subscribe(self, channel: str) -> Subscription:
+        return _SQLiteSubscription(self, channel)
+
+    def _last_seq(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM events").fetchone()[0]
+
+    def _read(self, channel: str, after: int) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT seq, payload FROM events WHERE channel = ? AND seq > ? ORDER BY seq LIMIT 500",
+                (channel, after)
+            ).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class _RedisSubscription(Subscription):
+    def __init__(self, client, channel: str):
+        self.pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(channel)
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        message = await asyncio.to_thread(self.pubsub.get_message, timeout=timeout)
+        if message is None:
+            return None
+        return json.loads(message["data"])
+
+    def close(self):
+        try:
+            self.pubsub.close()
+        except Exception as e:
+            logger.warning(f"关闭Redis订阅失败: {str(e)}")
+
+
+class RedisEventBus(EventBus):
+    """多节点事件总线，基于Redis PUBLISH/SUBSCRIBE"""
+
+    def __init__(self, client, prefix: str = "ai_scientist"):
+        self.client = client
+        self.prefix = prefix
+
+    def publish(self, channel: str, message: Dict[str, Any]):
+        self.client.publish(f"{self.prefix}:{channel}", json.dumps(message, ensure_ascii=False, default=str))
+
+    def subscribe(self, channel: str) -> Subscription:
+        return _RedisSubscription(self.client, f"{self.prefix}:{channel}")
+
+
+def create_event_bus(config: Dict[str, Any]) -> EventBus:
+    """与任务后端使用同一种存储：memory / sqlite / redis"""
+    backend_config = config.get("task_backend") or {}
+    backend_type = backend_config.get("type", "memory")
+
+    if backend_type == "sqlite":
+        url = backend_config.get("url") or (config.get("database") or {}).get("url", "sqlite:///research.db")
+        return SQLiteEventBus(sqlite_path(url), ttl=backend_config.get("event_ttl", 600))
+    if backend_type == "redis":
+        return RedisEventBus(redis_client(config.get("redis") or {}), prefix=backend_config.get("prefix", "ai_scientist"))
+    return MemoryEventBus()
@@ -0,0 +1,222 @@
+"""日志配置
+
+默认（enqueue: true）记录在调用线程中格式化为一行文本后放入进程内队列，由后台线程
+写出到stderr和日志文件，终端/磁盘I/O和文件轮转不阻塞事件循环。（loguru自带的
+enqueue 经多进程管道传递并pickle每条记录，调用方开销反而更大，因此不使用。）
+format 为 json 时每行一条紧凑的JSON记录。
+同一调用位置（模块:函数:行号）的 INFO 及以下记录按 rate_limit 限流，超出的丢弃，
+并在该位置下一条输出的记录中带上丢弃数（suppressed）；WARNING 及以上从不丢弃。
+"""
+from typing import Dict, Any, Optional, Tuple
+import os
+import sys
+import json
+import copy
+import time
+import queue
+import atexit
+import threading
+from loguru import logger
+
+TEXT_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>{extra[_suppressed]}"
+)
+
+DEFAULT_LOGGING = {
+    "level": "INFO",
+    "format": "text",
+    "enqueue": True,
+    "console": True,
+    "file": {"path": "logs/ai_scientist.log", "level": "INFO", "rotation": "500 MB", "retention": "10 days"},
+    "rate_limit": {"per_site": 20, "interval": 1.0},
+}
+
+_WARNING_NO = 30
+
+
+class SiteRateLimiter:
+    """按调用位置限流：每个位置每 interval 秒最多 per_site 条（INFO及以下）"""
+
+    def __init__(self, per_site: int = 20, interval: float = 1.0):
+        self.per_site = per_site
+        self.interval = interval
+        # 位置 -> [窗口起点, 窗口内条数, 已丢弃条数]
+        self._sites: Dict[Tuple[str, str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, record) -> bool:
+        # 多个处理器共用一个限流器，同一条记录只判断一次
+        keep = record["extra"].get("_keep")
+        if keep is None:
+            keep = record["extra"]["_keep"] = self._decide(record)
+        return keep
+
+    def _decide(self, record) -> bool:
+        if self.per_site <= 0 or record["level"].no >= _WARNING_NO:
+            return True
+        key = (record["name"], record["function"], record["line"])
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                site = self._sites[key] = [now, 0, 0]
+            if now - site[0] >= self.interval:
+                site[0] = now
+                site[1] = 0
+            if site[1] >= self.per_site:
+                site[2] += 1
+                return False
+            site[1] += 1
+            suppressed, site[2] = site[2], 0
+        if suppressed:
+            record["extra"]["suppressed"] = suppressed
+            record["extra"]["_suppressed"] = f" (同一位置此前丢弃 {suppressed} 条)"
+        return True
+
+
+def _json_format(record) -> str:
+    """把记录编码为一行JSON，放在 extra 中由格式模板原样输出"""
+    payload = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "logger": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+        "message": record["message"],
+    }
+    extra = {key: value for key, value in record["extra"].items() if not key.startswith("_")}
+    if extra:
+        payload["extra"] = extra
+    if record["exception"] is not None:
+        payload["exception"] = repr(record["exception"].value)
+    record["extra"]["_json"] = json.dumps(payload, ensure_ascii=False, default=str)
+    return "{extra[_json]}\n"
+
+
+class BackgroundWriter:
+    """后台写日志的线程：loguru处理器只把格式化好的行放入队列
+
+    文件由一个独立的loguru实例写出（保留 rotation / retention 的行为）。
+    """
+
+    def __init__(self):
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._file_logger = None
+        self._stderr = False
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+
+    def add_stderr(self):
+        self._stderr = True
+        return lambda message: self._queue.put(("stderr", str(message)))
+
+    def add_file(self, path: str, rotation=None, retention=None):
+        # 必须在主 logger 移除全部处理器之后、添加新处理器之前复制，得到没有处理器的独立实例
+        self._file_logger = copy.deepcopy(logger)
+        self._file_logger.add(path, format="{message}", level=0, rotation=rotation, retention=retention, colorize=False)
+        return lambda message: self._queue.put(("file", str(message)))
+
+    def start(self) -> "BackgroundWriter":
+        self._thread.start()
+        atexit.register(self.close)
+        return self
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            pending = [item]
+            # 把已排队的行一次取完，stderr 每批只 flush 一次
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._write(pending)
+                    return
+                pending.append(item)
+            self._write(pending)
+
+    def _write(self, items):
+        wrote_stderr = False
+        for destination, text in items:
+            try:
+                if destination == "stderr":
+                    sys.stderr.write(text)
+                    wrote_stderr = True
+                else:
+                    self._file_logger.opt(raw=True).log("INFO", text)
+            except Exception:
+                pass
+        if wrote_stderr:
+            try:
+                sys.stderr.flush()
+            except Exception:
+                pass
+
+    def close(self):
+        """写完队列中剩余的日志后停止"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+        if self._file_logger is not None:
+            self._file_logger.remove()
+
+
+_writer: Optional[BackgroundWriter] = None
+
+
+def setup_logging(config: Optional[Dict[str, Any]] = None, level: Optional[str] = None, file: bool = True):
+    """按 logging 配置重新设置loguru的处理器
+
+    Args:
+        config: 完整配置（读取其中的 logging 部分），None 时使用默认值
+        level: 覆盖控制台日志级别（命令行 --log-level）
+        file: 是否写日志文件（命令行默认只输出到stderr）
+    """
+    global _writer
+
+    settings = {**DEFAULT_LOGGING, **((config or {}).get("logging") or {})}
+    file_settings = {**DEFAULT_LOGGING["file"], **(settings.get("file") or {})}
+    rate_limit = {**DEFAULT_LOGGING["rate_limit"], **(settings.get("rate_limit") or {})}
+    json_output = settings.get("format") == "json"
+    limiter = SiteRateLimiter(rate_limit.get("per_site", 20), rate_limit.get("interval", 1.0))
+
+    logger.remove()
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+    logger.configure(extra={"_suppressed": ""})
+    writer = BackgroundWriter() if settings.get("enqueue", True) else None
+    file_path = file_settings.get("path") if file else None
+    rotation = file_settings.get("rotation")
+    retention = file_settings.get("retention")
+    file_sink = None
+    if file_path:
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        # 写文件的独立实例要在主 logger 添加任何处理器之前复制（处理器的过滤器持有锁，无法复制）
+        file_sink = writer.add_file(file_path, rotation, retention) if writer else file_path
+
+    if settings.get("console", True):
+        colorize = not json_output and sys.stderr.isatty()
+        logger.add(
+            writer.add_stderr() if writer else sys.stderr,
+            level=level or settings.get("level", "INFO"),
+            format=_json_format if json_output else TEXT_FORMAT,
+            filter=limiter,
+            colorize=colorize
+        )
+    if file_sink is not None:
+        options = {} if writer else {"rotation": rotation, "retention": retention}
+        logger.add(
+            file_sink,
+            level=file_settings.get("level", "INFO"),
+            format=_json_format if json_output else TEXT_FORMAT,
+            filter=limiter,
+            colorize=False,
+            **options
+        )
+    if writer is not None:
+        _writer = writer.start()
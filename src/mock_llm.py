@@ -0,0 +1,204 @@
+"""本地的 OpenAI 兼容模拟服务，用于基准测试
+
+    python -m src.cli mock-llm --port 8900 --token-rate 50 --latency 0.3 --error-rate 0.02
+
+提供 POST /v1/chat/completions（流式SSE与非流式）和 GET /v1/models。按提示内容返回
+固定的回复（假设生成、评估打分、实验设计、子任务分解），可配置输出速度、首个片段延迟、抖动和
+错误注入。Brain 的 llm.base_url 指向 http://host:port/v1 即可使用。
+"""
+from typing import Dict, Any, List, Optional
+import json
+import time
+import random
+import asyncio
+from loguru import logger
+
+HYPOTHESES_REPLY = """假设1：睡眠时长与短期记忆巩固呈倒U型关系
+理论依据：睡眠期间海马体重放促进记忆从短期向长期转移，过短或过长的睡眠都会打乱睡眠周期。
+验证方法：招募120名受试者随机分配到5至10小时的睡眠组，次日进行词语回忆测试。
+影响因素：年龄、咖啡因摄入、睡眠质量和测试时间。
+
+假设2：午间小睡能够部分抵消夜间睡眠不足对警觉度的影响
+理论依据：短时小睡可以降低腺苷积累带来的睡眠压力，恢复前额叶的警觉功能。
+验证方法：在限制夜间睡眠的受试者中比较20分钟小睡组与对照组的反应时测验成绩。
+影响因素：小睡时长、入睡时间、个体昼夜节律类型。
+
+假设3：规律的入睡时间比总睡眠时长更能预测学业表现
+理论依据：昼夜节律的稳定性影响认知功能的日间波动，不规律作息会造成类似时差的效果。
+验证方法：用可穿戴设备记录学生一个学期的作息，与期末成绩做多元回归分析。
+影响因素：课程安排、通勤时间、电子设备使用和社会时差。
+"""
+
+EVALUATION_REPLY = '{"scores": {"novelty": 7, "feasibility": 8, "impact": 6}, "comments": "设计清晰，可在现有条件下完成。"}'
+
+SUBTASKS_REPLY = """[
+  {"id": "t1", "type": "generate_hypothesis", "goal": "提出关于睡眠与记忆关系的假设", "depends_on": []},
+  {"id": "t2", "type": "generate_hypothesis", "goal": "提出关于作息规律与学业表现的假设", "depends_on": []}
+]"""
+
+EXPERIMENT_REPLY = """实验材料：可穿戴睡眠监测设备、标准化词语回忆测验。
+实验步骤：受试者随机分组，连续两周控制睡眠时长，每周末进行一次测验。
+数据收集：记录每晚的睡眠时长、睡眠分期和测验成绩。
+分析方法：重复测量方差分析，比较各组成绩差异。
+预期结果：中等睡眠时长组的回忆成绩最高。
+"""
+
+GENERIC_REPLY = "这是模拟服务的回复，用于测试流式输出的吞吐量和延迟。"
+
+
+def canned_reply(prompt: str) -> str:
+    """按提示内容选择固定回复"""
+    if "分解为子任务" in prompt:
+        return SUBTASKS_REPLY
+    if "打分" in prompt:
+        return EVALUATION_REPLY
+    if "实验方案" in prompt:
+        return EXPERIMENT_REPLY
+    if "假设" in prompt:
+        return HYPOTHESES_REPLY
+    return GENERIC_REPLY
+
+
+def split_tokens(text: str, chars_per_token: int = 2) -> List[str]:
+    """按固定字符数切分为“token”，中文大致每1-2个字一个token"""
+    return [text[i:i + chars_per_token] for i in range(0, len(text), chars_per_token)]
+
+
+class MockLLMServer:
+    """OpenAI 兼容的模拟服务
+
+    Args:
+        token_rate: 每秒输出的token数（0为不限速）
+        latency: 首个片段前的延迟秒数
+        jitter: 延迟和每个token间隔的随机抖动比例
+        error_rate: 请求直接返回500的概率
+        abort_rate: 流式输出中途断开的概率
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8900, token_rate: float = 50, latency: float = 0.3,
+                 jitter: float = 0.1, error_rate: float = 0.0, abort_rate: float = 0.0, seed: Optional[int] = None):
+        self.host = host
+        self.port = port
+        self.token_rate = token_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.abort_rate = abort_rate
+        self.random = random.Random(seed)
+        self.stats = {"requests": 0, "errors": 0, "aborts": 0, "tokens": 0}
+        self._runner = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def _delay(self, seconds: float) -> float:
+        if seconds <= 0:
+            return 0.0
+        return max(0.0, seconds * (1 + self.random.uniform(-self.jitter, self.jitter)))
+
+    def build_app(self):
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_get("/v1/models", self.models)
+        return app
+
+    async def models(self, request):
+        from aiohttp import web
+
+        return web.json_response({"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+
+    async def chat_completions(self, request):
+        from aiohttp import web
+
+        body = await request.json()
+        self.stats["requests"] += 1
+        if self.random.random() < self.error_rate:
+            self.stats["errors"] += 1
+            return web.json_response(
+                {"error": {"message": "模拟的服务端错误", "type": "server_error"}}, status=500
+            )
+
+        prompt = "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+        model = body.get("model", "mock")
+        tokens = split_tokens(canned_reply(prompt))
+        usage = {
+            "prompt_tokens": max(1, len(prompt) // 2),
+            "completion_tokens": len(tokens),
+            "total_tokens": max(1, len(prompt) // 2) + len(tokens),
+        }
+        completion_id = f"chatcmpl-mock-{self.stats['requests']}"
+        await asyncio.sleep(self._delay(self.latency))
+
+        if not body.get("stream"):
+            if self.token_rate > 0:
+                await asyncio.sleep(self._delay(len(tokens) / self.token_rate))
+            self.stats["tokens"] += len(tokens)
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        abort_at = self.random.randrange(len(tokens)) if self.random.random() < self.abort_rate else None
+        interval = 1 / self.token_rate if self.token_rate > 0 else 0
+
+        def event(delta: Dict[str, Any], finish_reason=None, **extra) -> bytes:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                **extra,
+            }
+            return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+
+        await response.write(event({"role": "assistant", "content": ""}))
+        for index, token in enumerate(tokens):
+            if index == abort_at:
+                self.stats["aborts"] += 1
+                # 不发送结束标记直接断开，模拟连接中断
+                request.transport.close()
+                return response
+            if interval:
+                await asyncio.sleep(self._delay(interval))
+            await response.write(event({"content": token}))
+            self.stats["tokens"] += 1
+        await response.write(event({}, "stop"))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            chunk = json.loads(event({})[6:])
+            chunk["choices"] = []
+            chunk["usage"] = usage
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def start(self) -> "MockLLMServer":
+        from aiohttp import web
+
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if self.port == 0:
+            # 端口为0时由系统分配
+            self.port = site._server.sockets[0].getsockname()[1]
+        logger.info(
+            f"模拟LLM服务已启动: {self.base_url}（{self.token_rate} token/s，延迟 {self.latency}s，"
+            f"错误率 {self.error_rate}，中断率 {self.abort_rate}）"
+        )
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,234 @@
+"""研究流程的阶段图
+
+    literature ─────────────┐
+    hypotheses ──(每个假设)──> evaluation ──(同一假设)──> experiment_design
+                                  └──(全部)──> ranking
+
+文献检索与假设生成并发进行；每个假设生成后独立地评估和设计实验。
+各阶段的超时、并发上限和开关在 pipeline.stages.<阶段名> 中配置。
+"""
+from typing import Dict, Any, List
+import re
+import json
+from .agents.types import AgentType, TaskType, ResearchStage
+from .stage_graph import Stage, StageGraph, StageContext
+
+# 阶段名到研究阶段的对应，用于记录会话的阶段切换
+RESEARCH_STAGES = {
+    "literature": ResearchStage.LITERATURE,
+    "hypotheses": ResearchStage.HYPOTHESIS,
+    "evaluation": ResearchStage.EVALUATION,
+    "experiment_design": ResearchStage.EXPERIMENT,
+    "ranking": ResearchStage.RANKING,
+}
+
+DEFAULT_STAGE_CONFIG = {
+    "literature": {"enabled": True, "timeout": 30, "top_k": 5},
+    "hypotheses": {"enabled": True, "timeout": 300},
+    "evaluation": {"enabled": True, "timeout": 120, "concurrency": 4},
+    "experiment_design": {"enabled": False, "timeout": 180, "concurrency": 2},
+    "ranking": {"enabled": True},
+}
+
+DEFAULT_METRICS = ["novelty", "feasibility", "impact"]
+
+# 各阶段提示模板的版本：修改提示后递增，对应阶段的缓存随之失效
+# （假设生成的提示在 GeneratorAgent 中，版本见 GeneratorAgent.PROMPT_VERSION）
+PROMPT_VERSIONS = {
+    "evaluation": "1",
+    "experiment_design": "1",
+}
+
+
+async def _collect(brain, prompt: str, task_type: TaskType) -> str:
+    """非流式地取完整回复"""
+    parts = []
+    async for chunk in brain.think(prompt, task_type):
+        parts.append(chunk)
+    return "".join(parts)
+
+
+def _parse_json(text: str) -> Dict[str, Any]:
+    """从模型回复中取出第一个JSON对象"""
+    match = re.search(r"\{.*\}", text, re.S)
+    if not match:
+        raise ValueError("回复中没有JSON")
+    return json.loads(match.group(0))
+
+
+def _describe(hypothesis: Dict[str, Any]) -> str:
+    content = hypothesis.get("content", {})
+    return (
+        f"假设：{content.get('description', '')}\n"
+        f"理论依据：{content.get('theoretical_basis', '')}\n"
+        f"验证方法：{content.get('verification_method', '')}\n"
+        f"影响因素：{content.get('influencing_factors', '')}"
+    )
+
+
+class ResearchPipeline:
+    """研究流程中各阶段的实现，阶段函数只依赖 Supervisor 中的 brain、memory 和智能体"""
+
+    def __init__(self, supervisor, config: Dict[str, Any]):
+        self.supervisor = supervisor
+        self.config = config
+        stage_config = (config.get("pipeline") or {}).get("stages") or {}
+        self.stage_config = {
+            name: {**defaults, **(stage_config.get(name) or {})}
+            for name, defaults in DEFAULT_STAGE_CONFIG.items()
+        }
+        reflector_config = (config.get("agents") or {}).get("reflector") or {}
+        self.metrics = reflector_config.get("evaluation_metrics") or DEFAULT_METRICS
+
+    def build(self) -> StageGraph:
+        """按配置构建阶段图；被关闭的阶段从图中移除，依赖它的 after 关系随之去掉"""
+        generator = self.supervisor.agents[AgentType.GENERATOR]
+        declarations = [
+            # 检索结果随向量库内容变化，不缓存
+            Stage("literature", self.literature),
+            Stage(
+                "hypotheses", self.hypotheses, cacheable=True,
+                version=generator.PROMPT_VERSION, input_keys=["question", "background"],
+                on_cached=self.store_cached_hypotheses
+            ),
+            Stage(
+                "evaluation", self.evaluation, depends_on=["literature"], for_each="hypotheses", cacheable=True,
+                version=f"{PROMPT_VERSIONS['evaluation']}:{','.join(self.metrics)}", input_keys=["question"]
+            ),
+            Stage(
+                "experiment_design", self.experiment_design, for_each="hypotheses", after=["evaluation"], cacheable=True,
+                version=PROMPT_VERSIONS["experiment_design"], input_keys=["question"]
+            ),
+            Stage("ranking", self.ranking, depends_on=["hypotheses", "evaluation"]),
+        ]
+        enabled = {name for name, config in self.stage_config.items() if config.get("enabled", True)}
+        if "hypotheses" not in enabled:
+            raise ValueError("hypotheses 阶段不能关闭")
+
+        stages = []
+        for stage in declarations:
+            if stage.name not in enabled or (stage.for_each and stage.for_each not in enabled):
+                continue
+            if stage.name == "ranking" and "evaluation" not in enabled:
+                # 排名依赖评估结果
+                continue
+            stage.depends_on = [dependency for dependency in stage.depends_on if dependency in enabled]
+            stage.after = [dependency for dependency in stage.after if dependency in enabled]
+            config = self.stage_config[stage.name]
+            stage.timeout = config.get("timeout")
+            stage.concurrency = config.get("concurrency", 0)
+            stages.append(stage)
+        return StageGraph(stages)
+
+    # ---------- 阶段 ----------
+
+    async def literature(self, ctx: StageContext) -> List[Dict[str, Any]]:
+        """从向量库检索与问题相关的已有内容"""
+        content = ctx.inputs.get("content", {})
+        query = f"{content.get('question', '')}\n{content.get('background', '')}".strip()
+        results = await self.supervisor.memory.search(query, limit=self.stage_config["literature"]["top_k"])
+        return [
+            {"content": item.get("content"), "metadata": item.get("metadata", {}), "distance": item.get("distance")}
+            for item in results
+        ]
+
+    async def hypotheses(self, ctx: StageContext) -> List[Dict[str, Any]]:
+        """调用生成智能体，转发流式片段"""
+        generator = self.supervisor.agents[AgentType.GENERATOR]
+        metrics = self.supervisor.agent_metrics
+        async for update in metrics.stream(generator, ctx.inputs, TaskType.GENERATE_HYPOTHESIS.value):
+            if update["status"] == "generating":
+                await ctx.emit(update)
+            elif update["status"] == "success":
+                if not update.get("hypotheses"):
+                    raise ValueError("未能生成有效的研究假设")
+                return update["hypotheses"]
+            else:
+                raise RuntimeError(update.get("message", "生成假设失败"))
+        raise RuntimeError("生成假设没有返回结果")
+
+    async def store_cached_hypotheses(self, ctx: StageContext, hypotheses: List[Dict[str, Any]]):
+        """假设命中缓存时没有调用生成智能体，由这里把假设写入本会话的分区"""
+        generator = self.supervisor.agents[AgentType.GENERATOR]
+        await generator._store_hypotheses(hypotheses, ctx.inputs.get("session_id"))
+
+    async def evaluation(self, ctx: StageContext) -> Dict[str, Any]:
+        """按配置的指标给单个假设打分"""
+        hypothesis = ctx.item
+        literature = ctx.outputs.get("literature") or []
+        context = "\n".join(f"- {item['content']}" for item in literature[:3] if item.get("content"))
+        prompt = f"""# 研究问题
+{ctx.inputs.get('content', {}).get('question', '')}
+
+# 待评估的假设
+{_describe(hypothesis)}
+
+# 相关已有内容
+{context or '无'}
+
+# 任务
+请从以下维度为该假设打分（1-10分）：{', '.join(self.metrics)}。
+只输出JSON，格式为：{{"scores": {{"维度": 分数}}, "comments": "简要评语"}}
+"""
+        text = await _collect(self.supervisor.brain, prompt, TaskType.EVALUATE_HYPOTHESIS)
+        parsed = _parse_json(text)
+        scores = {metric: float(parsed.get("scores", {}).get(metric, 0)) for metric in self.metrics}
+        return {
+            "hypothesis_id": hypothesis.get("id"),
+            "scores": scores,
+            "overall": round(sum(scores.values()) / len(scores), 2) if scores else 0.0,
+            "comments": parsed.get("comments", ""),
+        }
+
+    async def experiment_design(self, ctx: StageContext) -> Dict[str, Any]:
+        """为单个假设设计验证实验"""
+        hypothesis = ctx.item
+        evaluation = ctx.item_outputs.get("evaluation")
+        prompt = f"""# 研究问题
+{ctx.inputs.get('content', {}).get('question', '')}
+
+# 假设
+{_describe(hypothesis)}
+
+# 评估意见
+{evaluation.get('comments', '') if evaluation else '无'}
+
+# 任务
+请设计一个验证该假设的实验方案，包括实验材料、步骤、数据收集、分析方法和预期结果。
+"""
+        design = await _collect(self.supervisor.brain, prompt, TaskType.DESIGN_EXPERIMENT)
+        return {"hypothesis_id": hypothesis.get("id"), "design": design.strip()}
+
+    async def ranking(self, ctx: StageContext) -> List[Dict[str, Any]]:
+        """按评估总分排序"""
+        evaluations = [evaluation for evaluation in ctx.outputs.get("evaluation") or [] if evaluation]
+        ranked = sorted(evaluations, key=lambda evaluation: evaluation["overall"], reverse=True)
+        return [
+            {"rank": index + 1, "hypothesis_id": evaluation["hypothesis_id"], "overall": evaluation["overall"]}
+            for index, evaluation in enumerate(ranked)
+        ]
+
+
+def research_result(inputs: Dict[str, Any], graph_run) -> Dict[str, Any]:
+    """把阶段图的执行结果整理为研究结果"""
+    outputs = graph_run.outputs
+    content = inputs.get("content", {})
+    hypotheses = outputs.get("hypotheses") or []
+    result = {
+        "status": "success" if hypotheses else "error",
+        "research_question": content.get("question", ""),
+        "background": content.get("background", ""),
+        "hypotheses": hypotheses,
+        "evaluation": {
+            evaluation["hypothesis_id"]: evaluation for evaluation in outputs.get("evaluation") or [] if evaluation
+        },
+        "experiments": [design for design in outputs.get("experiment_design") or [] if design],
+        "literature": outputs.get("literature") or [],
+        "ranking": outputs.get("ranking") or [],
+        "stage": (ResearchStage.COMPLETE if hypotheses else ResearchStage.HYPOTHESIS).value,
+        "timing": graph_run.summary(),
+    }
+    if not hypotheses:
+        error = graph_run.report.get("hypotheses", {}).get("error")
+        result["message"] = f"未能生成有效的研究假设: {error}" if error else "未能生成有效的研究假设"
+    return result
@@ -0,0 +1,410 @@
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+import os
+import json
+import uuid
+import shutil
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+from collections import OrderedDict
+from loguru import logger
+from .agents.types import ResearchStage
+
+
+def new_session_id(question: str, background: str) -> str:
+    """16位十六进制的会话ID：问题、背景、时间和随机数的哈希，不在ID中携带用户文本"""
+    seed = f"{datetime.now().isoformat()}\x00{uuid.uuid4().hex}\x00{question}\x00{background}"
+    return hashlib.blake2b(seed.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class ResearchSession:
+    """研究会话类，管理单个研究的完整状态
+
+    会话状态由事件推导：每次修改都生成一条事件（带递增的 seq），先应用到内存状态，
+    再留在 pending 中等待 SessionStore.save 追加写入事件日志。
+    """
+
+    __slots__ = (
+        "id", "question", "background", "created_at", "updated_at", "stage", "status",
+        "hypotheses", "evaluation", "experiments", "literature", "messages", "artifacts",
+        "seq", "snapshot_seq", "pending"
+    )
+
+    def __init__(self, session_id: str, question: str, background: str):
+        self.id = session_id
+        self.question = question
+        self.background = background
+        self.created_at = datetime.now().isoformat()
+        self.updated_at = self.created_at
+        self.stage = ResearchStage.INITIAL
+        self.status = "initialized"
+        self.hypotheses = []
+        self.evaluation = {}
+        self.experiments = []
+        self.literature = {}
+        self.messages = []
+        self.artifacts = {}
+        self.seq = 0  # 已应用的最后一条事件
+        self.snapshot_seq = 0  # 最近一次快照覆盖到的事件
+        self.pending: List[Dict[str, Any]] = []  # 尚未写入日志的事件
+
+    # ---------- 事件 ----------
+
+    def _record(self, event_type: str, data: Dict[str, Any]):
+        event = {"seq": self.seq + 1, "type": event_type, "ts": datetime.now().isoformat(), "data": data}
+        self.apply(event)
+        self.pending.append(event)
+
+    def apply(self, event: Dict[str, Any]):
+        """把一条事件应用到内存状态（写入和回放共用）"""
+        data = event["data"]
+        event_type = event["type"]
+        if event_type == "created":
+            self.question = data["question"]
+            self.background = data["background"]
+            self.created_at = event["ts"]
+        elif event_type == "update":
+            for key, value in data.items():
+                if key in self.__slots__:
+                    setattr(self, key, value)
+        elif event_type == "stage":
+            self.stage = ResearchStage(data["stage"])
+            if data.get("status"):
+                self.status = data["status"]
+        elif event_type == "chunks":
+            self.artifacts["stream_text"] = self.artifacts.get("stream_text", "") + data["text"]
+        elif event_type == "hypothesis":
+            self.hypotheses.append(data["hypothesis"])
+        elif event_type == "evaluation":
+            self.evaluation.update(data["evaluation"])
+        elif event_type == "message":
+            self.messages.append({"role": data["role"], "content": data["content"], "timestamp": event["ts"]})
+        else:
+            logger.warning(f"会话 {self.id} 中有未知事件类型: {event_type}")
+        self.seq = event["seq"]
+        self.updated_at = event["ts"]
+
+    # ---------- 修改 ----------
+
+    def update(self, data: Dict[str, Any]):
+        """更新会话状态"""
+        data = {key: value for key, value in data.items() if key in self.__slots__ and key not in ("seq", "snapshot_seq", "pending")}
+        if "stage" in data:
+            self.set_stage(data.pop("stage"), data.pop("status", None))
+        if data:
+            self._record("update", data)
+
+    def set_stage(self, stage: ResearchStage, status: Optional[str] = None):
+        """阶段切换"""
+        self._record("stage", {"stage": ResearchStage(stage).value, "status": status})
+
+    def add_chunks(self, text: str):
+        """追加一批流式片段"""
+        if text:
+            self._record("chunks", {"text": text})
+
+    def add_hypothesis(self, hypothesis: Dict[str, Any]):
+        self._record("hypothesis", {"hypothesis": hypothesis})
+
+    def set_evaluation(self, evaluation: Dict[str, Any]):
+        self._record("evaluation", {"evaluation": evaluation})
+
+    def add_message(self, role: str, content: str):
+        """添加消息"""
+        self._record("message", {"role": role, "content": content})
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        return {
+            "id": self.id,
+            "question": self.question,
+            "background": self.background,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "stage": self.stage,
+            "status": self.status,
+            "hypotheses": self.hypotheses,
+            "evaluation": self.evaluation,
+            "experiments": self.experiments,
+            "literature": self.literature,
+            "messages": self.messages,
+            "artifacts": self.artifacts,
+            "seq": self.seq
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ResearchSession":
+        """从 to_dict 的结果（或其JSON）恢复会话"""
+        session = cls(data["id"], data.get("question", ""), data.get("background", ""))
+        for key in cls.__slots__:
+            if key in data and key != "pending":
+                setattr(session, key, data[key])
+        if isinstance(session.stage, str):
+            session.stage = ResearchStage(session.stage)
+        session.snapshot_seq = session.seq
+        return session
+
+
+class SessionEventLog:
+    """按会话分目录的追加式事件日志
+
+    每个会话的事件依次写入 <dir>/<id前两位>/<id>/<段号>.jsonl（或 .msgpack），
+    当前段超过 segment_bytes 后换新段。写入只追加，不重写已有内容；
+    快照记录写入时的 (段号, 偏移)，加载时只需从该位置往后回放。
+    """
+
+    def __init__(self, directory: str, format: str = "jsonl", segment_bytes: int = 1 << 20):
+        if format not in ("jsonl", "msgpack"):
+            raise ValueError(f"不支持的事件日志格式: {format}")
+        self.directory = directory
+        self.format = format
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _session_dir(self, session_id: str) -> str:
+        return os.path.join(self.directory, session_id[:2], session_id)
+
+    def _segment_path(self, session_id: str, segment: int) -> str:
+        return os.path.join(self._session_dir(session_id), f"{segment:06d}.{self.format}")
+
+    def segments(self, session_id: str) -> List[int]:
+        directory = self._session_dir(session_id)
+        if not os.path.isdir(directory):
+            return []
+        suffix = f".{self.format}"
+        return sorted(int(name[:-len(suffix)]) for name in os.listdir(directory) if name.endswith(suffix))
+
+    def exists(self, session_id: str) -> bool:
+        return bool(self.segments(session_id))
+
+    def position(self, session_id: str) -> Tuple[int, int]:
+        """日志末尾的 (段号, 偏移)"""
+        segments = self.segments(session_id)
+        if not segments:
+            return 0, 0
+        return segments[-1], os.path.getsize(self._segment_path(session_id, segments[-1]))
+
+    def _encode(self, event: Dict[str, Any]) -> bytes:
+        if self.format == "msgpack":
+            import msgpack
+            return msgpack.packb(event, default=_encode, use_bin_type=True)
+        return (json.dumps(event, ensure_ascii=False, default=_encode) + "\n").encode("utf-8")
+
+    def append(self, session_id: str, events: List[Dict[str, Any]]):
+        """追加事件"""
+        if not events:
+            return
+        segment, size = self.position(session_id)
+        if size >= self.segment_bytes:
+            segment += 1
+        os.makedirs(self._session_dir(session_id), exist_ok=True)
+        data = b"".join(self._encode(event) for event in events)
+        path = self._segment_path(session_id, segment)
+        if self.format == "jsonl" and 0 < size < self.segment_bytes and not self._ends_with_newline(path):
+            # 上次写入在行中间中断，先补换行，让残缺的半行独占一行（读取时跳过）
+            data = b"\n" + data
+        with open(path, "ab") as f:
+            f.write(data)
+
+    @staticmethod
+    def _ends_with_newline(path: str) -> bool:
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def read(self, session_id: str, segment: int = 0, offset: int = 0) -> Iterator[Dict[str, Any]]:
+        """从 (段号, 偏移) 开始按顺序读出事件"""
+        for current in self.segments(session_id):
+            if current < segment:
+                continue
+            with open(self._segment_path(session_id, current), "rb") as f:
+                if current == segment:
+                    f.seek(offset)
+                if self.format == "msgpack":
+                    import msgpack
+                    yield from msgpack.Unpacker(f, raw=False)
+                    continue
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # 进程中断时可能留下半行，append 会先补换行，之后的写入从新行开始
+                        logger.warning(f"会话 {session_id} 的事件日志有损坏的行，已跳过")
+
+    def delete(self, session_id: str):
+        shutil.rmtree(self._session_dir(session_id), ignore_errors=True)
+
+
+def _encode(value):
+    if isinstance(value, ResearchStage):
+        return value.value
+    return str(value)
+
+
+class SessionStore:
+    """有界的事件溯源会话存储
+
+    最近使用的 cache_size 个会话保存在内存LRU中。save() 只把新产生的事件追加到
+    事件日志，不重写整个会话；每累计 snapshot_every 条事件，把完整状态连同日志位置
+    写入SQLite作为快照。被淘汰的会话再次访问时，从快照加上其后的事件回放恢复。
+    内存占用只与 cache_size 有关，与累计会话数无关。
+    """
+
+    def __init__(self, path: str, log: SessionEventLog, cache_size: int = 256, snapshot_every: int = 50):
+        self.path = path
+        self.log = log
+        self.cache_size = max(1, cache_size)
+        self.snapshot_every = max(1, snapshot_every)
+        self._cache: "OrderedDict[str, ResearchSession]" = OrderedDict()
+        self._lock = threading.RLock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS session_snapshots (
+                id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        """)
+
+    def __len__(self) -> int:
+        """内存中的会话数"""
+        return len(self._cache)
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __getitem__(self, session_id: str) -> ResearchSession:
+        session = self.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        return session
+
+    def create(self, question: str, background: str) -> ResearchSession:
+        session = ResearchSession(new_session_id(question, background), question, background)
+        session._record("created", {"question": question, "background": background})
+        self.save(session)
+        return session
+
+    def save(self, session: ResearchSession):
+        """追加新事件，必要时写快照，并放入内存缓存"""
+        with self._lock:
+            if session.pending:
+                self.log.append(session.id, session.pending)
+                session.pending = []
+            if session.seq - session.snapshot_seq >= self.snapshot_every:
+                self._snapshot(session)
+            self._cache[session.id] = session
+            self._cache.move_to_end(session.id)
+            self._evict()
+
+    def get(self, session_id: str) -> Optional[ResearchSession]:
+        """读取会话，不在内存中时从快照和事件日志恢复"""
+        with self._lock:
+            session = self._cache.get(session_id)
+            if session is not None:
+                self._cache.move_to_end(session_id)
+                return session
+
+            session = self.load(session_id)
+            if session is None:
+                return None
+            self._cache[session_id] = session
+            self._evict()
+            return session
+
+    def load(self, session_id: str, upto: Optional[int] = None) -> Optional[ResearchSession]:
+        """快照加尾部事件回放；upto 指定时从头回放到该事件为止（用于排查问题）"""
+        segment, offset = 0, 0
+        row = None
+        if upto is None:
+            row = self._conn.execute(
+                "SELECT payload, segment, offset FROM session_snapshots WHERE id = ?", (session_id,)
+            ).fetchone()
+        if row is not None:
+            session = ResearchSession.from_dict(json.loads(row[0]))
+            segment, offset = row[1], row[2]
+        elif self.log.exists(session_id):
+            session = ResearchSession(session_id, "", "")
+        else:
+            return None
+
+        for event in self.log.read(session_id, segment, offset):
+            if upto is not None and event["seq"] > upto:
+                break
+            if event["seq"] > session.seq:
+                session.apply(event)
+        return session
+
+    def events(self, session_id: str) -> Iterator[Dict[str, Any]]:
+        """会话的完整事件历史"""
+        return self.log.read(session_id)
+
+    def _snapshot(self, session: ResearchSession):
+        segment, offset = self.log.position(session.id)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO session_snapshots (id, payload, seq, segment, offset, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                session.id, json.dumps(session.to_dict(), ensure_ascii=False, default=_encode),
+                session.seq, segment, offset, session.updated_at
+            )
+        )
+        session.snapshot_seq = session.seq
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._cache.pop(session_id, None)
+            self._conn.execute("DELETE FROM session_snapshots WHERE id = ?", (session_id,))
+            self.log.delete(session_id)
+
+    def _evict(self):
+        # 事件在 save 时已经写入日志，淘汰时不需要写盘
+        while len(self._cache) > self.cache_size:
+            _, session = self._cache.popitem(last=False)
+            if session.pending:
+                self.log.append(session.id, session.pending)
+                session.pending = []
+
+    def flush(self):
+        """写入未保存的事件，并为有新事件的会话写快照"""
+        with self._lock:
+            count = 0
+            for session in self._cache.values():
+                if session.pending:
+                    self.log.append(session.id, session.pending)
+                    session.pending = []
+                if session.seq > session.snapshot_seq:
+                    self._snapshot(session)
+                    count += 1
+            if count:
+                logger.info(f"已为 {count} 个会话写入快照")
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+
+def create_session_store(config: Dict[str, Any]) -> SessionStore:
+    """按 sessions 配置创建会话存储，快照默认与任务后端共用 database.url"""
+    from .task_store import sqlite_path
+
+    session_config = config.get("sessions") or {}
+    url = session_config.get("url") or (config.get("database") or {}).get("url", "sqlite:///research.db")
+    log = SessionEventLog(
+        session_config.get("log_dir", "data/sessions"),
+        format=session_config.get("log_format", "jsonl"),
+        segment_bytes=session_config.get("segment_bytes", 1 << 20)
+    )
+    return SessionStore(
+        sqlite_path(url),
+        log,
+        cache_size=session_config.get("cache_size", 256),
+        snapshot_every=session_config.get("snapshot_every", 50)
+    )
@@ -0,0 +1,128 @@
+from typing import Dict, Any, Optional
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from loguru import logger
+
+
+def fingerprint(payload: Dict[str, Any]) -> str:
+    """输入的指纹：键排序后的JSON的SHA-256"""
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class StageCache:
+    """按输入指纹缓存阶段输出
+
+    指纹由阶段名、提示模板版本、模型和阶段实际使用的输入（上游输出、条目、请求字段）
+    计算，任何一项变化都会得到新的指纹，因此不需要主动失效。最近使用的条目保存在
+    内存LRU中，全部条目写入SQLite，过期（ttl）或超出 max_entries 的条目被清理。
+    """
+
+    def __init__(self, path: str, ttl: float = 7 * 86400, max_entries: int = 10000, memory_entries: int = 512):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        # fingerprint -> (写入时间, 条目)，与SQLite中一样按 ttl 过期
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = {"hits": 0, "misses": 0}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS stage_cache (
+                fingerprint TEXT PRIMARY KEY,
+                stage TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_stage_cache_created ON stage_cache (created_at);
+        """)
+
+    def get(self, key: str) -> Optional[Any]:
+        """命中时返回 {"output": ...}，未命中返回None（输出本身可能是None）"""
+        with self._lock:
+            expires_before = time.time() - self.ttl
+            cached = self._memory.get(key)
+            if cached is not None:
+                created_at, entry = cached
+                if created_at >= expires_before:
+                    self._memory.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry
+                del self._memory[key]
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM stage_cache WHERE fingerprint = ? AND created_at >= ?",
+                (key, expires_before)
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            entry = json.loads(row[0])
+            self._remember(key, entry, row[1])
+            self.stats["hits"] += 1
+            return entry
+
+    def set(self, key: str, stage: str, output: Any):
+        entry = {"output": output}
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, entry, created_at)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stage_cache (fingerprint, stage, payload, created_at) VALUES (?, ?, ?, ?)",
+                (key, stage, json.dumps(entry, ensure_ascii=False, default=str), created_at)
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._prune()
+
+    def _remember(self, key: str, entry: Dict[str, Any], created_at: float):
+        self._memory[key] = (created_at, entry)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _prune(self):
+        self._conn.execute("DELETE FROM stage_cache WHERE created_at < ?", (time.time() - self.ttl,))
+        self._conn.execute(
+            """
+            DELETE FROM stage_cache WHERE fingerprint IN (
+                SELECT fingerprint FROM stage_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_entries,)
+        )
+
+    def clear(self, stage: Optional[str] = None):
+        """清空缓存（或某个阶段的缓存）"""
+        with self._lock:
+            self._memory.clear()
+            if stage is None:
+                self._conn.execute("DELETE FROM stage_cache")
+            else:
+                self._conn.execute("DELETE FROM stage_cache WHERE stage = ?", (stage,))
+        logger.info(f"已清空阶段缓存: {stage or '全部'}")
+
+
+def create_stage_cache(config: Dict[str, Any]) -> Optional[StageCache]:
+    """按 pipeline.cache 配置创建阶段缓存，未启用时返回None"""
+    from .task_store import sqlite_path
+
+    cache_config = (config.get("pipeline") or {}).get("cache") or {}
+    if not cache_config.get("enabled", True):
+        return None
+    url = cache_config.get("url") or (config.get("database") or {}).get("url", "sqlite:///research.db")
+    return StageCache(
+        sqlite_path(url),
+        ttl=cache_config.get("ttl", 7 * 86400),
+        max_entries=cache_config.get("max_entries", 10000),
+        memory_entries=cache_config.get("memory_entries", 512)
+    )
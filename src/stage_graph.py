@@ -0,0 +1,307 @@
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Sequence
+import time
+import asyncio
+from loguru import logger
+from .stage_cache import fingerprint
+from .telemetry import tracer, STAGE_DURATION
+
+# 阶段/条目的执行结果
+STATE_SUCCESS = "success"
+STATE_ERROR = "error"
+STATE_TIMEOUT = "timeout"
+STATE_SKIPPED = "skipped"
+
+
+class StageContext:
+    """传给阶段函数的上下文"""
+
+    __slots__ = ("stage", "inputs", "outputs", "item", "index", "item_outputs", "emit")
+
+    def __init__(self, stage: str, inputs: Dict[str, Any], outputs: Dict[str, Any], emit,
+                 item: Any = None, index: Optional[int] = None, item_outputs: Optional[Dict[str, Any]] = None):
+        self.stage = stage
+        self.inputs = inputs  # 原始请求
+        self.outputs = outputs  # depends_on 中各阶段的输出
+        self.item = item  # 逐条阶段当前处理的条目
+        self.index = index
+        self.item_outputs = item_outputs or {}  # after 中各阶段对同一条目的输出
+        self.emit = emit  # async emit(update)，向调用方推送流式更新
+
+
+class Stage:
+    """阶段声明
+
+    Args:
+        name: 阶段名
+        run: async run(ctx) -> 输出
+        depends_on: 需要等待其完整输出的阶段
+        for_each: 逐条执行时的条目来源阶段（其输出为列表），每个条目一个调用
+        after: 逐条执行时，同一条目需要先完成的其他逐条阶段
+        timeout: 单次调用的超时秒数
+        concurrency: 同时进行的调用数上限（0为不限）
+        cacheable: 是否按输入指纹缓存输出
+        version: 提示模板版本，修改提示后递增，使旧缓存失效
+        input_keys: 阶段用到的请求字段（inputs["content"] 中的键），None表示全部
+        on_cached: 命中缓存时调用的 async on_cached(ctx, output)，补做阶段函数中除输出以外的副作用
+    """
+
+    def __init__(
+        self,
+        name: str,
+        run: Callable[[StageContext], Awaitable[Any]],
+        depends_on: Sequence[str] = (),
+        for_each: Optional[str] = None,
+        after: Sequence[str] = (),
+        timeout: Optional[float] = None,
+        concurrency: int = 0,
+        cacheable: bool = False,
+        version: str = "1",
+        input_keys: Optional[Sequence[str]] = None,
+        on_cached: Optional[Callable[[StageContext, Any], Awaitable[None]]] = None
+    ):
+        self.name = name
+        self.run = run
+        self.depends_on = list(depends_on)
+        self.for_each = for_each
+        self.after = list(after)
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.cacheable = cacheable
+        self.version = version
+        self.input_keys = list(input_keys) if input_keys is not None else None
+        self.on_cached = on_cached
+
+
+class StageGraph:
+    """声明式阶段图
+
+    每个阶段在依赖就绪后立即启动，相互独立的阶段并发执行；逐条阶段在条目来源就绪后
+    为每个条目启动一个调用，某个条目在 after 阶段完成后即可继续，不必等待其他条目。
+    总耗时由关键路径决定，而不是各阶段耗时之和。阶段失败或超时时，依赖它的阶段
+    （逐条阶段只影响对应条目）被跳过。
+    """
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            for dependency in stage.depends_on + stage.after + ([stage.for_each] if stage.for_each else []):
+                if dependency not in self.stages:
+                    raise ValueError(f"阶段 {stage.name} 依赖不存在的阶段 {dependency}")
+            for dependency in stage.after:
+                if self.stages[dependency].for_each != stage.for_each:
+                    raise ValueError(f"阶段 {stage.name} 的 after 阶段 {dependency} 必须逐条处理同一来源")
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        order: List[str] = []
+        state: Dict[str, int] = {}
+
+        def visit(name: str, path: List[str]):
+            if state.get(name) == 2:
+                return
+            if state.get(name) == 1:
+                raise ValueError(f"阶段图存在环: {' -> '.join(path + [name])}")
+            state[name] = 1
+            stage = self.stages[name]
+            for dependency in stage.depends_on + stage.after + ([stage.for_each] if stage.for_each else []):
+                visit(dependency, path + [name])
+            state[name] = 2
+            order.append(name)
+
+        for name in self.stages:
+            visit(name, [])
+        return order
+
+    async def run(self, inputs: Dict[str, Any], emit=None, cache=None, salt: str = "") -> "GraphRun":
+        """执行整张图，返回包含各阶段输出和耗时报告的 GraphRun
+
+        Args:
+            cache: StageCache，可缓存阶段的输出按输入指纹复用
+            salt: 参与指纹计算的额外标识（例如模型名）
+        """
+        graph_run = GraphRun(self, inputs, emit, cache, salt)
+        await graph_run.execute()
+        return graph_run
+
+
+class GraphRun:
+    """阶段图的一次执行"""
+
+    def __init__(self, graph: StageGraph, inputs: Dict[str, Any], emit=None, cache=None, salt: str = ""):
+        self.graph = graph
+        self.inputs = inputs
+        self._emit = emit
+        self.cache = cache
+        self.salt = salt
+        loop = asyncio.get_running_loop()
+        # 阶段完成时写入 (是否成功, 输出)
+        self._done = {name: loop.create_future() for name in graph.stages}
+        # 逐条阶段：条目数确定后写入每个条目的 future 列表
+        self._items = {name: loop.create_future() for name, stage in graph.stages.items() if stage.for_each}
+        self._semaphores = {
+            name: asyncio.Semaphore(stage.concurrency)
+            for name, stage in graph.stages.items() if stage.concurrency > 0
+        }
+        self.outputs: Dict[str, Any] = {}
+        self.report: Dict[str, Dict[str, Any]] = {}
+        self._started = 0.0
+        self.elapsed = 0.0
+
+    async def emit(self, update: Dict[str, Any]):
+        if self._emit is not None:
+            await self._emit(update)
+
+    async def execute(self):
+        self._started = time.perf_counter()
+        tasks = [asyncio.create_task(self._run_stage(self.graph.stages[name])) for name in self.graph.order]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        self.elapsed = time.perf_counter() - self._started
+
+    def _offset(self) -> float:
+        return round(time.perf_counter() - self._started, 3)
+
+    def _fingerprint(self, stage: Stage, ctx: StageContext) -> str:
+        content = self.inputs.get("content", {})
+        if stage.input_keys is not None:
+            content = {key: content.get(key) for key in stage.input_keys}
+        return fingerprint({
+            "stage": stage.name,
+            "version": stage.version,
+            "salt": self.salt,
+            "inputs": content,
+            "outputs": ctx.outputs,
+            "item": ctx.item,
+            "item_outputs": ctx.item_outputs,
+        })
+
+    async def _call(self, stage: Stage, ctx: StageContext):
+        """带并发限制和超时地调用一次阶段函数，返回 (状态, 输出, 错误, 耗时, 是否命中缓存)"""
+        key = None
+        if self.cache is not None and stage.cacheable:
+            key = self._fingerprint(stage, ctx)
+            entry = self.cache.get(key)
+            if entry is not None:
+                if stage.on_cached is not None:
+                    try:
+                        await stage.on_cached(ctx, entry["output"])
+                    except Exception as e:
+                        logger.warning(f"阶段 {stage.name} 命中缓存后的处理出错: {str(e)}")
+                return STATE_SUCCESS, entry["output"], None, 0.0, True
+
+        semaphore = self._semaphores.get(stage.name)
+        if semaphore is not None:
+            await semaphore.acquire()
+        start = time.perf_counter()
+        state = STATE_ERROR
+        try:
+            with tracer.span(f"stage.{stage.name}", stage=stage.name) as span:
+                if ctx.index is not None:
+                    span.set(item=ctx.index)
+                output = await asyncio.wait_for(stage.run(ctx), timeout=stage.timeout)
+            if key is not None:
+                self.cache.set(key, stage.name, output)
+            state = STATE_SUCCESS
+            return STATE_SUCCESS, output, None, time.perf_counter() - start, False
+        except asyncio.TimeoutError:
+            logger.warning(f"阶段 {stage.name} 超时 ({stage.timeout}s)")
+            state = STATE_TIMEOUT
+            return STATE_TIMEOUT, None, f"超时 ({stage.timeout}s)", time.perf_counter() - start, False
+        except Exception as e:
+            logger.error(f"阶段 {stage.name} 出错: {str(e)}")
+            return STATE_ERROR, None, str(e), time.perf_counter() - start, False
+        finally:
+            STAGE_DURATION.labels(stage.name, state).observe(time.perf_counter() - start)
+            if semaphore is not None:
+                semaphore.release()
+
+    async def _run_stage(self, stage: Stage):
+        done = self._done[stage.name]
+        items_future = self._items.get(stage.name)
+        outputs = {}
+        for dependency in stage.depends_on + ([stage.for_each] if stage.for_each else []):
+            ok, output = await self._done[dependency]
+            if not ok:
+                self.report[stage.name] = {"status": STATE_SKIPPED, "reason": f"依赖阶段 {dependency} 未成功"}
+                await self.emit({"status": "stage", "stage": stage.name, "state": STATE_SKIPPED})
+                if items_future is not None:
+                    items_future.set_result([])
+                done.set_result((False, None))
+                return
+            outputs[dependency] = output
+
+        started_at = self._offset()
+        await self.emit({"status": "stage", "stage": stage.name, "state": "started"})
+
+        if stage.for_each is None:
+            state, output, error, elapsed, cached = await self._call(stage, StageContext(stage.name, self.inputs, outputs, self.emit))
+            self.report[stage.name] = {
+                "status": state, "started_at": started_at, "elapsed": round(elapsed, 3), "error": error, "cached": cached
+            }
+        else:
+            items = outputs[stage.for_each] or []
+            loop = asyncio.get_running_loop()
+            item_futures = [loop.create_future() for _ in items]
+            items_future.set_result(item_futures)
+            results = await asyncio.gather(*[
+                self._run_item(stage, index, item, outputs, item_futures[index]) for index, item in enumerate(items)
+            ])
+            output = [result["output"] for result in results]
+            succeeded = sum(1 for result in results if result["status"] == STATE_SUCCESS)
+            # 逐条阶段只要有一个条目成功就算成功，失败的条目输出为None
+            state = STATE_SUCCESS if succeeded or not items else STATE_ERROR
+            self.report[stage.name] = {
+                "status": state,
+                "started_at": started_at,
+                "elapsed": round(time.perf_counter() - self._started - started_at, 3),
+                "items": [{key: value for key, value in result.items() if key != "output"} for result in results],
+                "cached_items": sum(1 for result in results if result.get("cached")),
+            }
+            self.report[stage.name]["cached"] = bool(results) and self.report[stage.name]["cached_items"] == len(results)
+
+        self.report[stage.name]["finished_at"] = self._offset()
+        ok = state == STATE_SUCCESS
+        if ok:
+            self.outputs[stage.name] = output
+        await self.emit({
+            "status": "stage",
+            "stage": stage.name,
+            "state": state,
+            "elapsed": self.report[stage.name]["elapsed"],
+            "cached": self.report[stage.name]["cached"],
+            "cached_items": self.report[stage.name].get("cached_items"),
+            "items": len(self.report[stage.name].get("items", [])) or None,
+        })
+        done.set_result((ok, output))
+
+    async def _run_item(self, stage: Stage, index: int, item: Any, outputs: Dict[str, Any], future) -> Dict[str, Any]:
+        item_outputs = {}
+        for dependency in stage.after:
+            dependency_items = await self._items[dependency]
+            # 前序阶段整体被跳过时没有条目
+            ok, output = await dependency_items[index] if index < len(dependency_items) else (False, None)
+            if not ok:
+                future.set_result((False, None))
+                return {"status": STATE_SKIPPED, "output": None}
+            item_outputs[dependency] = output
+
+        ctx = StageContext(stage.name, self.inputs, outputs, self.emit, item=item, index=index, item_outputs=item_outputs)
+        state, output, error, elapsed, cached = await self._call(stage, ctx)
+        future.set_result((state == STATE_SUCCESS, output))
+        return {"status": state, "output": output, "elapsed": round(elapsed, 3), "error": error, "cached": cached}
+
+    def summary(self) -> Dict[str, Any]:
+        """关键路径耗时（实际总耗时）与各阶段耗时之和的对比"""
+        stage_total = sum(
+            sum(item.get("elapsed", 0) for item in report.get("items", [])) if "items" in report else report.get("elapsed", 0)
+            for report in self.report.values()
+        )
+        return {
+            "elapsed": round(self.elapsed, 3),
+            "sum_of_stages": round(stage_total, 3),
+            "cached_stages": [name for name, report in self.report.items() if report.get("cached")],
+            "stages": self.report,
+        }
@@ -1,67 +1,37 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from .agents.types import AgentType, TaskType, ResearchStage, Message
 from .agents.generator import GeneratorAgent
+from .agents.supervisor import SupervisorAgent
+from .task_queue import QueueFullError, PRIORITY_NORMAL, DEFAULT_USER
+from .task_store import create_task_backend, MemoryTaskBackend
+from .event_bus import create_event_bus, session_channel, control_channel
+from .session_store import create_session_store
+from .pipeline import ResearchPipeline, RESEARCH_STAGES, research_result
+from .stage_cache import create_stage_cache
+from .agent_metrics import AgentMetrics, queue_wait_scope
+from .brain.llm import usage_scope
+from .telemetry import tracer, ACTIVE_SESSIONS, QUEUE_DEPTH
 # from .agents.evaluator import EvaluatorAgent
 # from .agents.experimenter import ExperimenterAgent
 # from .agents.reviewer import ReviewerAgent
 from loguru import logger
+import os
+import time
+import socket
 import asyncio
-from collections import deque
 from datetime import datetime
 
-class ResearchSession:
-    """研究会话类，管理单个研究的完整状态"""
-    
-    def __init__(self, session_id: str, question: str, background: str):
-        self.id = session_id
-        self.question = question
-        self.background = background
-        self.created_at = datetime.now().isoformat()
-        self.updated_at = self.created_at
-        self.stage = ResearchStage.INITIAL
-        self.status = "initialized"
-        self.hypotheses = []
-        self.evaluation = {}
-        self.experiments = []
-        self.literature = {}
-        self.messages = []
-        self.artifacts = {}
-        
-    def update(self, data: Dict[str, Any]):
-        """更新会话状态"""
-        for key, value in data.items():
-            if hasattr(self, key):
-                setattr(self, key, value)
-                
-        self.updated_at = datetime.now().isoformat()
-        
-    def add_message(self, role: str, content: str):
-        """添加消息"""
-        message = {
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now().isoformat()
-        }
-        self.messages.append(message)
-        self.updated_at = message["timestamp"]
-        
-    def to_dict(self) -> Dict[str, Any]:
-        """转换为字典"""
-        return {
-            "id": self.id,
-            "question": self.question,
-            "background": self.background,
-            "created_at": self.created_at,
-            "updated_at": self.updated_at,
-            "stage": self.stage,
-            "status": self.status,
-            "hypotheses": self.hypotheses,
-            "evaluation": self.evaluation,
-            "experiments": self.experiments,
-            "literature": self.literature,
-            "messages": self.messages,
-            "artifacts": self.artifacts
-        }
+# 流式更新的状态，其余状态表示流程结束（decomposed / partial 来自 complex_research 的子任务分解和子任务结果）
+STREAMING_STATUSES = ("generating", "stage", "decomposed", "partial")
+
+# 可以通过 stream_research 提交的任务类型（取 input_data["type"]）
+STREAM_TASK_TYPES = ("research_question", "complex_research")
+
+
+def research_task_id(session_id: str) -> str:
+    """会话的研究任务ID，停止生成时据此撤回排队中的任务"""
+    return f"research:{session_id}"
+
 
 class Supervisor:
     """负责协调多智能体研究过程的主管理器"""
@@ -79,128 +49,79 @@ class Supervisor:
             # AgentType.REVIEWER: ReviewerAgent(brain, memory)
         }
         
+        # 智能体调用指标：研究流程和子任务执行中的每次调用都记录到这里
+        metrics_config = config.get("metrics") or {}
+        self.agent_metrics = AgentMetrics(window=metrics_config.get("window", 300), slots=metrics_config.get("slots", 10))
+        
+        # 复杂研究请求：由 SupervisorAgent 分解为子任务，按各智能体的 task_types 分配并发执行
+        coordinator_config = (config.get("agents") or {}).get("supervisor") or {}
+        self.coordinator = SupervisorAgent(
+            brain, memory, list(self.agents.values()),
+            max_concurrency=coordinator_config.get("max_concurrency", 3),
+            max_subtasks=coordinator_config.get("max_subtasks", 6),
+            metrics=self.agent_metrics
+        )
+        
         self.current_stage = ResearchStage.INITIAL
         self.update_callback = None
         
-        # 任务队列
-        self.task_queue = deque()
-        self.is_processing = False
-        self.current_task = None
-        self.task_results = {}
+        # 任务队列：按优先级和用户公平调度，由 worker_count 个worker并发消费。
+        # 队列和结果存放在 task_backend 中（memory / sqlite / redis），worker以租约方式领取任务。
+        # workers 为0时本进程只提交任务，由 python -m src.cli worker 启动的独立进程执行，
+        # 流式片段和结果通过 event_bus 按会话频道回传
+        supervisor_config = config.get("supervisor") or {}
+        backend_config = config.get("task_backend") or {}
+        self.worker_count = supervisor_config.get("workers", 4)
+        self.task_backend = create_task_backend(config)
+        self.event_bus = create_event_bus(config)
+        self.lease_seconds = backend_config.get("lease_seconds", 300)
+        self.poll_interval = backend_config.get("poll_interval", 1.0)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._task_available = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+        
+        # 会话管理：内存中只保留最近使用的会话，其余存放在SQLite中按需加载
+        self.sessions = create_session_store(config)
+        self.chunk_batch_size = (config.get("sessions") or {}).get("chunk_batch_size", 32)
         
-        # 会话管理
-        self.sessions = {}
+        # 阶段输出缓存：输入未变化的阶段在重跑时直接复用
+        self.stage_cache = create_stage_cache(config)
+        
+        # /metrics 导出时读取排队任务数
+        QUEUE_DEPTH.callback = self.task_backend.size
         
-        self.current_text = []
         self.current_state = None  # 用于存储当前状态
         self._generator_instance = None  # 存储当前生成器实例
-        self.should_stop = False  # 停止标志
         self.is_generating = False  # 生成状态标志
         
-    async def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
-        """处理研究请求的主流程
+    async def process(self, input_data: Dict[str, Any], emit=None) -> Dict[str, Any]:
+        """处理研究请求的主流程：按阶段图执行，相互独立的阶段并发进行
         
         Args:
             input_data: 包含研究问题和背景的输入数据
+            emit: async emit(update)，接收流式片段和阶段切换；默认发布到会话频道
             
         Returns:
             Dict: 包含研究结果的字典
         """
+        if emit is None:
+            emit = lambda update: self._emit(input_data, update)
         try:
-            logger.info(f"开始处理研究请求: {input_data}")
-            
-            # 初始化研究状态
-            research_state = {
-                "status": "processing",
-                "research_question": input_data.get("content", {}).get("question", ""),
-                "background": input_data.get("content", {}).get("background", ""),
-                "hypotheses": [],
-                "evaluation": {},
-                "experiments": [],
-                "literature": {},
-                "stage": self.current_stage
-            }
+            content = input_data.get("content", {})
+            logger.info(f"开始处理研究请求: 会话 {input_data.get('session_id')}, 问题 {content.get('question', '')[:50]}")
             
-            # 1. 生成假设阶段
-            self.current_stage = ResearchStage.HYPOTHESIS_GENERATION
-            research_state["stage"] = self.current_stage
+            with tracer.span("Supervisor.process", session_id=str(input_data.get("session_id"))):
+                graph_run = await ResearchPipeline(self, self.config).build().run(
+                    input_data, emit=emit, cache=self.stage_cache, salt=self.brain.get_model_name()
+                )
+            research_state = research_result(input_data, graph_run)
+            self.current_stage = ResearchStage(research_state["stage"])
             
-            generator = self.agents[AgentType.GENERATOR]
-            async for update in generator.process(input_data):
-                if update["status"] == "generating":
-                    # 传递流式更新
-                    if self.update_callback:
-                        await self.update_callback(update)
-                elif update["status"] == "success":
-                    research_state["hypotheses"] = update.get("hypotheses", [])
-            
-            # 如果没有生成假设，则返回错误
-            if not research_state["hypotheses"]:
-                research_state["status"] = "error"
-                research_state["message"] = "未能生成有效的研究假设"
-                return research_state
-                
-            # 2. 评估假设阶段
-            if self.config.get("enable_evaluation", True):
-                self.current_stage = ResearchStage.HYPOTHESIS_EVALUATION
-                research_state["stage"] = self.current_stage
-                
-                evaluation_input = {
-                    "type": "evaluate_hypotheses",
-                    "content": {
-                        "question": research_state["research_question"],
-                        "background": research_state["background"],
-                        "hypotheses": research_state["hypotheses"]
-                    }
-                }
-                
-                evaluator = self.agents[AgentType.EVALUATOR]
-                evaluation_result = await evaluator.process(evaluation_input)
-                research_state["evaluation"] = evaluation_result.get("evaluation", {})
-            
-            # 3. 实验设计阶段
-            if self.config.get("enable_experiment_design", False):
-                self.current_stage = ResearchStage.EXPERIMENT_DESIGN
-                research_state["stage"] = self.current_stage
-                
-                experiment_input = {
-                    "type": "design_experiments",
-                    "content": {
-                        "question": research_state["research_question"],
-                        "background": research_state["background"],
-                        "hypotheses": research_state["hypotheses"],
-                        "evaluation": research_state["evaluation"]
-                    }
-                }
-                
-                experimenter = self.agents[AgentType.EXPERIMENTER]
-                experiment_result = await experimenter.process(experiment_input)
-                research_state["experiments"] = experiment_result.get("experiments", [])
-            
-            # 4. 文献综述阶段
-            if self.config.get("enable_literature_review", False):
-                self.current_stage = ResearchStage.LITERATURE_REVIEW
-                research_state["stage"] = self.current_stage
-                
-                review_input = {
-                    "type": "review_literature",
-                    "content": {
-                        "question": research_state["research_question"],
-                        "background": research_state["background"],
-                        "hypotheses": research_state["hypotheses"]
-                    }
-                }
-                
-                reviewer = self.agents[AgentType.REVIEWER]
-                review_result = await reviewer.process(review_input)
-                research_state["literature"] = review_result.get("literature", {})
-            
-            # 完成研究流程
-            self.current_stage = ResearchStage.COMPLETED
-            research_state["stage"] = self.current_stage
-            research_state["status"] = "success"
-            
-            logger.info(f"研究流程完成: {research_state}")
+            timing = research_state["timing"]
+            logger.info(
+                f"研究流程完成: 状态 {research_state['status']}, 假设 {len(research_state['hypotheses'])} 个, "
+                f"耗时 {timing['elapsed']}s（各阶段合计 {timing['sum_of_stages']}s）, 缓存命中阶段 {timing['cached_stages']}"
+            )
             return research_state
             
         except Exception as e:
@@ -208,159 +129,345 @@ class Supervisor:
             return {
                 "status": "error",
                 "message": f"处理研究请求失败: {str(e)}",
-                "stage": self.current_stage
+                "stage": self.current_stage.value
             }
 
+    async def decompose_research(self, input_data: Dict[str, Any], emit=None) -> Dict[str, Any]:
+        """复杂研究请求：分解为子任务后分配给各智能体并发执行，再整合结果
+
+        子任务分解、流式片段和每个子任务的结果都作为流式更新推送，返回整合后的结果
+        """
+        if emit is None:
+            emit = lambda update: self._emit(input_data, update)
+        result = {"status": "error", "message": "子任务分解没有返回结果"}
+        async for update in self.coordinator.process(input_data):
+            if update["status"] in ("success", "error"):
+                result = update
+            else:
+                await emit(update)
+        return result
+
+    async def _emit(self, input_data: Dict[str, Any], update: Dict[str, Any]):
+        """流式更新交给回调，并发布到会话频道"""
+        if self.update_callback and update["status"] == "generating":
+            await self.update_callback(update)
+        await self._backend_call(self._publish, input_data, update)
+
     def set_update_callback(self, callback):
         """设置更新回调函数"""
         self.update_callback = callback
         # 同时设置Brain的回调
         self.brain.stream_callback = callback
 
-    async def add_task(self, task_id: str, task_type: str, input_data: Dict[str, Any]):
-        """添加任务到队列"""
+    @property
+    def remote(self) -> bool:
+        """任务是否由独立的worker进程执行"""
+        return self.worker_count == 0
+
+    def _ensure_workers(self):
+        """首次提交任务时在当前事件循环中启动worker"""
+        if self._workers or self.remote:
+            return
+        for index in range(self.worker_count):
+            self._workers.append(asyncio.create_task(self._worker(index), name=f"supervisor-worker-{index}"))
+        logger.info(f"已启动 {self.worker_count} 个任务worker")
+
+    async def run_workers(self):
+        """worker进程的主循环：启动worker并一直运行到被取消"""
+        if isinstance(self.task_backend, MemoryTaskBackend):
+            raise RuntimeError("独立worker需要共享的任务后端（task_backend.type: sqlite 或 redis）")
+        self.worker_count = max(1, self.worker_count)
+        self._ensure_workers()
+        try:
+            await asyncio.gather(*self._workers)
+        finally:
+            for worker in self._workers:
+                worker.cancel()
+            self._workers = []
+
+    def _publish(self, input_data: Dict[str, Any], update: Dict[str, Any]):
+        """把流式更新发布到会话频道"""
+        session_id = input_data.get("session_id")
+        if session_id is None:
+            return
+        try:
+            self.event_bus.publish(session_channel(session_id), update)
+        except Exception as e:
+            logger.warning(f"发布会话 {session_id} 的更新失败: {str(e)}")
+
+    async def stream_research(self, input_data: Dict[str, Any]):
+        """执行研究流程并逐条产出更新
+
+        产出 generating（流式片段）和 stage（阶段切换）更新，最后是研究结果
+        （status 为 success / error）。阶段切换、每批流式片段、假设和评估
+        都作为事件追加到会话的事件日志中。input_data["type"] 为 complex_research
+        时提交子任务分解流程，另外产出 decomposed 和 partial 更新。
+        """
+        ACTIVE_SESSIONS.inc()
+        try:
+            async for update in self._stream_session(input_data):
+                yield update
+        finally:
+            ACTIVE_SESSIONS.dec()
+
+    async def _stream_session(self, input_data: Dict[str, Any]):
+        session = self.sessions.get(input_data.get("session_id", ""))
+        if session is None:
+            async for update in self._stream_updates(input_data):
+                yield update
+            return
+
+        chunks: List[str] = []
+        try:
+            async for update in self._stream_updates(input_data):
+                if update["status"] == "generating":
+                    if "chunk" in update:
+                        chunks.append(update["chunk"])
+                        if len(chunks) >= self.chunk_batch_size:
+                            session.add_chunks("".join(chunks))
+                            chunks = []
+                            self.sessions.save(session)
+                elif update["status"] == "stage":
+                    if update["state"] == "started" and update["stage"] in RESEARCH_STAGES:
+                        session.set_stage(RESEARCH_STAGES[update["stage"]], "processing")
+                        self.sessions.save(session)
+                elif update["status"] not in STREAMING_STATUSES:
+                    session.add_chunks("".join(chunks))
+                    chunks = []
+                    for hypothesis in update.get("hypotheses") or []:
+                        session.add_hypothesis(hypothesis)
+                    if update.get("evaluation"):
+                        session.set_evaluation(update["evaluation"])
+                    if update.get("experiments") or update.get("literature"):
+                        session.update({"experiments": update.get("experiments") or [], "literature": {"items": update.get("literature") or []}})
+                    if update["status"] == "success":
+                        session.set_stage(ResearchStage.COMPLETE, "success")
+                    else:
+                        session.update({"status": "error"})
+                        session.add_message("system", update.get("message", ""))
+                yield update
+        finally:
+            session.add_chunks("".join(chunks))
+            self.sessions.save(session)
+
+    async def _stream_updates(self, input_data: Dict[str, Any]):
+        """提交研究任务（research_question 或 complex_research），从会话频道接收执行它的worker发布的更新
+
+        本进程有worker时由本进程的worker执行，否则由独立worker进程执行；两种情况都经过
+        任务队列，受优先级、用户公平和准入限制约束。频道消息丢失时回退到查询任务结果。
+        """
+        session_id = input_data["session_id"]
+        task_id = research_task_id(session_id)
+        task_type = input_data.get("type") if input_data.get("type") in STREAM_TASK_TYPES else "research_question"
+        # 先订阅再提交，避免错过最早的片段
+        subscription = self.event_bus.subscribe(session_channel(session_id))
+        finished = False
+        try:
+            queued = await self.add_task(task_id, task_type, input_data)
+            if queued["status"] == "rejected":
+                finished = True
+                yield {"status": "error", "message": queued["message"]}
+                return
+
+            while True:
+                update = await subscription.get(timeout=self.poll_interval)
+                if update is not None:
+                    finished = update["status"] not in STREAMING_STATUSES
+                    yield update
+                    if finished:
+                        return
+                    continue
+
+                status = await self.get_task_status(task_id)
+                if status["status"] == "completed":
+                    finished = True
+                    yield status["result"]
+                    return
+                if status["status"] == "not_found":
+                    finished = True
+                    yield {"status": "error", "message": "任务结果已丢失"}
+                    return
+        finally:
+            subscription.close()
+            if not finished:
+                # 调用方提前退出（例如超时）时撤回排队中的任务或停止正在执行的任务
+                await self._backend_call(self._request_stop, session_id)
+
+    async def add_task(
+        self,
+        task_id: str,
+        task_type: str,
+        input_data: Dict[str, Any],
+        priority: int = PRIORITY_NORMAL,
+        user_id: Optional[str] = None
+    ):
+        """添加任务到队列
+        
+        Args:
+            task_id: 任务ID
+            task_type: 任务类型
+            input_data: 任务输入
+            priority: 优先级（PRIORITY_HIGH / PRIORITY_NORMAL / PRIORITY_LOW）
+            user_id: 提交者，同一优先级内按用户轮转；默认取 input_data 中的 user_id
+        """
         task = {
             "id": task_id,
             "type": task_type,
             "input": input_data,
             "status": "queued",
-            "created_at": datetime.now().isoformat()
+            "priority": priority,
+            "user_id": user_id or input_data.get("user_id") or DEFAULT_USER,
+            "created_at": datetime.now().isoformat(),
+            "enqueued_at": time.time()
         }
         
-        self.task_queue.append(task)
-        logger.info(f"任务已添加到队列: {task_id}, 类型: {task_type}")
+        try:
+            await self._backend_call(self.task_backend.enqueue, task)
+        except QueueFullError as e:
+            logger.warning(f"任务被拒绝: {task_id}, {str(e)}")
+            return {"task_id": task_id, "status": "rejected", "message": str(e)}
         
-        # 如果没有正在处理的任务，启动处理
-        if not self.is_processing:
-            asyncio.create_task(self._process_queue())
-            
-        return {"task_id": task_id, "status": "queued"}
+        self._task_available.set()
+        self._ensure_workers()
+        logger.info(f"任务已添加到队列: {task_id}, 类型: {task_type}, 优先级: {priority}, 用户: {task['user_id']}")
+        
+        status = await self._backend_call(self.task_backend.status, task_id)
+        return {"task_id": task_id, "status": "queued", "position": (status or {}).get("position")}
         
     async def get_task_status(self, task_id: str) -> Dict[str, Any]:
         """获取任务状态"""
-        # 检查当前任务
-        if self.current_task and self.current_task["id"] == task_id:
-            return {
-                "task_id": task_id,
-                "status": self.current_task["status"],
-                "progress": self.current_task.get("progress", 0)
-            }
-            
-        # 检查队列中的任务
-        for task in self.task_queue:
-            if task["id"] == task_id:
-                return {
-                    "task_id": task_id,
-                    "status": "queued",
-                    "position": list(self.task_queue).index(task) + 1
-                }
+        status = await self._backend_call(self.task_backend.status, task_id)
+        if status is not None:
+            return {"task_id": task_id, **status}
                 
-        # 检查已完成的任务
-        if task_id in self.task_results:
+        # 检查已完成的任务（结果过期后视为不存在）
+        result = await self._backend_call(self.task_backend.get_result, task_id)
+        if result is not None:
             return {
                 "task_id": task_id,
                 "status": "completed",
-                "result": self.task_results[task_id]
+                "result": result
             }
             
         return {"task_id": task_id, "status": "not_found"}
+
+    async def _backend_call(self, method, *args):
+        """内存后端（及内存事件总线）直接在事件循环中调用，SQLite/Redis后端放到线程中执行"""
+        if isinstance(self.task_backend, MemoryTaskBackend):
+            return method(*args)
+        return await asyncio.to_thread(method, *args)
+
+    async def _next_task(self, owner: str) -> Dict[str, Any]:
+        """领取下一个任务；队列为空时等待本进程的入队通知，或每隔 poll_interval 秒重试
+        （其他进程提交的任务和租期过期的任务只能靠轮询发现）"""
+        while True:
+            task = await self._backend_call(self.task_backend.lease, owner, self.lease_seconds)
+            if task is not None:
+                return task
+            self._task_available.clear()
+            try:
+                await asyncio.wait_for(self._task_available.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _renew_lease(self, task_id: str, owner: str):
+        """执行期间定期续租，租期过期的任务会被其他worker重新领取"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not await self._backend_call(self.task_backend.extend, task_id, owner, self.lease_seconds):
+                logger.warning(f"任务 {task_id} 的租约已失效，结果可能被丢弃")
+                return
         
-    async def _process_queue(self):
-        """处理任务队列"""
-        if self.is_processing:
-            return
-            
-        self.is_processing = True
-        
-        try:
-            while self.task_queue:
-                # 获取下一个任务
-                task = self.task_queue.popleft()
-                self.current_task = task
-                task["status"] = "processing"
-                task["started_at"] = datetime.now().isoformat()
-                
-                logger.info(f"开始处理任务: {task['id']}")
+    async def _worker(self, index: int):
+        """从队列中取任务执行，多个worker并发运行"""
+        owner = f"{self.worker_id}:{index}"
+        while True:
+            task = await self._next_task(owner)
+            renewal = asyncio.create_task(self._renew_lease(task["id"], owner))
+            status = "failed"
+            try:
+                logger.info(f"worker {index} 开始处理任务: {task['id']}（第 {task['attempts']} 次尝试）")
+                # 排队时间计入任务中第一次智能体调用的指标
+                queue_wait_scope.set(max(0.0, time.time() - task.get("enqueued_at", time.time())))
+                # 本任务的token用量，随结果返回给提交方（worker的上下文在多个任务间复用）
+                usage: Dict[str, int] = {}
+                usage_scope.set(usage)
                 
                 # 根据任务类型处理
                 if task["type"] == "research_question":
-                    result = await self.process(task["input"])
+                    result = {**await self._run_stoppable(task["input"], self.process(task["input"])), "usage": usage}
+                    # 最终结果也发布到会话频道，提交方据此结束等待
+                    await self._backend_call(self._publish, task["input"], result)
+                elif task["type"] == "complex_research":
+                    result = {**await self._run_stoppable(task["input"], self.decompose_research(task["input"])), "usage": usage}
+                    await self._backend_call(self._publish, task["input"], result)
                 else:
                     result = {"status": "error", "message": f"不支持的任务类型: {task['type']}"}
                     
                 # 存储结果
-                task["status"] = "completed" if result["status"] == "success" else "failed"
-                task["completed_at"] = datetime.now().isoformat()
-                self.task_results[task["id"]] = result
-                
-                logger.info(f"任务处理完成: {task['id']}, 状态: {task['status']}")
-                
-        except Exception as e:
-            logger.error(f"处理任务队列时出错: {str(e)}")
-            if self.current_task:
-                self.current_task["status"] = "failed"
-                self.current_task["error"] = str(e)
+                status = {"success": "completed", "stopped": "stopped"}.get(result["status"], "failed")
+                await self._backend_call(self.task_backend.complete, task["id"], owner, result)
                 
+            except asyncio.CancelledError:
+                # 不释放租约：进程退出后任务在租期过期时由其他worker重试
+                status = "cancelled"
+                raise
+            except Exception as e:
+                logger.error(f"处理任务 {task['id']} 时出错: {str(e)}")
+                await self._backend_call(self.task_backend.fail, task["id"], owner, str(e))
+            finally:
+                renewal.cancel()
+                logger.info(f"任务处理完成: {task['id']}, 状态: {status}")
+
+    async def _run_stoppable(self, input_data: Dict[str, Any], run) -> Dict[str, Any]:
+        """执行任务，同时监听会话的控制频道；收到停止请求时取消执行，返回 stopped 结果
+
+        停止只影响这一个会话的任务，同一进程中其他会话的任务照常执行
+        """
+        session_id = input_data.get("session_id")
+        if session_id is None:
+            return await run
+        subscription = self.event_bus.subscribe(control_channel(session_id))
+        runner = asyncio.ensure_future(run)
+        waiter = None
+        try:
+            while True:
+                waiter = asyncio.ensure_future(subscription.get(timeout=self.poll_interval))
+                await asyncio.wait({runner, waiter}, return_when=asyncio.FIRST_COMPLETED)
+                if runner.done():
+                    return runner.result()
+                message = waiter.result()
+                if message is not None and message.get("action") == "stop":
+                    runner.cancel()
+                    await asyncio.gather(runner, return_exceptions=True)
+                    logger.info(f"会话 {session_id} 的任务已停止")
+                    return {"status": "stopped", "message": "生成已停止"}
         finally:
-            self.is_processing = False
-            self.current_task = None
-            
-            # 如果队列中还有任务，继续处理
-            if self.task_queue:
-                asyncio.create_task(self._process_queue())
+            # worker 本身被取消时一并取消执行
+            runner.cancel()
+            if waiter is not None:
+                waiter.cancel()
+            subscription.close()
+
+    def _request_stop(self, session_id: str):
+        """撤回该会话排队中（尚未开始执行）的任务，并通知正在执行它的worker停止；
+        共享的任务后端中其他会话的任务不受影响"""
+        if self.task_backend.cancel(research_task_id(session_id)):
+            logger.info(f"已撤回会话 {session_id} 排队中的任务")
+            # 任务不会再执行，由这里发布结束消息
+            self.event_bus.publish(session_channel(session_id), {"status": "stopped", "message": "生成已停止"})
+            return
+        self.event_bus.publish(control_channel(session_id), {"action": "stop"})
 
     def create_session(self, question: str, background: str) -> str:
         """创建新的研究会话"""
-        session_id = f"{datetime.now().isoformat()}_{question}_{background}"
-        self.sessions[session_id] = ResearchSession(session_id, question, background)
-        return session_id
+        return self.sessions.create(question, background).id
 
-    def stop_generation(self):
-        """停止当前生成过程"""
-        logger.info("正在停止生成过程...")
-        self.should_stop = True
+    async def stop_generation(self, session_id: str):
+        """停止一个会话的生成过程，其他会话不受影响
         
-        # 停止所有代理的处理
-        for agent_type, agent in self.agents.items():
-            if hasattr(agent, 'stop_generation'):
-                logger.info(f"停止 {agent_type} 代理")
-                agent.stop_generation()
-        
-        # 清空任务队列
-        self.task_queue = deque()
-        
-        # 如果有正在运行的任务，尝试取消它
-        if hasattr(self, '_current_task') and self._current_task is not None:
-            try:
-                if not self._current_task.done():
-                    logger.info("取消当前任务")
-                    self._current_task.cancel()
-                self._current_task = None
-            except Exception as e:
-                logger.error(f"取消任务时出错: {str(e)}")
-        
-        # 如果有正在运行的处理器，尝试取消它
-        if hasattr(self, '_processor_task') and self._processor_task is not None:
-            try:
-                if not self._processor_task.done():
-                    logger.info("取消处理器任务")
-                    self._processor_task.cancel()
-                self._processor_task = None
-            except Exception as e:
-                logger.error(f"取消处理器任务时出错: {str(e)}")
-        
-        logger.info("生成过程已停止")
-
-    def reset_state(self):
-        """重置所有状态，准备新的生成过程"""
-        logger.info("重置Supervisor状态...")
-        self.should_stop = False
-        self.task_queue = deque()
-        self._current_task = None
-        
-        # 重置所有代理的状态
-        for agent_type, agent in self.agents.items():
-            if hasattr(agent, 'reset_state'):
-                agent.reset_state()
-        
-        logger.info("Supervisor状态已重置")
+        Args:
+            session_id: 要停止的会话
+        """
+        logger.info(f"正在停止会话 {session_id} 的生成过程...")
+        await self._backend_call(self._request_stop, session_id)
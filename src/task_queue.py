@@ -0,0 +1,152 @@
+from typing import Dict, Any, Optional
+import asyncio
+from collections import deque, OrderedDict
+
+# 任务优先级，数值越小越先执行
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+DEFAULT_USER = "anonymous"
+
+
+class QueueFullError(Exception):
+    """队列已满或用户待处理任务数达到上限，任务被拒绝"""
+
+
+class _FairBuffer:
+    """按优先级分层、层内按用户轮转的任务缓冲
+
+    每个优先级一个 OrderedDict(user -> deque)，出队时取最高优先级层中
+    排在最前的用户的第一个任务，然后把该用户移到层尾。一个用户提交再多任务，
+    也只能在每一轮中占用一个位置。入队、出队都是 O(1)，位置查询是 O(用户数)。
+    """
+
+    def __init__(self):
+        self._levels: Dict[int, "OrderedDict[str, deque]"] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, task: Dict[str, Any]):
+        level = self._levels.setdefault(task["priority"], OrderedDict())
+        level.setdefault(task["user_id"], deque()).append(task)
+        self._size += 1
+
+    def appendleft(self, task: Dict[str, Any]):
+        """放到该用户队列的最前面（重试的任务）"""
+        level = self._levels.setdefault(task["priority"], OrderedDict())
+        level.setdefault(task["user_id"], deque()).appendleft(task)
+        self._size += 1
+
+    def popleft(self) -> Dict[str, Any]:
+        priority = min(self._levels)
+        level = self._levels[priority]
+        user_id, tasks = next(iter(level.items()))
+        task = tasks.popleft()
+        if tasks:
+            level.move_to_end(user_id)
+        else:
+            del level[user_id]
+            if not level:
+                del self._levels[priority]
+        self._size -= 1
+        return task
+
+    def remove(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """移除排队中的任务"""
+        for priority, level in list(self._levels.items()):
+            for user_id, tasks in list(level.items()):
+                for task in tasks:
+                    if task["id"] == task_id:
+                        tasks.remove(task)
+                        self._size -= 1
+                        if not tasks:
+                            del level[user_id]
+                            if not level:
+                                del self._levels[priority]
+                        return task
+        return None
+
+    def pending_for(self, user_id: str) -> int:
+        return sum(len(level.get(user_id, ())) for level in self._levels.values())
+
+    def position(self, task_id: str) -> Optional[int]:
+        """任务的出队次序（从1开始），按当前状态模拟轮转得出"""
+        ahead = 0
+        for priority in sorted(self._levels):
+            level = self._levels[priority]
+            for rotation, (user_id, tasks) in enumerate(level.items()):
+                index = next((i for i, task in enumerate(tasks) if task["id"] == task_id), None)
+                if index is None:
+                    continue
+                # 每一轮每个用户出一个任务：排在它前面的是前 index 轮中所有用户的任务，
+                # 加上本轮中轮转顺序在它之前、且还有第 index 个任务的用户
+                for other_rotation, other_tasks in enumerate(level.values()):
+                    ahead += min(len(other_tasks), index)
+                    if other_rotation < rotation and len(other_tasks) > index:
+                        ahead += 1
+                return ahead + 1
+            ahead += sum(len(tasks) for tasks in level.values())
+        return None
+
+    def clear(self):
+        self._levels.clear()
+        self._size = 0
+
+
+class FairTaskQueue(asyncio.Queue):
+    """支持优先级、用户公平和准入控制的 asyncio.Queue
+
+    复用 asyncio.Queue 的等待/唤醒逻辑，只替换底层缓冲（与 PriorityQueue 的做法相同）。
+    maxsize 限制总排队数，max_per_user 限制单个用户的排队数，超出时 submit 抛出 QueueFullError。
+    """
+
+    def __init__(self, maxsize: int = 0, max_per_user: int = 0):
+        super().__init__(maxsize)
+        self.max_per_user = max_per_user
+
+    def _init(self, maxsize):
+        self._queue = _FairBuffer()
+
+    def _put(self, item):
+        self._queue.append(item)
+
+    def _get(self):
+        return self._queue.popleft()
+
+    def submit(self, task: Dict[str, Any]):
+        """非阻塞入队，队列满时拒绝而不是等待"""
+        task.setdefault("priority", PRIORITY_NORMAL)
+        task.setdefault("user_id", DEFAULT_USER)
+        if self.max_per_user and self._queue.pending_for(task["user_id"]) >= self.max_per_user:
+            raise QueueFullError(f"用户 {task['user_id']} 的排队任务已达上限 {self.max_per_user}")
+        try:
+            self.put_nowait(task)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"任务队列已满 ({self.maxsize})")
+
+    def requeue(self, task: Dict[str, Any]):
+        """把已取出的任务放回该用户队列的最前面（重试），不受准入限制"""
+        self._queue.appendleft(task)
+        self._unfinished_tasks += 1
+        self._finished.clear()
+        self._wakeup_next(self._getters)
+
+    def position(self, task_id: str) -> Optional[int]:
+        return self._queue.position(task_id)
+
+    def cancel(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """从队列中撤回任务"""
+        task = self._queue.remove(task_id)
+        if task is not None:
+            # 与 get_nowait 一样需要抵消 unfinished_tasks 计数
+            self.task_done()
+        return task
+
+    def clear(self):
+        """清空排队中的任务"""
+        for _ in range(len(self._queue)):
+            self.task_done()
+        self._queue.clear()
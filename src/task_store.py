@@ -0,0 +1,717 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Any, Optional
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from loguru import logger
+from .task_queue import FairTaskQueue, QueueFullError, _FairBuffer, PRIORITY_NORMAL, DEFAULT_USER
+
+# 任务状态
+STATUS_QUEUED = "queued"
+STATUS_LEASED = "processing"
+STATUS_FAILED = "failed"
+
+
+class TaskBackend(ABC):
+    """任务队列与结果存储的后端接口
+
+    worker 通过 lease 领取任务并获得一段租期，执行期间用 extend 续租，
+    完成后 complete 写入结果（结果按 TTL 过期）。worker 崩溃导致租期过期的任务
+    会在下一次 lease 时重新入队，超过最大尝试次数后标记为失败。
+    重新入队（失败重试或租期过期）的任务放在该用户队列的最前面，三种后端一致。
+    """
+
+    def __init__(self, maxsize: int = 0, max_per_user: int = 0, max_attempts: int = 3, result_ttl: float = 86400):
+        self.maxsize = maxsize
+        self.max_per_user = max_per_user
+        self.max_attempts = max_attempts
+        self.result_ttl = result_ttl
+
+    @abstractmethod
+    def enqueue(self, task: Dict[str, Any]):
+        """入队，超出准入限制时抛出 QueueFullError"""
+
+    @abstractmethod
+    def lease(self, owner: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """领取下一个任务，没有任务时返回None"""
+
+    @abstractmethod
+    def extend(self, task_id: str, owner: str, lease_seconds: float) -> bool:
+        """续租，租约已失效（已被回收）时返回False"""
+
+    @abstractmethod
+    def complete(self, task_id: str, owner: str, result: Dict[str, Any]) -> bool:
+        """写入结果并移除任务"""
+
+    @abstractmethod
+    def fail(self, task_id: str, owner: str, error: str, retry: bool = True):
+        """执行失败：可重试时重新入队，否则写入错误结果"""
+
+    @abstractmethod
+    def status(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """排队中或执行中任务的状态，排队中的任务带出队次序"""
+
+    @abstractmethod
+    def get_result(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """未过期的任务结果"""
+
+    @abstractmethod
+    def cancel(self, task_id: str) -> bool:
+        """撤回排队中的任务，任务不在排队中（不存在或已被领取）时返回False"""
+
+    @abstractmethod
+    def clear_queued(self) -> int:
+        """丢弃所有排队中的任务，返回丢弃的数量"""
+
+    @abstractmethod
+    def size(self) -> int:
+        """排队中的任务数"""
+
+    def close(self):
+        pass
+
+    def _error_result(self, error: str) -> Dict[str, Any]:
+        return {"status": "error", "message": error}
+
+
+class MemoryTaskBackend(TaskBackend):
+    """进程内后端（默认），重启后丢失"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._queue = FairTaskQueue(maxsize=self.maxsize, max_per_user=self.max_per_user)
+        self._leases: Dict[str, Dict[str, Any]] = {}
+        self._results: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def enqueue(self, task: Dict[str, Any]):
+        if task["id"] in self._leases or self._queue.position(task["id"]) is not None:
+            raise QueueFullError(f"任务 {task['id']} 已存在")
+        task.setdefault("attempts", 0)
+        self._queue.submit(task)
+
+    def _reclaim(self):
+        now = time.time()
+        for task_id, task in list(self._leases.items()):
+            if task["lease_expires"] < now:
+                del self._leases[task_id]
+                self._requeue_or_fail(task, "租期过期")
+
+    def _requeue_or_fail(self, task: Dict[str, Any], error: str):
+        if task["attempts"] >= self.max_attempts:
+            logger.warning(f"任务 {task['id']} 已尝试 {task['attempts']} 次，标记为失败: {error}")
+            self._store_result(task["id"], self._error_result(error))
+            return
+        task["status"] = STATUS_QUEUED
+        self._queue.requeue(task)
+
+    def lease(self, owner: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        self._reclaim()
+        try:
+            task = self._queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return None
+        self._queue.task_done()
+        task.update(status=STATUS_LEASED, owner=owner, lease_expires=time.time() + lease_seconds)
+        task["attempts"] += 1
+        self._leases[task["id"]] = task
+        return task
+
+    def extend(self, task_id: str, owner: str, lease_seconds: float) -> bool:
+        task = self._leases.get(task_id)
+        if task is None or task["owner"] != owner:
+            return False
+        task["lease_expires"] = time.time() + lease_seconds
+        return True
+
+    def _store_result(self, task_id: str, result: Dict[str, Any]):
+        self._results[task_id] = (time.time() + self.result_ttl, result)
+        self._results.move_to_end(task_id)
+        # 结果按写入顺序过期，只需检查队头
+        now = time.time()
+        while self._results and next(iter(self._results.values()))[0] < now:
+            self._results.popitem(last=False)
+
+    def complete(self, task_id: str, owner: str, result: Dict[str, Any]) -> bool:
+        task = self._leases.get(task_id)
+        if task is None or task["owner"] != owner:
+            return False
+        del self._leases[task_id]
+        self._store_result(task_id, result)
+        return True
+
+    def fail(self, task_id: str, owner: str, error: str, retry: bool = True):
+        task = self._leases.pop(task_id, None)
+        if task is None or task["owner"] != owner:
+            return
+        if retry:
+            self._requeue_or_fail(task, error)
+        else:
+            self._store_result(task_id, self._error_result(error))
+
+    def status(self, task_id: str) -> Optional[Dict[str, Any]]:
+        task = self._leases.get(task_id)
+        if task is not None:
+            return {"status": STATUS_LEASED, "attempts": task["attempts"], "owner": task["owner"]}
+        position = self._queue.position(task_id)
+        if position is not None:
+            return {"status": STATUS_QUEUED, "position": position}
+        return None
+
+    def get_result(self, task_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._results.get(task_id)
+        if entry is None or entry[0] < time.time():
+            return None
+        return entry[1]
+
+    def cancel(self, task_id: str) -> bool:
+        return self._queue.cancel(task_id) is not None
+
+    def clear_queued(self) -> int:
+        count = self._queue.qsize()
+        self._queue.clear()
+        return count
+
+    def size(self) -> int:
+        return self._queue.qsize()
+
+
+class SQLiteTaskBackend(TaskBackend):
+    """单机持久化后端
+
+    任务和结果存放在SQLite中（WAL模式），同一台机器上的多个进程可以共享。
+    领取任务在 BEGIN IMMEDIATE 事务中完成，不会被两个worker同时领取。
+    用户轮转通过 users.turn 实现：每次被服务的用户移到最后。
+    """
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE,
+                user_id TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                lease_expires REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_tasks_queue ON tasks (status, priority, user_id, seq);
+            CREATE INDEX IF NOT EXISTS idx_tasks_lease ON tasks (status, lease_expires);
+            CREATE TABLE IF NOT EXISTS task_users (
+                priority INTEGER NOT NULL,
+                user_id TEXT NOT NULL,
+                turn INTEGER NOT NULL,
+                PRIMARY KEY (priority, user_id)
+            );
+            CREATE TABLE IF NOT EXISTS task_results (
+                id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_task_results_expires ON task_results (expires_at);
+        """)
+
+    def _transaction(self, fn):
+        """在写事务中执行"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _next_turn(self, conn) -> int:
+        return conn.execute("SELECT COALESCE(MAX(turn), 0) + 1 FROM task_users").fetchone()[0]
+
+    def _join_rotation(self, conn, priority: int, user_id: str):
+        """用户在该优先级没有排队任务时加入轮转队尾"""
+        pending = conn.execute(
+            "SELECT 1 FROM tasks WHERE status = ? AND priority = ? AND user_id = ? LIMIT 1",
+            (STATUS_QUEUED, priority, user_id)
+        ).fetchone()
+        if pending is None:
+            conn.execute(
+                "INSERT OR REPLACE INTO task_users (priority, user_id, turn) VALUES (?, ?, ?)",
+                (priority, user_id, self._next_turn(conn))
+            )
+
+    def enqueue(self, task: Dict[str, Any]):
+        task.setdefault("priority", PRIORITY_NORMAL)
+        task.setdefault("user_id", DEFAULT_USER)
+
+        def run(conn):
+            if self.maxsize and self._size(conn) >= self.maxsize:
+                raise QueueFullError(f"任务队列已满 ({self.maxsize})")
+            if self.max_per_user:
+                pending = conn.execute(
+                    "SELECT COUNT(*) FROM tasks WHERE status = ? AND user_id = ?",
+                    (STATUS_QUEUED, task["user_id"])
+                ).fetchone()[0]
+                if pending >= self.max_per_user:
+                    raise QueueFullError(f"用户 {task['user_id']} 的排队任务已达上限 {self.max_per_user}")
+            self._join_rotation(conn, task["priority"], task["user_id"])
+            try:
+                conn.execute(
+                    "INSERT INTO tasks (id, user_id, priority, payload, status) VALUES (?, ?, ?, ?, ?)",
+                    (task["id"], task["user_id"], task["priority"], json.dumps(task, ensure_ascii=False, default=str), STATUS_QUEUED)
+                )
+            except sqlite3.IntegrityError:
+                raise QueueFullError(f"任务 {task['id']} 已存在")
+
+        self._transaction(run)
+
+    def _reclaim(self, conn):
+        """回收租期过期的任务"""
+        expired = conn.execute(
+            "SELECT id, user_id, priority, attempts FROM tasks WHERE status = ? AND lease_expires < ?",
+            (STATUS_LEASED, time.time())
+        ).fetchall()
+        for task_id, user_id, priority, attempts in expired:
+            self._requeue_or_fail(conn, task_id, user_id, priority, attempts, "租期过期")
+
+    def _requeue_or_fail(self, conn, task_id: str, user_id: str, priority: int, attempts: int, error: str):
+        if attempts >= self.max_attempts:
+            logger.warning(f"任务 {task_id} 已尝试 {attempts} 次，标记为失败: {error}")
+            conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+            self._store_result(conn, task_id, self._error_result(error))
+            return
+        self._join_rotation(conn, priority, user_id)
+        conn.execute(
+            "UPDATE tasks SET status = ?, owner = NULL, lease_expires = NULL WHERE id = ?",
+            (STATUS_QUEUED, task_id)
+        )
+
+    def lease(self, owner: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        def run(conn):
+            self._reclaim(conn)
+            row = conn.execute(
+                """
+                SELECT t.id, t.user_id, t.priority, t.payload, t.attempts
+                FROM tasks t JOIN task_users u ON u.priority = t.priority AND u.user_id = t.user_id
+                WHERE t.status = ?
+                ORDER BY t.priority, u.turn, t.seq
+                LIMIT 1
+                """,
+                (STATUS_QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            task_id, user_id, priority, payload, attempts = row
+            conn.execute(
+                "UPDATE tasks SET status = ?, owner = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                (STATUS_LEASED, owner, time.time() + lease_seconds, task_id)
+            )
+            conn.execute(
+                "UPDATE task_users SET turn = ? WHERE priority = ? AND user_id = ?",
+                (self._next_turn(conn), priority, user_id)
+            )
+            task = json.loads(payload)
+            task.update(status=STATUS_LEASED, owner=owner, attempts=attempts + 1)
+            return task
+
+        return self._transaction(run)
+
+    def extend(self, task_id: str, owner: str, lease_seconds: float) -> bool:
+        def run(conn):
+            cursor = conn.execute(
+                "UPDATE tasks SET lease_expires = ? WHERE id = ? AND owner = ? AND status = ?",
+                (time.time() + lease_seconds, task_id, owner, STATUS_LEASED)
+            )
+            return cursor.rowcount > 0
+
+        return self._transaction(run)
+
+    def _store_result(self, conn, task_id: str, result: Dict[str, Any]):
+        conn.execute(
+            "INSERT OR REPLACE INTO task_results (id, payload, expires_at) VALUES (?, ?, ?)",
+            (task_id, json.dumps(result, ensure_ascii=False, default=str), time.time() + self.result_ttl)
+        )
+        conn.execute("DELETE FROM task_results WHERE expires_at < ?", (time.time(),))
+
+    def complete(self, task_id: str, owner: str, result: Dict[str, Any]) -> bool:
+        def run(conn):
+            cursor = conn.execute(
+                "DELETE FROM tasks WHERE id = ? AND owner = ? AND status = ?",
+                (task_id, owner, STATUS_LEASED)
+            )
+            if cursor.rowcount == 0:
+                return False
+            self._store_result(conn, task_id, result)
+            return True
+
+        return self._transaction(run)
+
+    def fail(self, task_id: str, owner: str, error: str, retry: bool = True):
+        def run(conn):
+            row = conn.execute(
+                "SELECT user_id, priority, attempts FROM tasks WHERE id = ? AND owner = ? AND status = ?",
+                (task_id, owner, STATUS_LEASED)
+            ).fetchone()
+            if row is None:
+                return
+            if retry:
+                self._requeue_or_fail(conn, task_id, row[0], row[1], row[2], error)
+            else:
+                conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+                self._store_result(conn, task_id, self._error_result(error))
+
+        self._transaction(run)
+
+    def status(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, attempts, owner FROM tasks WHERE id = ?", (task_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[0] == STATUS_LEASED:
+                return {"status": STATUS_LEASED, "attempts": row[1], "owner": row[2]}
+
+            # 按轮转顺序重建排队状态，得到精确的出队次序
+            buffer = _FairBuffer()
+            for queued_id, user_id, priority in self._conn.execute(
+                """
+                SELECT t.id, t.user_id, t.priority
+                FROM tasks t JOIN task_users u ON u.priority = t.priority AND u.user_id = t.user_id
+                WHERE t.status = ?
+                ORDER BY t.priority, u.turn, t.seq
+                """,
+                (STATUS_QUEUED,)
+            ):
+                buffer.append({"id": queued_id, "user_id": user_id, "priority": priority})
+            return {"status": STATUS_QUEUED, "position": buffer.position(task_id)}
+
+    def get_result(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM task_results WHERE id = ? AND expires_at >= ?", (task_id, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def cancel(self, task_id: str) -> bool:
+        return self._transaction(
+            lambda conn: conn.execute(
+                "DELETE FROM tasks WHERE id = ? AND status = ?", (task_id, STATUS_QUEUED)
+            ).rowcount > 0
+        )
+
+    def clear_queued(self) -> int:
+        return self._transaction(
+            lambda conn: conn.execute("DELETE FROM tasks WHERE status = ?", (STATUS_QUEUED,)).rowcount
+        )
+
+    def _size(self, conn) -> int:
+        return conn.execute("SELECT COUNT(*) FROM tasks WHERE status = ?", (STATUS_QUEUED,)).fetchone()[0]
+
+    def size(self) -> int:
+        with self._lock:
+            return self._size(self._conn)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# Redis后端的原子操作。键：
+#   {p}:task:{id}        任务哈希（payload/priority/user_id/status/attempts/owner）
+#   {p}:q:{prio}:{user}  用户在某优先级的任务ID列表
+#   {p}:rot:{prio}       该优先级中有排队任务的用户轮转列表
+#   {p}:levels           有排队任务的优先级（有序集合）
+#   {p}:leases           租约到期时间（有序集合）
+#   {p}:pending:{user}   用户排队任务数；{p}:size 排队总数
+#   {p}:result:{id}      任务结果（带过期时间）
+# 脚本中不使用cjson（fakeredis的Lua环境没有），错误结果由Python编码好后传入
+_REDIS_PUSH = """
+local function push(p, id, prio, user, front)
+    local q = p .. ':q:' .. prio .. ':' .. user
+    if redis.call('LLEN', q) == 0 then redis.call('RPUSH', p .. ':rot:' .. prio, user) end
+    if front then redis.call('LPUSH', q, id) else redis.call('RPUSH', q, id) end
+    redis.call('ZADD', p .. ':levels', tonumber(prio), prio)
+    redis.call('HSET', p .. ':task:' .. id, 'status', 'queued', 'owner', '')
+    redis.call('INCR', p .. ':size')
+    redis.call('INCR', p .. ':pending:' .. user)
+end
+"""
+
+_REDIS_ENQUEUE = _REDIS_PUSH + """
+local p, id, prio, user, payload = ARGV[1], ARGV[2], ARGV[3], ARGV[4], ARGV[5]
+local maxsize, max_per_user = tonumber(ARGV[6]), tonumber(ARGV[7])
+if redis.call('EXISTS', p .. ':task:' .. id) == 1 then return -1 end
+if maxsize > 0 and tonumber(redis.call('GET', p .. ':size') or '0') >= maxsize then return -2 end
+if max_per_user > 0 and tonumber(redis.call('GET', p .. ':pending:' .. user) or '0') >= max_per_user then return -3 end
+redis.call('HSET', p .. ':task:' .. id, 'payload', payload, 'priority', prio, 'user_id', user, 'attempts', 0)
+push(p, id, prio, user, false)
+return 1
+"""
+
+_REDIS_REQUEUE = _REDIS_PUSH + """
+local function requeue(p, id, max_attempts, ttl, error_result)
+    local key = p .. ':task:' .. id
+    local attempts = tonumber(redis.call('HGET', key, 'attempts') or '0')
+    redis.call('ZREM', p .. ':leases', id)
+    if attempts >= max_attempts then
+        redis.call('DEL', key)
+        redis.call('SET', p .. ':result:' .. id, error_result, 'EX', ttl)
+        return 0
+    end
+    push(p, id, redis.call('HGET', key, 'priority'), redis.call('HGET', key, 'user_id'), true)
+    return 1
+end
+"""
+
+_REDIS_LEASE = _REDIS_REQUEUE + """
+local p, owner, now, deadline = ARGV[1], ARGV[2], tonumber(ARGV[3]), tonumber(ARGV[4])
+local max_attempts, ttl, expired_result = tonumber(ARGV[5]), tonumber(ARGV[6]), ARGV[7]
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', p .. ':leases', '-inf', now)) do
+    requeue(p, id, max_attempts, ttl, expired_result)
+end
+for _, prio in ipairs(redis.call('ZRANGE', p .. ':levels', 0, -1)) do
+    local rot = p .. ':rot:' .. prio
+    local user = redis.call('LPOP', rot)
+    if user then
+        local q = p .. ':q:' .. prio .. ':' .. user
+        local id = redis.call('LPOP', q)
+        if redis.call('LLEN', q) > 0 then redis.call('RPUSH', rot, user) end
+        if redis.call('LLEN', rot) == 0 then redis.call('ZREM', p .. ':levels', prio) end
+        local key = p .. ':task:' .. id
+        redis.call('HSET', key, 'status', 'processing', 'owner', owner)
+        local attempts = redis.call('HINCRBY', key, 'attempts', 1)
+        redis.call('ZADD', p .. ':leases', deadline, id)
+        redis.call('DECR', p .. ':size')
+        redis.call('DECR', p .. ':pending:' .. user)
+        return {id, redis.call('HGET', key, 'payload'), attempts}
+    end
+    redis.call('ZREM', p .. ':levels', prio)
+end
+return false
+"""
+
+_REDIS_FAIL = _REDIS_REQUEUE + """
+local p, id, owner, max_attempts, ttl, error_result, retry = ARGV[1], ARGV[2], ARGV[3], tonumber(ARGV[4]), tonumber(ARGV[5]), ARGV[6], ARGV[7]
+if redis.call('HGET', p .. ':task:' .. id, 'owner') ~= owner then return -1 end
+if retry == '1' then return requeue(p, id, max_attempts, ttl, error_result) end
+return requeue(p, id, 0, ttl, error_result)
+"""
+
+_REDIS_COMPLETE = """
+local p, id, owner, result, ttl = ARGV[1], ARGV[2], ARGV[3], ARGV[4], tonumber(ARGV[5])
+local key = p .. ':task:' .. id
+if redis.call('HGET', key, 'owner') ~= owner then return 0 end
+redis.call('ZREM', p .. ':leases', id)
+redis.call('DEL', key)
+redis.call('SET', p .. ':result:' .. id, result, 'EX', ttl)
+return 1
+"""
+
+_REDIS_CANCEL = """
+local p, id = ARGV[1], ARGV[2]
+local key = p .. ':task:' .. id
+if redis.call('HGET', key, 'status') ~= 'queued' then return 0 end
+local prio, user = redis.call('HGET', key, 'priority'), redis.call('HGET', key, 'user_id')
+local q = p .. ':q:' .. prio .. ':' .. user
+redis.call('LREM', q, 0, id)
+if redis.call('LLEN', q) == 0 then
+    local rot = p .. ':rot:' .. prio
+    redis.call('LREM', rot, 0, user)
+    if redis.call('LLEN', rot) == 0 then redis.call('ZREM', p .. ':levels', prio) end
+end
+redis.call('DEL', key)
+redis.call('DECR', p .. ':size')
+redis.call('DECR', p .. ':pending:' .. user)
+return 1
+"""
+
+_REDIS_CLEAR = """
+local p = ARGV[1]
+local count = 0
+for _, prio in ipairs(redis.call('ZRANGE', p .. ':levels', 0, -1)) do
+    local rot = p .. ':rot:' .. prio
+    for _, user in ipairs(redis.call('LRANGE', rot, 0, -1)) do
+        local q = p .. ':q:' .. prio .. ':' .. user
+        local ids = redis.call('LRANGE', q, 0, -1)
+        for _, id in ipairs(ids) do redis.call('DEL', p .. ':task:' .. id) end
+        redis.call('DEL', q)
+        redis.call('DECRBY', p .. ':pending:' .. user, #ids)
+        redis.call('DECRBY', p .. ':size', #ids)
+        count = count + #ids
+    end
+    redis.call('DEL', rot)
+end
+redis.call('DEL', p .. ':levels')
+return count
+"""
+
+_REDIS_EXTEND = """
+local p, id, owner, deadline = ARGV[1], ARGV[2], ARGV[3], tonumber(ARGV[4])
+if redis.call('HGET', p .. ':task:' .. id, 'owner') ~= owner then return 0 end
+redis.call('ZADD', p .. ':leases', 'XX', deadline, id)
+return 1
+"""
+
+
+class RedisTaskBackend(TaskBackend):
+    """多节点共享的Redis后端
+
+    入队、领取、完成、撤回和清空都用Lua脚本保证原子性；租约到期时间放在有序集合中，
+    领取任务时顺带回收过期租约。结果用 SET EX 写入，到期自动删除。
+    """
+
+    def __init__(self, client, prefix: str = "ai_scientist", **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self.prefix = prefix
+        self._enqueue = client.register_script(_REDIS_ENQUEUE)
+        self._lease = client.register_script(_REDIS_LEASE)
+        self._fail = client.register_script(_REDIS_FAIL)
+        self._complete = client.register_script(_REDIS_COMPLETE)
+        self._extend = client.register_script(_REDIS_EXTEND)
+        self._cancel = client.register_script(_REDIS_CANCEL)
+        self._clear = client.register_script(_REDIS_CLEAR)
+
+    def _key(self, *parts) -> str:
+        return ":".join([self.prefix, *map(str, parts)])
+
+    def enqueue(self, task: Dict[str, Any]):
+        task.setdefault("priority", PRIORITY_NORMAL)
+        task.setdefault("user_id", DEFAULT_USER)
+        code = self._enqueue(args=[
+            self.prefix, task["id"], task["priority"], task["user_id"],
+            json.dumps(task, ensure_ascii=False, default=str), self.maxsize, self.max_per_user
+        ])
+        if code == -1:
+            raise QueueFullError(f"任务 {task['id']} 已存在")
+        if code == -2:
+            raise QueueFullError(f"任务队列已满 ({self.maxsize})")
+        if code == -3:
+            raise QueueFullError(f"用户 {task['user_id']} 的排队任务已达上限 {self.max_per_user}")
+
+    def lease(self, owner: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        leased = self._lease(args=[
+            self.prefix, owner, now, now + lease_seconds, self.max_attempts, int(self.result_ttl),
+            json.dumps(self._error_result("租期过期"), ensure_ascii=False)
+        ])
+        if not leased:
+            return None
+        task_id, payload, attempts = leased
+        task = json.loads(payload)
+        task.update(status=STATUS_LEASED, owner=owner, attempts=int(attempts))
+        return task
+
+    def extend(self, task_id: str, owner: str, lease_seconds: float) -> bool:
+        return bool(self._extend(args=[self.prefix, task_id, owner, time.time() + lease_seconds]))
+
+    def complete(self, task_id: str, owner: str, result: Dict[str, Any]) -> bool:
+        return bool(self._complete(args=[
+            self.prefix, task_id, owner, json.dumps(result, ensure_ascii=False, default=str), int(self.result_ttl)
+        ]))
+
+    def fail(self, task_id: str, owner: str, error: str, retry: bool = True):
+        self._fail(args=[
+            self.prefix, task_id, owner, self.max_attempts, int(self.result_ttl),
+            json.dumps(self._error_result(error), ensure_ascii=False), "1" if retry else "0"
+        ])
+
+    def status(self, task_id: str) -> Optional[Dict[str, Any]]:
+        task = self.client.hgetall(self._key("task", task_id))
+        if not task:
+            return None
+        task = {self._str(k): self._str(v) for k, v in task.items()}
+        if task.get("status") == STATUS_LEASED:
+            return {"status": STATUS_LEASED, "attempts": int(task.get("attempts", 0)), "owner": task.get("owner")}
+
+        # 按轮转顺序读出排队状态，得到精确的出队次序
+        buffer = _FairBuffer()
+        for priority in self.client.zrange(self._key("levels"), 0, -1):
+            priority = self._str(priority)
+            for user_id in self.client.lrange(self._key("rot", priority), 0, -1):
+                user_id = self._str(user_id)
+                for queued_id in self.client.lrange(self._key("q", priority, user_id), 0, -1):
+                    buffer.append({"id": self._str(queued_id), "user_id": user_id, "priority": int(priority)})
+        return {"status": STATUS_QUEUED, "position": buffer.position(task_id)}
+
+    def get_result(self, task_id: str) -> Optional[Dict[str, Any]]:
+        payload = self.client.get(self._key("result", task_id))
+        return json.loads(payload) if payload else None
+
+    def cancel(self, task_id: str) -> bool:
+        return bool(self._cancel(args=[self.prefix, task_id]))
+
+    def clear_queued(self) -> int:
+        return int(self._clear(args=[self.prefix]))
+
+    def size(self) -> int:
+        return int(self.client.get(self._key("size")) or 0)
+
+    @staticmethod
+    def _str(value) -> str:
+        return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+def redis_client(config: Dict[str, Any]):
+    """按配置创建Redis客户端；fake: true 时使用fakeredis（本地测试用）"""
+    if config.get("fake"):
+        import fakeredis
+        return fakeredis.FakeRedis()
+    import redis
+    if config.get("url"):
+        return redis.Redis.from_url(config["url"])
+    return redis.Redis(
+        host=config.get("host", "localhost"),
+        port=config.get("port", 6379),
+        db=config.get("db", 0),
+        password=config.get("password")
+    )
+
+
+def sqlite_path(url: str) -> str:
+    """sqlite:///research.db -> research.db"""
+    prefix = "sqlite:///"
+    if not url.startswith(prefix):
+        raise ValueError(f"不支持的数据库URL: {url}")
+    return url[len(prefix):]
+
+
+def create_task_backend(config: Dict[str, Any]) -> TaskBackend:
+    """按 task_backend.type 创建后端：memory（默认）/ sqlite / redis"""
+    backend_config = config.get("task_backend") or {}
+    supervisor_config = config.get("supervisor") or {}
+    kwargs = {
+        "maxsize": supervisor_config.get("max_queue_size", 1000),
+        "max_per_user": supervisor_config.get("max_tasks_per_user", 50),
+        "max_attempts": backend_config.get("max_attempts", 3),
+        "result_ttl": backend_config.get("result_ttl", 86400),
+    }
+    backend_type = backend_config.get("type", "memory")
+
+    if backend_type == "sqlite":
+        url = backend_config.get("url") or (config.get("database") or {}).get("url", "sqlite:///research.db")
+        backend = SQLiteTaskBackend(sqlite_path(url), **kwargs)
+    elif backend_type == "redis":
+        backend = RedisTaskBackend(
+            redis_client(config.get("redis") or {}),
+            prefix=backend_config.get("prefix", "ai_scientist"),
+            **kwargs
+        )
+    elif backend_type == "memory":
+        backend = MemoryTaskBackend(**kwargs)
+    else:
+        raise ValueError(f"不支持的任务后端: {backend_type}")
+
+    logger.info(f"任务后端: {backend_type}")
+    return backend
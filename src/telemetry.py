@@ -0,0 +1,469 @@
+"""运行指标导出与调用链追踪
+
+指标：进程内的计数器、仪表和直方图，由 /metrics 以 Prometheus 文本格式导出
+（不依赖 prometheus_client）。热路径上只做加法和一次二分查找。
+
+追踪：OpenTelemetry 风格的 span（trace_id / span_id / 父子关系 / 属性），默认关闭。
+开启后由后台线程批量写入本地JSONL文件或以 OTLP/HTTP JSON 发送到采集器，
+不阻塞事件循环；队列满时丢弃。
+"""
+from typing import Dict, Any, List, Optional, Sequence, Callable, Tuple
+import os
+import json
+import time
+import queue
+import random
+import atexit
+import bisect
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from loguru import logger
+
+# 延迟类指标的默认分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> Any:
+        """按标签值取子指标（首次使用时创建）"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in list(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key: Tuple[str, ...], child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"]
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labelnames)
+        self.callback = callback
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def render(self) -> List[str]:
+        if self.callback is not None:
+            try:
+                self.set(self.callback())
+            except Exception as e:
+                logger.warning(f"读取指标 {self.name} 失败: {str(e)}")
+        return super().render()
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_child(self, key: Tuple[str, ...], child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表，render() 输出 Prometheus 文本格式（0.0.4）"""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> Any:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = (), callback=None) -> Gauge:
+        gauge = self._register(Gauge(name, help, labelnames))
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+LLM_REQUESTS = registry.counter("llm_requests_total", "LLM请求数", ["model", "task_type", "status"])
+LLM_LATENCY = registry.histogram("llm_request_duration_seconds", "LLM请求总耗时", ["model", "task_type"])
+LLM_TTFT = registry.histogram("llm_time_to_first_token_seconds", "LLM首个片段耗时", ["model", "task_type"])
+LLM_TOKENS_PER_SECOND = registry.histogram(
+    "llm_tokens_per_second", "LLM输出速度（首个片段之后，按流式片段数估算的token/秒）", ["model"],
+    buckets=(1, 5, 10, 20, 40, 80, 160, 320)
+)
+LLM_TOKENS = registry.counter("llm_tokens_total", "LLM token用量", ["model", "kind"])
+EMBEDDING_BATCH_SIZE = registry.histogram(
+    "embedding_batch_size", "每次写入向量库的文本数", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+)
+VECTOR_OPERATION = registry.histogram("vector_store_operation_seconds", "向量库操作耗时", ["operation", "status"])
+STAGE_DURATION = registry.histogram("pipeline_stage_duration_seconds", "研究流程各阶段单次调用耗时", ["stage", "status"])
+AGENT_CALLS = registry.histogram("agent_call_duration_seconds", "智能体调用耗时", ["agent", "task_type", "status"])
+ACTIVE_SESSIONS = registry.gauge("research_sessions_active", "正在流式输出的研究会话数")
+QUEUE_DEPTH = registry.gauge("task_queue_depth", "任务队列中排队的任务数")
+
+
+# ---------- 追踪 ----------
+
+class Span:
+    """一次操作的耗时与属性"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "end", "attributes", "status", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.start = time.time_ns()
+        self.end = 0
+        self.attributes = attributes
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "start_time_unix_nano": self.start,
+            "end_time_unix_nano": self.end,
+            "duration_ms": round((self.end - self.start) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": self.status,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """追踪关闭或未被采样时的占位"""
+
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+
+_NOOP = _NoopSpan()
+_current_span: contextvars.ContextVar[Any] = contextvars.ContextVar("current_span", default=None)
+
+
+class SpanExporter:
+    """后台线程批量导出 span：file 写JSONL，otlp 以 OTLP/HTTP JSON POST 到采集器"""
+
+    def __init__(self, kind: str = "file", path: str = "logs/traces.jsonl", endpoint: str = "",
+                 service: str = "ai-scientist", max_queue: int = 10000, batch_size: int = 256, interval: float = 1.0):
+        self.kind = kind
+        self.path = path
+        self.endpoint = endpoint
+        self.service = service
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=max_queue)
+        if kind == "file":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch: List[Span] = []
+            stop = False
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    span = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if span is None:
+                    stop = True
+                    break
+                batch.append(span)
+            if batch:
+                try:
+                    self._export(batch)
+                except Exception as e:
+                    logger.warning(f"导出 {len(batch)} 个span失败: {str(e)}")
+            if stop:
+                return
+
+    def _export(self, batch: List[Span]):
+        if self.kind == "file":
+            with open(self.path, "a", encoding="utf-8") as f:
+                for span in batch:
+                    f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+            return
+        import urllib.request
+
+        body = json.dumps({"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service}}]},
+            "scopeSpans": [{"scope": {"name": "ai-scientist"}, "spans": [_otlp_span(span) for span in batch]}],
+        }]}).encode("utf-8")
+        request = urllib.request.Request(self.endpoint, data=body, headers={"Content-Type": "application/json"})
+        urllib.request.urlopen(request, timeout=5).close()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+
+def _otlp_span(span: Span) -> Dict[str, Any]:
+    attributes = []
+    for key, value in span.attributes.items():
+        if isinstance(value, bool):
+            attributes.append({"key": key, "value": {"boolValue": value}})
+        elif isinstance(value, int):
+            attributes.append({"key": key, "value": {"intValue": str(value)}})
+        elif isinstance(value, float):
+            attributes.append({"key": key, "value": {"doubleValue": value}})
+        else:
+            attributes.append({"key": key, "value": {"stringValue": str(value)}})
+    result = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 1,
+        "startTimeUnixNano": str(span.start),
+        "endTimeUnixNano": str(span.end),
+        "attributes": attributes,
+        "status": {"code": 2, "message": span.error or ""} if span.status == "error" else {"code": 1},
+    }
+    if span.parent_id:
+        result["parentSpanId"] = span.parent_id
+    return result
+
+
+class Tracer:
+    """创建 span；未启用时 span() 只返回占位对象
+
+    采样在根 span 上决定，子 span 跟随父 span。异步生成器中使用 start/finish
+    （不设为当前span），否则生成器挂起期间调用方的其他操作会被记为它的子 span。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 1.0
+        self.exporter: Optional[SpanExporter] = None
+
+    def configure(self, exporter: Optional[SpanExporter], sample_rate: float = 1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.enabled = exporter is not None
+
+    def start(self, name: str, **attributes):
+        """开始一个span但不设为当前span（用于异步生成器），结束时调用 finish"""
+        if not self.enabled:
+            return _NOOP
+        parent = _current_span.get()
+        if parent is _NOOP or (parent is None and random.random() >= self.sample_rate):
+            return _NOOP
+        trace_id = parent.trace_id if parent is not None else "%032x" % random.getrandbits(128)
+        return Span(name, trace_id, parent.span_id if parent is not None else None, attributes)
+
+    def finish(self, span, error: Optional[BaseException] = None):
+        if span is _NOOP:
+            return
+        if error is not None:
+            span.status = "error"
+            span.error = str(error) or type(error).__name__
+        span.end = time.time_ns()
+        self.exporter.submit(span)
+
+    @contextmanager
+    def span(self, name: str, activate: bool = True, **attributes):
+        """with tracer.span(...) as span：块内创建的span（包括新建的异步任务中）以它为父span"""
+        span = self.start(name, **attributes)
+        if not self.enabled:
+            yield span
+            return
+        token = _current_span.set(span) if activate else None
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if token is not None:
+                try:
+                    _current_span.reset(token)
+                except ValueError:
+                    pass
+            self.finish(span, error)
+
+
+tracer = Tracer()
+
+
+def traced(name: str, histogram: Optional[Histogram] = None, labels: Sequence[str] = ()):
+    """协程函数装饰器：调用包在span中，耗时计入 histogram（标签为 labels 加上 success / error）"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            status = "error"
+            try:
+                with tracer.span(name):
+                    result = await func(*args, **kwargs)
+                status = "success"
+                return result
+            finally:
+                if histogram is not None:
+                    histogram.labels(*labels, status).observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def configure(config: Dict[str, Any]):
+    """按 telemetry.tracing 配置启用追踪"""
+    tracing = (config.get("telemetry") or {}).get("tracing") or {}
+    if not tracing.get("enabled", False):
+        tracer.configure(None)
+        return
+    exporter = SpanExporter(
+        kind=tracing.get("exporter", "file"),
+        path=tracing.get("path", "logs/traces.jsonl"),
+        endpoint=tracing.get("endpoint", "http://localhost:4318/v1/traces"),
+        service=tracing.get("service", "ai-scientist")
+    )
+    tracer.configure(exporter, sample_rate=tracing.get("sample_rate", 1.0))
+    logger.info(f"已启用调用链追踪: {exporter.kind} -> {exporter.path if exporter.kind == 'file' else exporter.endpoint}")
@@ -1,9 +1,17 @@
 import gradio as gr
-from typing import Dict, Any
-from src.agents.types import ResearchStage, AgentType
+from typing import Dict, Any, List, Optional
 from loguru import logger
 import asyncio
 
+# 研究流程各阶段的显示名称
+STAGE_LABELS = {
+    "literature": "文献检索",
+    "hypotheses": "假设生成",
+    "evaluation": "假设评估",
+    "experiment_design": "实验设计",
+    "ranking": "假设排序",
+}
+
 class WebUI:
     def __init__(self, supervisor):
         self.supervisor = supervisor
@@ -14,8 +22,34 @@ class WebUI:
         self.should_stop = False  # 添加停止标志
         self.is_generating = False  # 生成状态标志
         self._generator_instance = None  # 存储当前生成器实例
-        self.generation_id = 0  # 添加生成ID来跟踪每次生成
         
+    def format_stage_status(self, stages: Dict[str, Dict[str, Any]]) -> str:
+        """格式化各阶段状态，标出从缓存复用的阶段
+        
+        stages 可以是流式的阶段事件（按阶段名汇总），也可以是结果中的 timing.stages
+        """
+        if not stages:
+            return ""
+        lines = ["#### ⚙️ 研究流程"]
+        for name, info in stages.items():
+            label = STAGE_LABELS.get(name, name)
+            state = info.get("state") or info.get("status")
+            items = info.get("items")
+            total = len(items) if isinstance(items, list) else (items or 0)
+            if state == "started":
+                lines.append(f"- 🔄 {label}")
+            elif state == "success" and info.get("cached"):
+                lines.append(f"- ⚡ {label}（缓存）")
+            elif state == "success":
+                cached_items = info.get("cached_items") or 0
+                cache_note = f"，缓存 {cached_items}/{total}" if cached_items else ""
+                lines.append(f"- ✅ {label}（{info.get('elapsed', 0)}s{cache_note}）")
+            elif state == "skipped":
+                lines.append(f"- ⏭️ {label}（跳过）")
+            else:
+                lines.append(f"- ❌ {label}（{info.get('error') or state}）")
+        return "\n".join(lines) + "\n\n"
+
     def format_hypothesis(self, hypothesis):
         """格式化假设为Markdown格式"""
         # 获取假设内容
@@ -129,15 +163,15 @@ class WebUI:
             # 准备输入数据
             input_data = {
                 "type": "research_question",
+                "session_id": self.supervisor.create_session(question, background),
                 "content": {
                     "question": question,
                     "background": background
                 }
             }
             
-            # 处理研究流程
-            generator = self.supervisor.agents[AgentType.GENERATOR]
-            async for update in generator.process(input_data):
+            # 处理研究流程（本进程没有worker时由独立worker进程执行）
+            async for update in self.supervisor.stream_research(input_data):
                 # 检查是否应该停止生成
                 if self.should_stop:
                     final_message = "### ⚠️ 生成已停止\n\n" + "".join(self.current_text)
@@ -171,6 +205,7 @@ class WebUI:
                     
                     # 更新假设标签页
                     hypotheses_md = "### ✅ 生成的研究假设\n\n"
+                    hypotheses_md += self.format_stage_status((update.get("timing") or {}).get("stages") or {})
                     for hypothesis in update.get("hypotheses", []):
                         hypotheses_md += self.format_hypothesis(hypothesis)
                     
@@ -196,6 +231,7 @@ class WebUI:
         """构建Gradio界面"""
         with gr.Blocks(theme=gr.themes.Soft(), title="AI科学家") as demo:
             gr.Markdown("# 🧪 AI科学家 - 智能研究助手")
+            memory_status = gr.Markdown(self.memory_status())
             
             with gr.Row():
                 with gr.Column(scale=2):
@@ -237,16 +273,17 @@ class WebUI:
             # 设置停止生成的事件处理
             self.should_stop = False
             self.is_generating = False
-            self.generation_id = 0  # 添加生成ID来跟踪每次生成
             
-            def stop_generation():
-                self.should_stop = True
+            # 当前浏览器会话正在进行的研究会话ID，停止时只影响这个会话
+            session_state = gr.State()
+            
+            async def stop_generation(session_id):
                 self.is_generating = False
                 
-                # 确保supervisor停止生成
-                if hasattr(self.supervisor, 'stop_generation'):
-                    logger.info("WebUI: 调用supervisor停止生成")
-                    self.supervisor.stop_generation()
+                # 只停止当前浏览器会话的研究，supervisor 取消执行它的任务后流程以 stopped 结束
+                if session_id is not None:
+                    logger.info(f"WebUI: 调用supervisor停止生成，会话 {session_id}")
+                    await self.supervisor.stop_generation(session_id)
                 
                 # 如果有正在运行的生成器，尝试取消它
                 if hasattr(self, '_generator_task') and self._generator_task is not None:
@@ -261,37 +298,28 @@ class WebUI:
                 # 隐藏停止按钮
                 return gr.update(visible=False), "### ⚠️ 生成已停止\n\n您可以开始新的研究。"
             
-            stop_btn.click(fn=stop_generation, outputs=[stop_btn, hypothesis_output])
+            stop_btn.click(fn=stop_generation, inputs=session_state, outputs=[stop_btn, hypothesis_output])
             
-            # 创建一个函数来切换到假设生成标签页并显示停止按钮
-            def start_research():
-                # 增加生成ID，确保每次都是新的生成过程
-                self.generation_id += 1
+            # 创建一个函数来切换到假设生成标签页、显示停止按钮并创建研究会话
+            def start_research(question, background):
                 self.is_generating = True
-                self.should_stop = False
-                self.current_text = []  # 重置当前文本
                 
-                # 确保supervisor的状态也被重置
-                if hasattr(self.supervisor, 'reset_state'):
-                    self.supervisor.reset_state()
-                    
                 # 显示停止按钮并切换到假设生成标签页
-                return gr.update(selected="hypothesis_tab"), gr.update(visible=True)
+                session_id = self.supervisor.create_session(question, background)
+                return gr.update(selected="hypothesis_tab"), gr.update(visible=True), session_id
             
-            # 提交按钮事件 - 首先切换标签页并显示停止按钮
+            # 提交按钮事件 - 首先切换标签页、显示停止按钮并创建会话，然后生成假设
             submit_btn.click(
                 fn=start_research,
-                inputs=None,
-                outputs=[tabs, stop_btn]
-            )
-            
-            # 然后处理各个输出
-            submit_btn.click(
-                fn=self.process_hypothesis_output,
                 inputs=[question_input, background_input],
+                outputs=[tabs, stop_btn, session_state]
+            ).then(
+                fn=self.process_hypothesis_output,
+                inputs=[question_input, background_input, session_state],
                 outputs=[hypothesis_output, stop_btn]  # 添加stop_btn作为输出
             )
             
+            # 其余标签页
             submit_btn.click(
                 fn=self.process_result_output,
                 inputs=[question_input, background_input],
@@ -304,8 +332,21 @@ class WebUI:
                 outputs=evaluation_output
             )
             
+            # 预热期间定时刷新知识库状态
+            demo.load(fn=self.memory_status, outputs=memory_status, every=2)
+            
         return demo
 
+    def memory_status(self) -> str:
+        """知识库（向量库）加载状态"""
+        memory = self.supervisor.memory
+        status = memory.status if hasattr(memory, "status") else "ready"
+        if status == "warming_up":
+            return "🔄 知识库预热中，检索类功能暂不可用..."
+        if status == "failed":
+            return "⚠️ 知识库加载失败，检索类功能不可用"
+        return "✅ 知识库已就绪"
+
     def _get_initial_state(self):
         """获取初始状态"""
         return (
@@ -417,47 +458,48 @@ class WebUI:
 """
         return prompt
 
-    async def process_hypothesis_output(self, question: str, background: str):
+    async def process_hypothesis_output(self, question: str, background: str, session_id: Optional[str] = None):
         """处理假设标签页的内容，并控制停止按钮的显示"""
         try:
-            # 记录当前生成ID
-            current_generation_id = self.generation_id
-            
             # 初始状态
             yield "### 🔄 正在准备生成假设...", gr.update(visible=True)
             
             # 准备输入数据
             input_data = {
                 "type": "research_question",
+                "session_id": session_id or self.supervisor.create_session(question, background),
                 "content": {
                     "question": question,
                     "background": background
                 }
             }
             
-            # 重置当前文本
-            self.current_text = []
-            
-            # 获取生成器
-            generator = self.supervisor.agents[AgentType.GENERATOR]
+            # 本次生成的文本（界面实例被多个浏览器会话共享，不能放在实例上）
+            current_text: List[str] = []
+            stage_states: Dict[str, Dict[str, Any]] = {}
             
-            # 创建一个新的生成器实例，避免重用
-            generator_process = generator.process(input_data)
+            # 创建一个新的生成器实例，避免重用（本进程没有worker时由独立worker进程执行）
+            generator_process = self.supervisor.stream_research(input_data)
             
             try:
                 # 处理研究流程
                 async for update in generator_process:
-                    # 检查是否应该停止生成或生成ID是否变化
-                    if self.should_stop or current_generation_id != self.generation_id:
-                        logger.info("WebUI: 假设生成被停止")
-                        yield "### ⚠️ 生成已停止\n\n您可以开始新的研究。", gr.update(visible=False)
-                        return
-                        
-                    if update["status"] == "generating":
+                    if update["status"] == "stage":
+                        # 阶段切换（含缓存命中），与已生成的文本一起显示
+                        stage_states[update["stage"]] = update
+                        formatted_content = self._format_streaming_content("".join(current_text))
+                        yield f"""### 🔄 正在执行研究流程...
+
+{self.format_stage_status(stage_states)}```
+{formatted_content}
+```
+""", gr.update(visible=True)
+
+                    elif update["status"] == "generating":
                         # 更新当前文本
                         if "chunk" in update:
-                            self.current_text.append(update["chunk"])
-                            current_content = "".join(self.current_text)
+                            current_text.append(update["chunk"])
+                            current_content = "".join(current_text)
                             
                             # 预处理文本，确保格式正确
                             formatted_content = self._format_streaming_content(current_content)
@@ -465,27 +507,21 @@ class WebUI:
                             # 更新假设生成标签页，保持停止按钮可见
                             yield f"""### 🔄 正在生成假设...
 
-```
+{self.format_stage_status(stage_states)}```
 {formatted_content}
 ```
 """, gr.update(visible=True)
                         
                     elif update["status"] == "success":
-                        # 检查是否应该停止生成或生成ID是否变化
-                        if self.should_stop or current_generation_id != self.generation_id:
-                            logger.info("WebUI: 假设生成被停止")
-                            yield "### ⚠️ 生成已停止\n\n您可以开始新的研究。", gr.update(visible=False)
-                            return
-                            
                         # 更新假设标签页，隐藏停止按钮
                         hypotheses_md = "### ✅ 生成的研究假设\n\n"
+                        hypotheses_md += self.format_stage_status((update.get("timing") or {}).get("stages") or stage_states)
                         
                         # 检查是否有假设
                         if "hypotheses" in update and update["hypotheses"]:
                             for hypothesis in update["hypotheses"]:
-                                # 打印假设内容以便调试
-                                logger.debug(f"处理假设 {hypothesis.get('id', 'unknown')}:")
-                                logger.debug(f"  内容: {hypothesis.get('content', {})}")
+                                # 打印假设内容以便调试（参数只在DEBUG级别启用时才格式化）
+                                logger.debug("处理假设 {id}: {content}", id=hypothesis.get("id", "unknown"), content=hypothesis.get("content", {}))
                                 
                                 # 格式化假设
                                 formatted = self.format_hypothesis(hypothesis)
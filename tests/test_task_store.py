@@ -0,0 +1,159 @@
+"""三种任务后端（memory / sqlite / redis）的行为一致性测试
+
+同一个场景在每个后端上运行，比较出队次序和 status() 给出的排队位置。
+Redis 后端用 fakeredis 执行真实的 Lua 脚本，未安装 fakeredis[lua] 时跳过。
+
+    python -m pytest tests
+"""
+import pytest
+
+from src.task_queue import QueueFullError, PRIORITY_HIGH, PRIORITY_NORMAL
+from src.task_store import MemoryTaskBackend, SQLiteTaskBackend, RedisTaskBackend
+
+BACKENDS = ["memory", "sqlite", "redis"]
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request, tmp_path):
+    kwargs = {"maxsize": 100, "max_per_user": 10, "max_attempts": 2, "result_ttl": 60}
+    if request.param == "memory":
+        backend = MemoryTaskBackend(**kwargs)
+    elif request.param == "sqlite":
+        backend = SQLiteTaskBackend(str(tmp_path / "tasks.db"), **kwargs)
+    else:
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        backend = RedisTaskBackend(fakeredis.FakeRedis(), prefix="test", **kwargs)
+    yield backend
+    backend.close()
+
+
+def _task(task_id: str, user_id: str, priority: int = PRIORITY_NORMAL):
+    return {"id": task_id, "type": "research_question", "input": {}, "user_id": user_id, "priority": priority}
+
+
+def _positions(backend, task_ids):
+    return {task_id: (backend.status(task_id) or {}).get("position") for task_id in task_ids}
+
+
+def _drain(backend, owner: str = "w"):
+    """领取并完成剩余的全部任务，返回 (任务ID, 第几次尝试) 列表"""
+    order = []
+    while True:
+        task = backend.lease(owner, 60)
+        if task is None:
+            return order
+        order.append((task["id"], task["attempts"]))
+        assert backend.complete(task["id"], owner, {"status": "success"})
+
+
+def _scenario(backend):
+    """返回整个场景的轨迹，各后端应当完全一致"""
+    ids = ["a0", "a1", "a2", "b0", "b1", "h0"]
+    trace = {}
+
+    for task in [
+        _task("a0", "alice"), _task("a1", "alice"), _task("a2", "alice"),
+        _task("b0", "bob"), _task("b1", "bob"),
+        _task("h0", "carol", PRIORITY_HIGH),
+    ]:
+        backend.enqueue(task)
+    trace["enqueued"] = _positions(backend, ids)
+    trace["size"] = backend.size()
+
+    # 高优先级先出队，同一优先级内按用户轮转
+    trace["leased"] = [backend.lease("w1", 60)["id"], backend.lease("w1", 60)["id"]]
+    trace["leased_status"] = backend.status("a0")
+
+    # 失败重试：放回该用户队列的最前面
+    backend.fail("a0", "w1", "boom")
+    trace["after_requeue"] = _positions(backend, ids)
+
+    # 撤回只对排队中的任务生效
+    trace["cancel"] = [backend.cancel("a2"), backend.cancel("a2"), backend.cancel("nope"), backend.cancel("h0")]
+    trace["after_cancel"] = _positions(backend, ids)
+
+    # 租期过期：下一次领取时回收，放回该用户队列的最前面；原持有者不能再续租或提交
+    expired = backend.lease("w2", -1)
+    reclaimed = backend.lease("w3", 60)
+    trace["expired"] = [(expired["id"], expired["attempts"]), (reclaimed["id"], reclaimed["attempts"])]
+    trace["after_expiry"] = _positions(backend, ids)
+    trace["stale_owner"] = [
+        backend.extend(expired["id"], "w2", 60),
+        backend.complete(expired["id"], "w2", {"status": "success"})
+    ]
+
+    # 达到最大尝试次数后不再重试，写入错误结果
+    backend.fail(reclaimed["id"], "w3", "boom again")
+    trace["exhausted"] = [backend.status(reclaimed["id"]), backend.get_result(reclaimed["id"])]
+
+    assert backend.complete("h0", "w1", {"status": "success"})
+    trace["order"] = _drain(backend)
+    trace["size_after"] = backend.size()
+    trace["results"] = {task_id: (backend.get_result(task_id) or {}).get("status") for task_id in ids}
+    return trace
+
+
+def test_backends_agree(backend):
+    reference = _scenario(MemoryTaskBackend(maxsize=100, max_per_user=10, max_attempts=2, result_ttl=60))
+    assert _scenario(backend) == reference
+
+
+def test_scenario(backend):
+    trace = _scenario(backend)
+    assert trace["enqueued"] == {"h0": 1, "a0": 2, "b0": 3, "a1": 4, "b1": 5, "a2": 6}
+    assert trace["size"] == 6
+    assert trace["leased"] == ["h0", "a0"]
+    assert trace["leased_status"] == {"status": "processing", "attempts": 1, "owner": "w1"}
+    # a0 回到 alice 队列最前面；alice 领取 a0 时已轮转到 bob 之后
+    assert trace["after_requeue"] == {"b0": 1, "a0": 2, "b1": 3, "a1": 4, "a2": 5, "h0": None}
+    assert trace["cancel"] == [True, False, False, False]
+    assert trace["after_cancel"] == {"b0": 1, "a0": 2, "b1": 3, "a1": 4, "a2": None, "h0": None}
+    assert trace["expired"] == [("b0", 1), ("a0", 2)]
+    assert trace["after_expiry"] == {"b0": 1, "a1": 2, "b1": 3, "a0": None, "a2": None, "h0": None}
+    assert trace["stale_owner"] == [False, False]
+    assert trace["exhausted"] == [None, {"status": "error", "message": "boom again"}]
+    assert trace["order"] == [("b0", 2), ("a1", 1), ("b1", 1)]
+    assert trace["size_after"] == 0
+    assert trace["results"] == {
+        "h0": "success", "a0": "error", "a1": "success", "a2": None, "b0": "success", "b1": "success"
+    }
+
+
+def test_admission_limits(backend):
+    backend.enqueue(_task("t0", "alice"))
+    with pytest.raises(QueueFullError):
+        backend.enqueue(_task("t0", "alice"))
+    for i in range(1, backend.max_per_user):
+        backend.enqueue(_task(f"t{i}", "alice"))
+    with pytest.raises(QueueFullError):
+        backend.enqueue(_task("overflow", "alice"))
+    backend.enqueue(_task("other", "bob"))
+    assert backend.size() == backend.max_per_user + 1
+
+
+def test_clear_queued(backend):
+    for i in range(3):
+        backend.enqueue(_task(f"a{i}", "alice"))
+    backend.enqueue(_task("b0", "bob"))
+    leased = backend.lease("w", 60)
+    assert backend.clear_queued() == 3
+    assert backend.size() == 0
+    assert backend.lease("w", 60) is None
+    # 已领取的任务不受影响
+    assert backend.status(leased["id"])["status"] == "processing"
+    assert backend.complete(leased["id"], "w", {"status": "success"})
+    # 清空后可以重新提交
+    backend.enqueue(_task("a1", "alice"))
+    assert _drain(backend) == [("a1", 1)]
+
+
+def test_lease_expiry_exhausts_attempts(backend):
+    backend.enqueue(_task("a0", "alice"))
+    for attempt in range(1, backend.max_attempts + 1):
+        task = backend.lease(f"w{attempt}", -1)
+        assert (task["id"], task["attempts"]) == ("a0", attempt)
+    # 最后一次租期也过期后不再重新入队，三种后端写入相同的错误结果
+    assert backend.lease("w", 60) is None
+    assert backend.status("a0") is None
+    assert backend.get_result("a0") == {"status": "error", "message": "租期过期"}